@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import time
+from contextlib import contextmanager
+import numpy as np
+import dat_io
+import instrument
+import result_cache
+import results_io
+
+# Archive of solved runs, so that scenarios can be compared after later solves have
+# overwritten the outputs. solve.py archives every run into runs/ unless --no-archive is given.
+#   runs/<run id>.npz  the results_io arrays of the run (x, cells, periods, sources, e, y, z),
+#                      compressed
+#   runs/index.npz     one row per run in columns: run id, time, hash of the inputs, model and
+#                      data file, mode, objective, wall time, total demand, parameters and
+#                      timings (JSON), and two matrices with one column per cell or source seen
+#                      in any run: the e decisions and the peak occupancy of every cell (-1 where
+#                      a run does not have the source or cell)
+# The queries only read the index, so comparing hundreds of runs never loads their x matrices.
+# Runs can be archived by several processes at once (e.g. parallel jobs of gui.py): the index is
+# changed under the lock file runs/index.lock, and written atomically for the readers.
+
+default_archive_dir = "runs"
+index_name = "index.npz"
+lock_name = "index.lock"
+text_columns = ("run_id", "inputs_hash", "mod_file", "dat_file", "mode", "params", "timings")
+number_columns = ("created", "objective", "wall_time", "demand")
+
+
+def empty_index():
+    index = {name: np.zeros(0, dtype=str) for name in text_columns}
+    index.update({name: np.zeros(0, dtype=np.float64) for name in number_columns})
+    index["source_ids"] = np.zeros(0, dtype=np.int64)
+    index["e"] = np.zeros((0, 0), dtype=np.int8)
+    index["cell_ids"] = np.zeros(0, dtype=np.int64)
+    index["peak"] = np.zeros((0, 0), dtype=np.int32)
+    return index
+
+
+def load_index(archive_dir=default_archive_dir):
+    path = os.path.join(archive_dir, index_name)
+    if not os.path.exists(path):
+        return empty_index()
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
+
+def write_index(archive_dir, index):
+    # Written next to the index and renamed, so readers never see a partial index
+    staging = os.path.join(archive_dir, f"index.{os.getpid()}.tmp.npz")
+    np.savez(staging, **index)
+    os.replace(staging, os.path.join(archive_dir, index_name))
+
+
+# Exclusive lock on the index while it is read, changed and written, so that processes
+# archiving at the same time do not drop each other's rows. The lock file is created
+# exclusively; one older than stale_after seconds was left by a process that died.
+@contextmanager
+def index_lock(archive_dir, timeout=60, stale_after=300):
+    path = os.path.join(archive_dir, lock_name)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale_after:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue  # Released in the meantime
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"The archive index is still locked by {path}")
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        os.remove(path)
+
+
+# Values of one run spread over the ids of the index, with new ids appended as columns
+def widen(ids, matrix, run_ids, run_values):
+    new_ids = np.setdiff1d(run_ids, ids)
+    if len(new_ids):
+        ids = np.concatenate([ids, new_ids])
+        matrix = np.pad(matrix, ((0, 0), (0, len(new_ids))), constant_values=-1)
+    row = np.full(len(ids), -1, dtype=matrix.dtype)
+    order = np.argsort(ids)
+    row[order[np.searchsorted(ids, run_ids, sorter=order)]] = run_values
+    return ids, np.vstack([matrix, row[None, :]])
+
+
+def row_of(index, run_id):
+    rows = np.flatnonzero(index["run_id"] == run_id)
+    if not len(rows):
+        raise KeyError(f"Run {run_id} is not in the archive")
+    return int(rows[0])
+
+
+def inputs_hash(mod_file, dat_file, params=None):
+    return result_cache.cache_key(mod_file, dat_file, params)
+
+
+# Id of the latest archived run of the same inputs and mode, or None
+def archived_run(mod_file, dat_file, params=None, mode="mip", archive_dir=default_archive_dir):
+    index = load_index(archive_dir)
+    rows = select(index, inputs_hash=inputs_hash(mod_file, dat_file, params), mode=mode)
+    return str(index["run_id"][rows[-1]]) if len(rows) else None
+
+
+# Archive the results in output_dir (see results_io.py) and return the run id.
+# params are the solver settings and labels of the run, summary is the summary of solve.py.
+@instrument.span("archive.add")
+def archive_run(output_dir, mod_file, dat_file, summary, params=None, mode="mip", archive_dir=default_archive_dir):
+    os.makedirs(archive_dir, exist_ok=True)
+    run_hash = inputs_hash(mod_file, dat_file, params)
+    created = time.time()
+    results = results_io.load_results(output_dir, mmap=False)
+    arrays = {name: results[name] for name in results_io.array_dtypes}
+    with index_lock(archive_dir):
+        index = load_index(archive_dir)
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(created))}-{run_hash[:8]}"
+        suffix = 1
+        while run_id in index["run_id"]:
+            suffix += 1
+            run_id = f"{run_id.rsplit('.', 1)[0]}.{suffix}"
+        np.savez_compressed(os.path.join(archive_dir, f"{run_id}.npz"), **arrays)
+        add_row(index, run_id, run_hash, created, arrays, mod_file, dat_file, summary, params, mode)
+        write_index(archive_dir, index)
+    return run_id
+
+
+# Append the row of a run to the index in place
+def add_row(index, run_id, run_hash, created, arrays, mod_file, dat_file, summary, params, mode):
+    objective = summary.get("objective") if summary else None
+    timings = {key: summary[key] for key in ("wall_time", "lp_time", "phases", "first_incumbent_time")
+               if summary and summary.get(key) is not None}
+    row = {
+        "run_id": run_id,
+        "inputs_hash": run_hash,
+        "mod_file": os.path.abspath(mod_file),
+        "dat_file": os.path.abspath(dat_file),
+        "mode": mode,
+        "params": json.dumps(params or {}, sort_keys=True),
+        "timings": json.dumps(timings, sort_keys=True),
+        "created": created,
+        "objective": np.nan if objective is None else objective,
+        "wall_time": timings.get("wall_time", np.nan),
+        "demand": float(np.sum(dat_io.load_dat(dat_file)["D"])),
+    }
+    for name, value in row.items():
+        index[name] = np.append(index[name], value)
+    x = np.asarray(arrays["x"])
+    peak = x.max(axis=1) if x.size else np.zeros(len(x), dtype=np.int32)
+    cells = np.asarray(arrays["cells"]) if len(arrays["cells"]) == len(x) else np.arange(1, len(x) + 1)
+    index["source_ids"], index["e"] = widen(index["source_ids"], index["e"], arrays["sources"], arrays["e"])
+    index["cell_ids"], index["peak"] = widen(index["cell_ids"], index["peak"], cells, peak)
+
+
+# Arrays of an archived run, in the same form as results_io.load_results
+def load_run(run_id, archive_dir=default_archive_dir):
+    index = load_index(archive_dir)
+    row = row_of(index, run_id)
+    with np.load(os.path.join(archive_dir, f"{run_id}.npz")) as f:
+        results = {name: f[name] for name in f.files}
+    results["manifest"] = {"format": 1, "objective": None if np.isnan(index["objective"][row])
+                           else float(index["objective"][row])}
+    return results
+
+
+# Write an archived run back into a results directory, e.g. to visualize or render it
+def export_run(run_id, directory, archive_dir=default_archive_dir):
+    os.makedirs(directory, exist_ok=True)
+    results = load_run(run_id, archive_dir)
+    return results_io.write_results(directory, results, results["manifest"]["objective"])
+
+
+def remove_run(run_id, archive_dir=default_archive_dir):
+    with index_lock(archive_dir):
+        index = load_index(archive_dir)
+        keep = index["run_id"] != run_id
+        for name, values in index.items():
+            if name not in ("source_ids", "cell_ids"):
+                index[name] = values[keep]
+        write_index(archive_dir, index)
+    path = os.path.join(archive_dir, f"{run_id}.npz")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# Rows of the runs whose columns equal the given values, e.g. mode="fast" or dat_file=...
+def select(index, **equal):
+    mask = np.ones(len(index["run_id"]), dtype=bool)
+    for name, value in equal.items():
+        if name == "dat_file":
+            value = os.path.abspath(value)
+        mask &= index[name] == value
+    return np.flatnonzero(mask)
+
+
+# Sources whose decision differs from the base run, for the given rows (default: all runs).
+# Returns the source ids and a (rows, sources) matrix of -1 (evacuated in base, sheltered in
+# the run), 1 (the other way round) and 0 (same decision, or the source is missing in a run).
+def flipped_sources(index, base, rows=None):
+    rows = np.arange(len(index["run_id"])) if rows is None else np.asarray(rows)
+    e = index["e"].astype(np.int8)
+    base_e = e[row_of(index, base)]
+    present = (e[rows] >= 0) & (base_e >= 0)
+    return index["source_ids"], np.where(present, e[rows] - base_e, 0)
+
+
+# Peak occupancy of every cell in the given rows minus that of the base run
+def peak_delta(index, base, rows=None):
+    rows = np.arange(len(index["run_id"])) if rows is None else np.asarray(rows)
+    peak = index["peak"].astype(np.int64)
+    base_peak = peak[row_of(index, base)]
+    present = (peak[rows] >= 0) & (base_peak >= 0)
+    return index["cell_ids"], np.where(present, peak[rows] - base_peak, 0)
+
+
+# Number of runs and the mean, min and max objective at each total demand, over the given rows
+def objective_by_demand(index, rows=None):
+    rows = np.arange(len(index["run_id"])) if rows is None else np.asarray(rows)
+    objective = index["objective"][rows]
+    solved = ~np.isnan(objective)
+    demand, group = np.unique(index["demand"][rows][solved], return_inverse=True)
+    objective = objective[solved]
+    counts = np.bincount(group, minlength=len(demand))
+    mean = np.bincount(group, weights=objective, minlength=len(demand)) / np.maximum(counts, 1)
+    low = np.full(len(demand), np.inf)
+    high = np.full(len(demand), -np.inf)
+    np.minimum.at(low, group, objective)
+    np.maximum.at(high, group, objective)
+    return {"demand": demand, "runs": counts, "mean": mean, "min": low, "max": high}
+
+
+def print_table(columns, rows):
+    widths = [max(len(column), *(len(str(row[k])) for row in rows)) if rows else len(column)
+              for k, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(value).ljust(width) for value, width in zip(row, widths)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List, compare and export the runs archived by solve.py.")
+    parser.add_argument("--archive-dir", default=default_archive_dir)
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("list", help="List the archived runs.")
+    listing.add_argument("--dat", help="Only the runs of this .dat file.")
+    listing.add_argument("--mode", help="Only the runs of this mode (mip, fast, rolling).")
+    diff = commands.add_parser("diff", help="Flipped sources and peak occupancy changes between two runs.")
+    diff.add_argument("base")
+    diff.add_argument("other")
+    diff.add_argument("--top", type=int, default=10, help="Number of cells with the largest change to list.")
+    flips = commands.add_parser("flips", help="Number of flipped sources of every run against a base run.")
+    flips.add_argument("base")
+    commands.add_parser("demand", help="Objective against the total demand of the runs.")
+    export = commands.add_parser("export", help="Write an archived run into a results directory.")
+    export.add_argument("run_id")
+    export.add_argument("directory")
+    remove = commands.add_parser("remove", help="Remove a run from the archive.")
+    remove.add_argument("run_id")
+    args = parser.parse_args()
+
+    index = load_index(args.archive_dir)
+    if args.command == "list":
+        equal = {name: value for name, value in (("dat_file", args.dat), ("mode", args.mode)) if value}
+        rows = select(index, **equal)
+        print_table(["run_id", "mode", "objective", "wall_time", "demand", "dat_file"],
+                    [(index["run_id"][k], index["mode"][k], f"{index['objective'][k]:.4f}",
+                      f"{index['wall_time'][k]:.2f}", f"{index['demand'][k]:g}",
+                      os.path.basename(index["dat_file"][k])) for k in rows])
+    elif args.command == "diff":
+        other = [row_of(index, args.other)]
+        sources, flipped = flipped_sources(index, args.base, other)
+        print(f"Objective: {index['objective'][row_of(index, args.base)]:.4f} -> "
+              f"{index['objective'][other[0]]:.4f}")
+        print(f"Sheltered instead of evacuated: {sources[flipped[0] < 0].tolist()}")
+        print(f"Evacuated instead of sheltered: {sources[flipped[0] > 0].tolist()}")
+        cells, delta = peak_delta(index, args.base, other)
+        order = np.argsort(-np.abs(delta[0]), kind="stable")[:args.top]
+        print_table(["cell", "peak_delta"], [(int(cells[k]), int(delta[0][k])) for k in order if delta[0][k]])
+    elif args.command == "flips":
+        sources, flipped = flipped_sources(index, args.base)
+        print_table(["run_id", "flipped", "objective"],
+                    [(run_id, int(n), f"{objective:.4f}") for run_id, n, objective
+                     in zip(index["run_id"], np.count_nonzero(flipped, axis=1), index["objective"])])
+    elif args.command == "demand":
+        table = objective_by_demand(index)
+        print_table(["demand", "runs", "mean", "min", "max"],
+                    [(f"{d:g}", int(n), f"{mean:.4f}", f"{low:.4f}", f"{high:.4f}")
+                     for d, n, mean, low, high in zip(*(table[name] for name in table))])
+    elif args.command == "export":
+        export_run(args.run_id, args.directory, args.archive_dir)
+        print(f"Run {args.run_id} written to {args.directory}")
+    elif args.command == "remove":
+        remove_run(args.run_id, args.archive_dir)
+        print(f"Run {args.run_id} removed")
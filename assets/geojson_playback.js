@@ -0,0 +1,44 @@
+// Styling of the single GeoJSON layer drawn by `python visualize.py --geojson`.
+// The server only sends {counts: [...], max: ...} for the current time step through the
+// layer's hideout; each cell feature looks up its count by its "index" property.
+window.jesdraPlayback = {
+    counts: [],
+
+    // Same colours as playback.color_components
+    color: function (count, maxCount, evacuated) {
+        if (!evacuated) {
+            return "rgb(0,0,0)";  // Black for no evacuation order
+        }
+        const normalized = maxCount > 0 ? count / maxCount : 0;
+        const r = Math.trunc(255 * normalized);
+        const g = Math.trunc(255 * (1 - normalized) * normalized * 4);
+        const b = Math.trunc(255 * (1 - normalized));
+        return `rgb(${r},${g},${b})`;
+    },
+
+    style: function (feature, context) {
+        if (feature.properties.kind === "arc") {
+            return {color: "gray", weight: 1, opacity: 0.5};
+        }
+        const hideout = context.hideout;
+        // Kept for the tooltips, which are evaluated when they open
+        window.jesdraPlayback.counts = hideout.counts;
+        const count = hideout.counts[feature.properties.index];
+        const color = window.jesdraPlayback.color(count, hideout.max, feature.properties.evacuated);
+        return {color: color, fill: true, fillOpacity: 0.7};
+    },
+
+    pointToLayer: function (feature, latlng) {
+        return L.circleMarker(latlng, {radius: feature.properties.radius});
+    },
+
+    onEachFeature: function (feature, layer) {
+        if (feature.properties.kind !== "cell") {
+            return;
+        }
+        layer.bindTooltip(function () {
+            const count = window.jesdraPlayback.counts[feature.properties.index];
+            return `${feature.properties.label} Vehicles: ${count}`;
+        });
+    }
+};
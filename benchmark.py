@@ -0,0 +1,444 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+import calculate_risk
+import dat_io
+import generate_network
+import playback
+import presolve
+import results_io
+import simulate
+import solve
+
+# Benchmarks for the data pipeline and the model.
+#
+# generation: time oplrun spends generating the model (between the "<<< generate" and
+# "<<< solve" phase markers) for one or more .mod files on each .dat file. oplrun is
+# stopped as soon as the solve starts.
+# conflicts: size of the resource conflict block (Expression 12) when it is generated over
+# every (n, p, t1, t2) combination compared to the precomputed conflict keys, and the time
+# presolve.py takes to compute the keys.
+# warm-start: time to the first incumbent and to the end of the solve, with and without the
+# MIP start of warm_start.py.
+# rolling: objective and runtime of the rolling-horizon solve against the solve of the whole horizon.
+# fast: objective, bound and runtime of the fast mode of solve.py (LP relaxation and rounding,
+# optionally polished) against the full solve.
+# suite: time every stage of the pipeline on a ladder of networks from generate_network.py
+# (network, risk, tau, presolve, .dat writing, oplrun model generation and solve, output
+# parsing and the first frame of the visualization), and append the times to a JSON history
+# file, comparing them with the previous entry.
+
+
+# Copy of dat_file without the blocks that mod_file does not declare, so older
+# versions of the model can be run on .dat files with newer derived blocks
+def data_for_model(mod_file, dat_file, directory):
+    with open(mod_file, "r") as f:
+        declared = dat_io.declared_data(f.read())
+    with open(dat_file, "r") as f:
+        text = f.read()
+    for name in dat_io.parse_dat(text):
+        if name not in declared:
+            text = dat_io.remove_block(text, name)
+    path = os.path.join(directory, os.path.basename(dat_file))
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+
+def generation_time(opl_executable, mod_file, dat_file):
+    directory = tempfile.mkdtemp()
+    try:
+        dat_path = data_for_model(mod_file, dat_file, directory)
+        summary = solve.run_opl_and_generate_csv(
+            opl_executable, os.path.abspath(mod_file), dat_path, directory,
+            metrics_callback=lambda record: record.get("phase") == "solve", cwd=directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    phases = summary["phases"] if summary else {}
+    if "generate" not in phases or "solve" not in phases:
+        return None
+    return round(phases["solve"] - phases["generate"], 3)
+
+
+def benchmark_generation(opl_executable, mod_files, dat_files, repeat=1):
+    results = []
+    for dat_file in dat_files:
+        for mod_file in mod_files:
+            times = [generation_time(opl_executable, mod_file, dat_file) for _ in range(repeat)]
+            times = [t for t in times if t is not None]
+            results.append({
+                "dat": os.path.basename(dat_file),
+                "mod": os.path.basename(mod_file),
+                "generation_time": min(times) if times else None,
+            })
+    return results
+
+
+def benchmark_warm_start(opl_executable, mod_file, dat_files, stop_gap=None):
+    results = []
+    for dat_file in dat_files:
+        for warm_start in (False, True):
+            directory = tempfile.mkdtemp()
+            try:
+                dat_path = data_for_model(mod_file, dat_file, directory)
+                summary = solve.run_opl_and_generate_csv(
+                    opl_executable, os.path.abspath(mod_file), dat_path, directory, stop_gap=stop_gap,
+                    cwd=directory, warm_start=warm_start) or {}
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+            results.append({
+                "dat": os.path.basename(dat_file),
+                "warm_start": bool(summary.get("warm_start")),
+                "start_objective": summary.get("start_objective"),
+                "first_incumbent_time": summary.get("first_incumbent_time"),
+                "objective": summary.get("objective"),
+                "wall_time": summary.get("wall_time"),
+            })
+    return results
+
+
+def benchmark_rolling(opl_executable, mod_file, dat_files, window, step, stop_gap=None):
+    results = []
+    for dat_file in dat_files:
+        directory = tempfile.mkdtemp()
+        try:
+            dat_path = data_for_model(mod_file, dat_file, directory)
+            full = solve.run_opl_and_generate_csv(opl_executable, os.path.abspath(mod_file), dat_path,
+                                                  directory, stop_gap=stop_gap, cwd=directory) or {}
+            rolling_dir = os.path.join(directory, "rolling")
+            os.makedirs(rolling_dir)
+            rolling = solve.run_rolling(opl_executable, dat_file, rolling_dir, window, step,
+                                        stop_gap=stop_gap) or {}
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        loss = None
+        if full.get("objective") and rolling.get("objective") is not None:
+            loss = round((rolling["objective"] - full["objective"]) / abs(full["objective"]), 4)
+        results.append({
+            "dat": os.path.basename(dat_file),
+            "objective": full.get("objective"),
+            "rolling_objective": rolling.get("objective"),
+            "loss": loss,
+            "time": full.get("wall_time"),
+            "rolling_time": rolling.get("wall_time"),
+            "windows": rolling.get("windows"),
+        })
+    return results
+
+
+def benchmark_fast(opl_executable, mod_file, dat_files, polish=None, stop_gap=None):
+    results = []
+    for dat_file in dat_files:
+        directory = tempfile.mkdtemp()
+        try:
+            dat_path = data_for_model(mod_file, dat_file, directory)
+            full = solve.run_opl_and_generate_csv(opl_executable, os.path.abspath(mod_file), dat_path,
+                                                  directory, stop_gap=stop_gap, cwd=directory) or {}
+            fast_dir = os.path.join(directory, "fast")
+            fast = solve.run_fast(opl_executable, mod_file, dat_path, fast_dir, polish) or {}
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        loss = None
+        if full.get("objective") and fast.get("objective") is not None:
+            loss = round((fast["objective"] - full["objective"]) / abs(full["objective"]), 4)
+        results.append({
+            "dat": os.path.basename(dat_file),
+            "objective": full.get("objective"),
+            "fast_objective": fast.get("objective"),
+            "lp_bound": fast.get("bound"),
+            "fast_gap": fast.get("gap"),
+            "loss": loss,
+            "time": full.get("wall_time"),
+            "fast_time": fast.get("wall_time"),
+        })
+    return results
+
+
+def benchmark_conflicts(dat_files):
+    results = []
+    for dat_file in dat_files:
+        data = dat_io.load_dat(dat_file)
+        periods = len(data["T"])
+        vp_count = len(data["Vp"])
+        tau_max = np.asarray(data["tau_max"])
+
+        start = time.perf_counter()
+        keys, nodes = presolve.resource_conflicts(data["Vp"], data["P"], data["tau"], tau_max, periods - 1)
+        elapsed = time.perf_counter() - start
+
+        # Every (n, p, t1, t2) with t2 - t1 <= tau_max[p][n] was a constraint, and each one scanned Vp
+        offsets = np.arange(periods)[:, None] - np.arange(periods)[None, :]
+        full_constraints = int(sum((offsets <= limit).sum() for limit in tau_max.ravel()))
+        # Each key gives one constraint per t1 with t1 + d in T
+        repeats = periods - keys[:, 2] if len(keys) else np.zeros(0, dtype=np.int64)
+        sizes = np.array([len(values) for values in nodes])
+        results.append({
+            "dat": os.path.basename(dat_file),
+            "combinations_before": len(data["P"]) * vp_count * periods * periods * vp_count,
+            "constraints_before": full_constraints,
+            "constraints_after": int(repeats.sum()),
+            "nonzeros_after": int(((1 + sizes) * repeats).sum()),
+            "keys": len(keys),
+            "presolve_time": round(elapsed, 4),
+        })
+    return results
+
+
+# oplrun output for a simulated plan, with the sections that jesdra.mod prints
+def simulated_output(model, e, result):
+    arrays = model.results_arrays(e, result)
+    lines = ["<<< solve", f"OBJECTIVE: {result['objective'][0]}", "<<< post process", "evac.csv:"]
+    lines += [f"{i},{value}" for i, value in zip(arrays["sources"].tolist(), arrays["e"].tolist())]
+    lines.append("vehicles.csv:")
+    lines += [",".join(map(str, row)) for row in arrays["x"].tolist()]
+    lines += ["cells:", ",".join(map(str, arrays["cells"].tolist()))]
+    lines += ["periods:", ",".join(map(str, arrays["periods"].tolist()))]
+    lines.append("flows.coo:")
+    lines += [",".join(map(str, row)) for row in arrays["y"].tolist()]
+    lines += ["allocations.coo:", "<<< done"]
+    return "\n".join(lines)
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    return value, round(time.perf_counter() - start, 4)
+
+
+# Times of every pipeline stage for one generated network. oplrun is only run when
+# opl_executable is given.
+def benchmark_pipeline(size, periods, options, opl_executable=None, mod_file="jesdra.mod", stop_gap=None):
+    rows, cols = size
+    row = {"size": f"{rows}x{cols}", "periods": periods}
+    directory = tempfile.mkdtemp()
+    try:
+        network, row["network"] = timed(generate_network.generate_network, options["layout"], rows, cols,
+                                        options["cells_per_link"], min(options["sources"], rows * max(1, cols // 2)),
+                                        min(options["sinks"], rows), options["seed"], max_vp=options["max_vp"])
+        row.update(cells=len(network["I"]), arcs=len(network["A"]), vp=len(network["Vp"]))
+        info = generate_network.network_info(network, periods)
+        risk, row["risk"] = timed(calculate_risk.risk_matrix, info, periods)
+        (tau, tau_max), row["tau"] = timed(generate_network.network_tau, network, options["speeds"])
+        data = generate_network.network_data(network, tau, tau_max, periods)
+        derived, row["presolve"] = timed(presolve.presolve_blocks, data)
+
+        def write():
+            blocks = generate_network.dat_blocks(network, data, risk)
+            blocks.update(derived)
+            generate_network.write_network(dat_file, json_file, blocks, info)
+
+        dat_file = os.path.join(directory, "network.dat")
+        json_file = os.path.join(directory, "network_info.json")
+        _, row["dat_write"] = timed(write)
+
+        if opl_executable:
+            solve_dir = os.path.join(directory, "solve")
+            os.makedirs(solve_dir)
+            summary = solve.run_opl_and_generate_csv(opl_executable, os.path.abspath(mod_file), dat_file, solve_dir,
+                                                     stop_gap=stop_gap, cwd=solve_dir) or {}
+            phases = summary.get("phases", {})
+            if "generate" in phases and "solve" in phases:
+                row["opl_generate"] = round(phases["solve"] - phases["generate"], 3)
+            if "solve" in phases:
+                row["opl_solve"] = round(phases.get("post process", summary["wall_time"]) - phases["solve"], 3)
+
+        # Output parsing and the first frame are timed on a simulated plan that evacuates every source
+        loaded = dat_io.load_dat(dat_file, use_cache=False)
+        model = simulate.CellTransmissionModel(loaded)
+        e = np.ones(len(model.sources), dtype=np.int64)
+        output = simulated_output(model, e, model.run(e, keep_history=True))
+        parse_dir = os.path.join(directory, "parse")
+        os.makedirs(parse_dir)
+
+        def parse():
+            parser = solve.OplOutputParser(parse_dir)
+            for line in output.splitlines():
+                parser.feed(line)
+            parser.close()
+
+        _, row["parse"] = timed(parse)
+
+        def first_frame():
+            results = results_io.load_results(parse_dir)
+            orders = dict(zip(results["sources"].tolist(), results["e"].tolist()))
+            frames = playback.Playback(results["x"], [orders.get(cell, 1) != 0 for cell in results["cells"].tolist()])
+            return frames.colors[frames.changed_cells(None, 0), 0]
+
+        _, row["first_frame"] = timed(first_frame)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return row
+
+
+suite_stages = ["network", "risk", "tau", "presolve", "dat_write", "opl_generate", "opl_solve", "parse", "first_frame"]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# Stages that took more than tolerance times longer than in the previous entry of the history
+def regressions(previous, results, tolerance=1.5, minimum=0.01):
+    before = {(row["size"], row["periods"]): row for row in previous["results"]}
+    found = []
+    for row in results:
+        old = before.get((row["size"], row["periods"]))
+        if not old:
+            continue
+        for stage in suite_stages:
+            if row.get(stage) is not None and old.get(stage) is not None and \
+                    row[stage] > max(old[stage] * tolerance, minimum):
+                found.append(f"{row['size']} {stage}: {old[stage]}s -> {row[stage]}s")
+    return found
+
+
+# Append the results to the history file and return the previous entry
+def append_history(history_file, results, options):
+    history = []
+    if os.path.exists(history_file):
+        with open(history_file, "r") as f:
+            history = json.load(f)
+    history.append({
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "options": options,
+        "results": results,
+    })
+    with open(history_file, "w") as f:
+        json.dump(history, f, indent=2)
+    return history[-2] if len(history) > 1 else None
+
+
+def print_table(results, columns):
+    widths = {column: max(len(column), *(len(str(row.get(column))) for row in results)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in results:
+        print("  ".join(str(row.get(column)).ljust(widths[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the data pipeline and the model.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generation = subparsers.add_parser("generation", help="Time the model generation in oplrun.")
+    generation.add_argument("dat_files", nargs="+")
+    generation.add_argument("--mod", nargs="+", default=["jesdra.mod"],
+                            help="Model files to compare, e.g. an older version of jesdra.mod and the current one.")
+    generation.add_argument("--oplrun", default=os.environ.get("OPLRUN", ""),
+                            help="Path to the oplrun executable (default: $OPLRUN).")
+    generation.add_argument("--repeat", type=int, default=1, help="Number of runs per pair, the fastest one is reported.")
+    generation.add_argument("--output", help="Also write the results to this JSON file.")
+
+    conflicts = subparsers.add_parser("conflicts", help="Report the size of the resource conflict block.")
+    conflicts.add_argument("dat_files", nargs="+")
+    conflicts.add_argument("--output", help="Also write the results to this JSON file.")
+
+    warm_start = subparsers.add_parser("warm-start", help="Compare the solve with and without a MIP start.")
+    warm_start.add_argument("dat_files", nargs="+")
+    warm_start.add_argument("--mod", default="jesdra.mod")
+    warm_start.add_argument("--oplrun", default=os.environ.get("OPLRUN", ""),
+                            help="Path to the oplrun executable (default: $OPLRUN).")
+    warm_start.add_argument("--stop-gap", type=float, help="Stop each solve once the relative gap is at most this value.")
+    warm_start.add_argument("--output", help="Also write the results to this JSON file.")
+
+    rolling = subparsers.add_parser("rolling", help="Compare the rolling-horizon solve with the full solve.")
+    rolling.add_argument("dat_files", nargs="+")
+    rolling.add_argument("--mod", default="jesdra.mod")
+    rolling.add_argument("--oplrun", default=os.environ.get("OPLRUN", ""),
+                         help="Path to the oplrun executable (default: $OPLRUN).")
+    rolling.add_argument("--window", type=int, default=20, help="Periods per window.")
+    rolling.add_argument("--step", type=int, help="Periods between the starts of two windows (default: half the window).")
+    rolling.add_argument("--stop-gap", type=float, help="Stop each solve once the relative gap is at most this value.")
+    rolling.add_argument("--output", help="Also write the results to this JSON file.")
+
+    fast = subparsers.add_parser("fast", help="Compare the fast mode of solve.py with the full solve.")
+    fast.add_argument("dat_files", nargs="+")
+    fast.add_argument("--mod", default="jesdra.mod")
+    fast.add_argument("--oplrun", default=os.environ.get("OPLRUN", ""),
+                      help="Path to the oplrun executable (default: $OPLRUN).")
+    fast.add_argument("--polish", type=float, metavar="SECONDS", help="Polish the rounded plan for this long.")
+    fast.add_argument("--stop-gap", type=float, help="Stop the full solve once the relative gap is at most this value.")
+    fast.add_argument("--output", help="Also write the results to this JSON file.")
+
+    suite = subparsers.add_parser("suite", help="Time every pipeline stage on a ladder of generated networks.")
+    suite.add_argument("--sizes", default="4x4,8x8,16x16,32x32",
+                       help="Comma-separated grid sizes (rows x columns of intersections).")
+    suite.add_argument("--periods", type=int, default=40)
+    suite.add_argument("--layout", choices=["grid", "random-planar"], default="grid")
+    suite.add_argument("--cells-per-link", type=int, default=2)
+    suite.add_argument("--sources", type=int, default=4)
+    suite.add_argument("--sinks", type=int, default=4)
+    suite.add_argument("--speeds", default="1,1")
+    suite.add_argument("--max-vp", type=int, help="Largest Vp of each network (default: every intersection).")
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--oplrun", default=os.environ.get("OPLRUN", ""),
+                       help="Path to the oplrun executable (default: $OPLRUN). Without it, oplrun is not timed.")
+    suite.add_argument("--mod", default="jesdra.mod")
+    suite.add_argument("--stop-gap", type=float, help="Stop each solve once the relative gap is at most this value.")
+    suite.add_argument("--history", default="benchmark_history.json",
+                       help="JSON file the results are appended to (default: benchmark_history.json).")
+    suite.add_argument("--tolerance", type=float, default=1.5,
+                       help="Report stages that are this many times slower than in the previous entry.")
+    suite.add_argument("--output", help="Also write the results to this JSON file.")
+
+    args = parser.parse_args()
+
+    if args.command == "suite":
+        options = {
+            "layout": args.layout,
+            "cells_per_link": args.cells_per_link,
+            "sources": args.sources,
+            "sinks": args.sinks,
+            "speeds": [float(speed) for speed in args.speeds.split(",")],
+            "seed": args.seed,
+            "max_vp": args.max_vp,
+        }
+        sizes = [tuple(int(n) for n in size.split("x")) for size in args.sizes.split(",")]
+        results = [benchmark_pipeline(size, args.periods, options, args.oplrun or None, args.mod, args.stop_gap)
+                   for size in sizes]
+        print_table(results, ["size", "cells", "arcs", "vp", *suite_stages])
+        previous = append_history(args.history, results, options)
+        if previous:
+            found = regressions(previous, results, args.tolerance)
+            print(f"Compared with {previous['date']} ({previous['commit']}):",
+                  "; ".join(found) if found else "no regressions")
+    elif args.command == "generation":
+        if not args.oplrun:
+            parser.error("Give the path to oplrun with --oplrun or $OPLRUN")
+        results = benchmark_generation(args.oplrun, args.mod, args.dat_files, args.repeat)
+        print_table(results, ["dat", "mod", "generation_time"])
+    elif args.command == "warm-start":
+        if not args.oplrun:
+            parser.error("Give the path to oplrun with --oplrun or $OPLRUN")
+        results = benchmark_warm_start(args.oplrun, args.mod, args.dat_files, args.stop_gap)
+        print_table(results, ["dat", "warm_start", "start_objective", "first_incumbent_time", "objective", "wall_time"])
+    elif args.command == "rolling":
+        if not args.oplrun:
+            parser.error("Give the path to oplrun with --oplrun or $OPLRUN")
+        results = benchmark_rolling(args.oplrun, args.mod, args.dat_files, args.window,
+                                    args.step or max(1, args.window // 2), args.stop_gap)
+        print_table(results, ["dat", "objective", "rolling_objective", "loss", "time", "rolling_time", "windows"])
+    elif args.command == "fast":
+        if not args.oplrun:
+            parser.error("Give the path to oplrun with --oplrun or $OPLRUN")
+        results = benchmark_fast(args.oplrun, args.mod, args.dat_files, args.polish, args.stop_gap)
+        print_table(results, ["dat", "objective", "fast_objective", "lp_bound", "fast_gap", "loss", "time",
+                              "fast_time"])
+    elif args.command == "conflicts":
+        results = benchmark_conflicts(args.dat_files)
+        print_table(results, ["dat", "combinations_before", "constraints_before", "constraints_after",
+                              "nonzeros_after", "keys", "presolve_time"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -1,76 +1,212 @@
-import math
-import numpy as np
+import argparse
 import json
+import numpy as np
+import dat_io
+import instrument
 
-# Enter the path of the JSON file here
-json_path = 'toy_info.json'
-
-# Load data from JSON file
-with open(json_path, 'r') as f:
-    data = json.load(f)
+# Headings in degrees (0 is +x, counterclockwise) of the axis-aligned directions used in the info JSON files
+direction_headings = {'+x': 0.0, '+y': 90.0, '-x': 180.0, '-y': 270.0}
 
-# Extract necessary data
-cells = data['cells']
-disaster = data['disaster']
-settings = data['setting']
 
-# Settings
-unit_length = settings['unit_length_in_meters']
-time_step_length = settings['time_step_length_in_secs']
-n_time_steps = settings['n_time_steps']
-disaster_speed = disaster['velocity_in_kmh'] * 1000 / 3600  # convert to m/s
-direction = disaster['direction']
-disaster_radius = disaster['radius_in_meters']
+def load_info(json_path):
+    with open(json_path, 'r') as f:
+        return json.load(f)
 
-# Initial disaster position
-disaster_x = disaster['x_coord'] * unit_length
-disaster_y = disaster['y_coord'] * unit_length
 
 def calculate_risk(distance, radius):
-    if distance > radius:
-        return 0  # No risk outside the radius
-    return 1 - (distance / radius) ** 2  # Scale risk between 0 and 1
-
-# Prepare the output array
-n_cells = len(cells)
-risk_matrix = np.zeros((n_cells, n_time_steps))
-
-# Calculate risk values for each time step
-for t in range(n_time_steps):
-    for i, cell in enumerate(cells):
-        cell_x = cell['x_coord'] * unit_length
-        cell_y = cell['y_coord'] * unit_length
-
-        if cell['type'] == 'shelter':
-            risk_matrix[i][t] = 0  # Shelters always have risk 0
-        else:
-            # Calculate Euclidean distance
-            distance = math.sqrt((cell_x - disaster_x) ** 2 + (cell_y - disaster_y) ** 2)
-            risk_matrix[i][t] = calculate_risk(distance, disaster_radius)
-
-    # Update disaster position
-    if direction == '+x':
-        disaster_x += disaster_speed * time_step_length
-    elif direction == '-x':
-        disaster_x -= disaster_speed * time_step_length
-    elif direction == '+y':
-        disaster_y += disaster_speed * time_step_length
-    elif direction == '-y':
-        disaster_y -= disaster_speed * time_step_length
-
-# Output the risk matrix
-print("Risk matrix (c[i][t]):")
-print(risk_matrix)
-
-# Optionally save to a file in array format
-output_file = 'risk_matrix.txt'
-with open(output_file, 'w') as f:
-    f.write('[')
-    for i, row in enumerate(risk_matrix):
-        f.write('[' + ', '.join(f'{val:.4f}' for val in row) + ']')
-        if i < len(risk_matrix) - 1:
-            f.write(',\n')
-    f.write(']')
-
-print(f"Risk matrix saved to {output_file}")
+    # Works on scalars as well as whole distance matrices
+    distance = np.asarray(distance, dtype=float)
+    # No risk outside the radius, otherwise scale risk between 0 and 1
+    return np.where(distance > radius, 0.0, 1 - (distance / radius) ** 2)
+
+
+# Positions of the disaster center (in meters) at each time step, as an array of shape (n_time_steps, 2).
+# The trajectory is taken from the disaster entry of the info JSON, in this order of precedence:
+#   "trajectory": [[x, y], ...]  polyline of waypoints (in units) followed from (x_coord, y_coord)
+#   "heading_in_degrees": angle  straight line, 0 is +x and angles grow counterclockwise
+#   "direction": "+x" | "-x" | "+y" | "-y"
+def disaster_positions(disaster, settings, n_time_steps=None):
+    unit_length = settings['unit_length_in_meters']
+    time_step_length = settings['time_step_length_in_secs']
+    if n_time_steps is None:
+        n_time_steps = settings['n_time_steps']
+    disaster_speed = disaster['velocity_in_kmh'] * 1000 / 3600  # convert to m/s
+
+    start = np.array([disaster['x_coord'], disaster['y_coord']], dtype=float) * unit_length
+    # Distance traveled by the disaster at the start of each time step
+    traveled = disaster_speed * time_step_length * np.arange(n_time_steps)
+
+    if disaster.get('trajectory'):
+        waypoints = np.vstack([start, np.asarray(disaster['trajectory'], dtype=float) * unit_length])
+        segment_lengths = np.hypot(*np.diff(waypoints, axis=0).T)
+        cumulative = np.concatenate([[0.0], np.cumsum(segment_lengths)])
+        # The disaster stops at the last waypoint
+        x = np.interp(traveled, cumulative, waypoints[:, 0])
+        y = np.interp(traveled, cumulative, waypoints[:, 1])
+        return np.column_stack([x, y])
+
+    if 'heading_in_degrees' in disaster:
+        heading = disaster['heading_in_degrees']
+    else:
+        heading = direction_headings[disaster['direction']]
+    angle = np.radians(heading)
+    step = np.array([np.cos(angle), np.sin(angle)])
+    # Snap the axis-aligned directions exactly onto the axis
+    step[np.abs(step) < 1e-12] = 0.0
+    return start + traveled[:, None] * step
+
+
+# Coordinates of the cells in meters, as an array of shape (n_cells, 2)
+def cell_positions(cells, settings):
+    unit_length = settings['unit_length_in_meters']
+    return np.array([[cell['x_coord'], cell['y_coord']] for cell in cells], dtype=float) * unit_length
+
+
+# Risk values for every cell at every time step (c[i][t]) in a single broadcast pass
+@instrument.span("risk.matrix")
+def risk_matrix(data, n_time_steps=None):
+    cells = data['cells']
+    disaster = data['disaster']
+    settings = data['setting']
+
+    positions = disaster_positions(disaster, settings, n_time_steps)
+    coords = cell_positions(cells, settings)
+
+    # Euclidean distance between each cell (rows) and the disaster at each time step (columns)
+    distance = np.hypot(coords[:, 0, None] - positions[None, :, 0],
+                        coords[:, 1, None] - positions[None, :, 1])
+    risk = calculate_risk(distance, disaster['radius_in_meters'])
+
+    # Shelters always have risk 0
+    shelters = np.array([cell['type'] == 'shelter' for cell in cells], dtype=bool)
+    risk[shelters] = 0
+    return risk
+
+
+def format_risk_matrix(risk):
+    return dat_io.format_array(risk, '{:.4f}')
+
+
+# Uniform grid over the cell coordinates, used to find the cells near the disaster
+# without looking at every cell. Each bucket maps to the indices of the cells in it.
+class GridIndex:
+    def __init__(self, coords, bucket_size):
+        self.bucket_size = bucket_size
+        keys = np.floor(coords / bucket_size).astype(np.int64)
+        order = np.lexsort((keys[:, 1], keys[:, 0]))
+        unique_keys, starts = np.unique(keys[order], axis=0, return_index=True)
+        ends = np.append(starts[1:], len(order))
+        self.buckets = {(int(kx), int(ky)): order[start:end]
+                        for (kx, ky), start, end in zip(unique_keys, starts, ends)}
+
+    # Indices of the cells in the buckets overlapping the box [x0, x1] x [y0, y1]
+    def query_box(self, x0, y0, x1, y1):
+        bx0, by0 = int(np.floor(x0 / self.bucket_size)), int(np.floor(y0 / self.bucket_size))
+        bx1, by1 = int(np.floor(x1 / self.bucket_size)), int(np.floor(y1 / self.bucket_size))
+        found = [self.buckets[(bx, by)]
+                 for bx in range(bx0, bx1 + 1)
+                 for by in range(by0, by1 + 1)
+                 if (bx, by) in self.buckets]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(found)
+
+
+# Risk matrix stored as (cell, t, value) entries; every other entry is zero
+class SparseRiskMatrix:
+    def __init__(self, cell_index, time_index, values, shape):
+        order = np.lexsort((time_index, cell_index))
+        self.cell_index = cell_index[order]
+        self.time_index = time_index[order]
+        self.values = values[order]
+        self.shape = shape
+
+    def to_dense(self):
+        risk = np.zeros(self.shape)
+        risk[self.cell_index, self.time_index] = self.values
+        return risk
+
+    # Yield (cell, first t, values from the first to the last non-zero t) for the cells with risk
+    def spans(self):
+        bounds = np.searchsorted(self.cell_index, np.arange(self.shape[0] + 1))
+        for i in np.flatnonzero(np.diff(bounds)).tolist():
+            times = self.time_index[bounds[i]:bounds[i + 1]]
+            span = np.zeros(times[-1] - times[0] + 1)
+            span[times - times[0]] = self.values[bounds[i]:bounds[i + 1]]
+            yield i, int(times[0]), span
+
+
+# Same values as risk_matrix, but only the cells inside the bounding box of the disaster
+# are evaluated at each time step, and the result is returned as a SparseRiskMatrix
+@instrument.span("risk.sparse_matrix")
+def sparse_risk_matrix(data, n_time_steps=None):
+    cells = data['cells']
+    disaster = data['disaster']
+    settings = data['setting']
+    radius = disaster['radius_in_meters']
+
+    positions = disaster_positions(disaster, settings, n_time_steps)
+    coords = cell_positions(cells, settings)
+    shelters = np.array([cell['type'] == 'shelter' for cell in cells], dtype=bool)
+    index = GridIndex(coords, radius)
+
+    cell_parts, time_parts, value_parts = [], [], []
+    for t, (x, y) in enumerate(positions):
+        candidates = index.query_box(x - radius, y - radius, x + radius, y + radius)
+        distance = np.hypot(coords[candidates, 0] - x, coords[candidates, 1] - y)
+        # Shelters always have risk 0
+        inside = (distance <= radius) & ~shelters[candidates]
+        cell_parts.append(candidates[inside])
+        time_parts.append(np.full(inside.sum(), t, dtype=np.int64))
+        value_parts.append(calculate_risk(distance[inside], radius))
+
+    return SparseRiskMatrix(np.concatenate(cell_parts), np.concatenate(time_parts),
+                            np.concatenate(value_parts), (len(cells), len(positions)))
+
+
+# Same text as format_risk_matrix, built from the non-zero span of each row. The zeros around
+# the spans and the rows without risk are cut from one run of zeros instead of being formatted.
+def format_sparse_risk_matrix(sparse_risk):
+    n_cells, n_time_steps = sparse_risk.shape
+    zeros = '0.0000, ' * n_time_steps
+    zero_row = '[' + zeros[:-2] + ']'
+    rows = [zero_row] * n_cells
+    for i, start, span in sparse_risk.spans():
+        after = n_time_steps - start - len(span)
+        rows[i] = ('[' + zeros[:8 * start] + ', '.join(f'{val:.4f}' for val in span) +
+                   (', ' + zeros[:8 * after - 2] if after else '') + ']')
+    return '[' + ',\n'.join(rows) + ']'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calculate the risk coefficients c[i][t] from an info JSON file.")
+    parser.add_argument("json_file", help="Path to the JSON file containing coordinates, disaster and settings.")
+    parser.add_argument("--dat", help="Write the c block directly into this .dat file.")
+    parser.add_argument("--output", default="risk_matrix.txt", help="File to save the array to when --dat is not given.")
+    parser.add_argument("--heading", type=float, help="Override the disaster heading in degrees (0 is +x, counterclockwise).")
+    parser.add_argument("--trajectory", help="Override the disaster trajectory with waypoints, e.g. '0,1;2,1;2,-2'.")
+    parser.add_argument("--time-steps", type=int, help="Override the number of time steps in the settings.")
+    parser.add_argument("--sparse", action="store_true", help="Only evaluate the cells near the disaster (for very large networks).")
+    args = parser.parse_args()
+
+    data = load_info(args.json_file)
+    if args.heading is not None:
+        data['disaster'].pop('trajectory', None)
+        data['disaster']['heading_in_degrees'] = args.heading
+    if args.trajectory:
+        data['disaster']['trajectory'] = [[float(v) for v in point.split(',')] for point in args.trajectory.split(';')]
+
+    if args.sparse:
+        risk = sparse_risk_matrix(data, args.time_steps)
+        literal = format_sparse_risk_matrix(risk)
+    else:
+        risk = risk_matrix(data, args.time_steps)
+        literal = format_risk_matrix(risk)
 
+    if args.dat:
+        dat_io.write_blocks(args.dat, {'c': literal})
+        print(f"Risk matrix ({risk.shape[0]} cells x {risk.shape[1]} time steps) written to {args.dat}")
+    else:
+        with open(args.output, 'w') as f:
+            f.write(literal)
+        print(f"Risk matrix saved to {args.output}")
@@ -1,4 +1,9 @@
+import argparse
+import heapq
 import numpy as np
+import dat_io
+import instrument
+
 
 def floyd_warshall(nodes, edges):
     # Initialize the distance matrix with infinity
@@ -9,70 +14,172 @@ def floyd_warshall(nodes, edges):
     node_to_index = {node: i for i, node in enumerate(nodes)}
 
     # Distance to self is zero
-    for i in range(n):
-        distance[i][i] = 0
+    np.fill_diagonal(distance, 0)
 
     # Set distances for the given edges
     for edge in edges:
         node1, node2, weight = edge
         i, j = node_to_index[node1], node_to_index[node2]
-        distance[i][j] = weight
-        distance[j][i] = weight  # Since the graph is undirected
+        distance[i][j] = min(distance[i][j], weight)
+        distance[j][i] = distance[i][j]  # Since the graph is undirected
 
-    # Floyd-Warshall algorithm
+    # Floyd-Warshall algorithm, relaxing every pair through k at once
     for k in range(n):
-        for i in range(n):
-            for j in range(n):
-                distance[i][j] = min(distance[i][j], distance[i][k] + distance[k][j])
+        np.minimum(distance, distance[:, k, None] + distance[None, k, :], out=distance)
 
     return distance
 
+
+# Adjacency lists of (neighbor index, weight) for each node index
+def build_adjacency(nodes, edges):
+    node_to_index = {node: i for i, node in enumerate(nodes)}
+    adjacency = [[] for _ in nodes]
+    for node1, node2, weight in edges:
+        i, j = node_to_index[node1], node_to_index[node2]
+        adjacency[i].append((j, weight))
+        adjacency[j].append((i, weight))  # Since the graph is undirected
+    return adjacency
+
+
+# Shortest distances from a single node index to every node index
+def dijkstra(adjacency, source):
+    distance = np.full(len(adjacency), float('inf'))
+    distance[source] = 0
+    queue = [(0.0, source)]
+    while queue:
+        d, i = heapq.heappop(queue)
+        if d > distance[i]:
+            continue
+        for j, weight in adjacency[i]:
+            if d + weight < distance[j]:
+                distance[j] = d + weight
+                heapq.heappush(queue, (d + weight, j))
+    return distance
+
+
+# Distances between the given nodes, using only the rows that are needed
+def dijkstra_distances(nodes, edges, sources):
+    adjacency = build_adjacency(nodes, edges)
+    node_to_index = {node: i for i, node in enumerate(nodes)}
+    return np.array([dijkstra(adjacency, node_to_index[node]) for node in sources])
+
+
+# Travel times tau[p][n1][n2] between the nodes in Vp and their row maxima tau_max[p][n].
+# Each resource p moves speeds[p] weight units per time period.
+@instrument.span("tau")
+def calculate_tau(nodes, edges, vp, speeds, method='dijkstra'):
+    node_to_index = {node: i for i, node in enumerate(nodes)}
+    vp_index = [node_to_index[node] for node in vp]
+
+    if method == 'floyd-warshall':
+        distance = floyd_warshall(nodes, edges)[np.ix_(vp_index, vp_index)]
+    elif method == 'dijkstra':
+        distance = dijkstra_distances(nodes, edges, vp)[:, vp_index]
+    else:
+        raise ValueError(f"Unknown method '{method}'")
+
+    return tau_from_distances(distance, vp, speeds)
+
+
+# tau and tau_max from the distances between the nodes in Vp
+def tau_from_distances(distance, vp, speeds):
+    unreachable = np.argwhere(np.isinf(distance))
+    if len(unreachable):
+        n1, n2 = unreachable[0]
+        raise ValueError(f"Node {vp[n2]} is not reachable from node {vp[n1]}")
+
+    speeds = np.asarray(speeds, dtype=float)
+    tau = np.rint(distance[None, :, :] / speeds[:, None, None]).astype(int)
+    tau_max = tau.max(axis=2)
+    return tau, tau_max
+
+
+# Sidecar for network_update.py: the graph, Vp, the speeds and the distances from each node in
+# Vp to every node, so that tau can be updated without starting over. closed holds the edges
+# that network_update.py closed, with the weight they get back when they are reopened.
+def save_distances(path, nodes, edges, vp, speeds, distance, closed=()):
+    def edge_arrays(edge_list):
+        return (np.array([(node1, node2) for node1, node2, _ in edge_list], dtype=str).reshape(-1, 2),
+                np.array([weight for _, _, weight in edge_list], dtype=float))
+    edge_nodes, edge_weights = edge_arrays(edges)
+    closed_nodes, closed_weights = edge_arrays(closed)
+    np.savez(path, nodes=np.array(nodes, dtype=str), vp=np.array(vp, dtype=str), speeds=np.asarray(speeds, dtype=float),
+             edge_nodes=edge_nodes, edge_weights=edge_weights, closed_nodes=closed_nodes,
+             closed_weights=closed_weights, distance=distance)
+
+
+def load_distances(path):
+    with np.load(path) as f:
+        def edge_list(name):
+            return [(node1, node2, weight) for (node1, node2), weight
+                    in zip(f[f"{name}_nodes"].tolist(), f[f"{name}_weights"].tolist())]
+        return {"nodes": f["nodes"].tolist(), "edges": edge_list("edge"), "closed": edge_list("closed"),
+                "vp": f["vp"].tolist(), "speeds": f["speeds"], "distance": f["distance"]}
+
+
 # Read graph data from a file
 def read_graph_from_file(filename):
     with open(filename, 'r') as file:
         lines = file.readlines()
 
     # First line contains nodes, comma-separated
-    nodes = lines[0].strip().split(',')
+    nodes = [node.strip() for node in lines[0].strip().split(',')]
 
     # Remaining lines contain edges in the format 'node1 node2 weight'
     edges = []
     for line in lines[1:]:
         parts = line.strip().split()
-        edges.append((parts[0], parts[1], float(parts[2])))
+        if parts:
+            edges.append((parts[0], parts[1], float(parts[2])))
 
     return nodes, edges
 
+
+def format_tau_blocks(tau, tau_max):
+    return {
+        'tau': dat_io.format_array(tau),
+        'tau_max': dat_io.format_array(tau_max),
+    }
+
+
 # Main function
 if __name__ == "__main__":
-    filename = input("Enter the filename containing the graph data: ")
+    parser = argparse.ArgumentParser(description="Calculate resource travel times tau and tau_max from a graph file.")
+    parser.add_argument("graph_file", nargs="?", help="Graph file: comma-separated nodes on the first line, then 'node1 node2 weight' lines.")
+    parser.add_argument("--vp", help="Comma-separated nodes eligible for resource allocation, in the order of Vp (default: Vp in --dat, or all nodes).")
+    parser.add_argument("--speeds", default="1,1", help="Comma-separated speed of each resource in weight units per period (default: 1,1).")
+    parser.add_argument("--method", choices=["dijkstra", "floyd-warshall"], default="dijkstra")
+    parser.add_argument("--dat", help="Write the tau and tau_max blocks directly into this .dat file.")
+    parser.add_argument("--output", default="tau_output.dat", help="File to write the blocks to when --dat is not given.")
+    parser.add_argument("--save-distances", metavar="NPZ_FILE",
+                        help="Also save the graph and the distances from Vp for network_update.py.")
+    args = parser.parse_args()
+
+    filename = args.graph_file or input("Enter the filename containing the graph data: ")
     nodes, edges = read_graph_from_file(filename)
-
-    # Calculate shortest paths
-    distance_matrix = floyd_warshall(nodes, edges)
-
-    # Output the result as a two-dimensional array
-    print("\nShortest path matrix:")
-    output_filename = "shortest_path_output.txt"
-    largest_values_filename = "largest_values_output.txt"
-    with open(output_filename, "w") as outfile:
-        formatted_matrix = []
-        largest_values = []
-        for row in distance_matrix:
-            formatted_row = [int(round(x)) if x < float('inf') else 'inf' for x in row]
-            formatted_matrix.append(formatted_row)
-            largest_values.append(max([x for x in formatted_row if x != 'inf']))
-        
-        # Print and write the matrix as a valid 2D array
-        print(formatted_matrix)
-        outfile.write(str(formatted_matrix))
-
-    # Write the largest values to a separate file
-    with open(largest_values_filename, "w") as outfile:
-        print("\nLargest values in each row:")
-        print(largest_values)
-        outfile.write(str(largest_values))
-
-    print(f"The shortest path matrix has been saved to {output_filename}")
-    print(f"The largest values array has been saved to {largest_values_filename}")
-
+    if args.vp:
+        vp = [node.strip() for node in args.vp.split(',')]
+    elif args.dat:
+        vp = [str(node) for node in dat_io.load_dat(args.dat)['Vp']]
+    else:
+        vp = nodes
+    speeds = [float(speed) for speed in args.speeds.split(',')]
+
+    if args.save_distances:
+        # The rows of Dijkstra's algorithm over all nodes are kept, whatever the method
+        distance = dijkstra_distances(nodes, edges, vp)
+        node_to_index = {node: i for i, node in enumerate(nodes)}
+        tau, tau_max = tau_from_distances(distance[:, [node_to_index[node] for node in vp]], vp, speeds)
+        save_distances(args.save_distances, nodes, edges, vp, speeds, distance)
+    else:
+        tau, tau_max = calculate_tau(nodes, edges, vp, speeds, args.method)
+    blocks = format_tau_blocks(tau, tau_max)
+
+    if args.dat:
+        dat_io.write_blocks(args.dat, blocks)
+        print(f"tau and tau_max for {len(speeds)} resources and {len(vp)} nodes written to {args.dat}")
+    else:
+        with open(args.output, "w") as outfile:
+            for name, literal in blocks.items():
+                outfile.write(f"{name} = {literal};\n\n")
+        print(f"tau and tau_max have been saved to {args.output}")
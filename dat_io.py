@@ -0,0 +1,347 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import numpy as np
+import instrument
+
+# Helpers for reading and writing OPL .dat files
+
+comment_pattern = re.compile(r"//[^\n]*|/\*.*?\*/", re.S)
+number_pattern = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+statement_pattern = re.compile(r"\s*([A-Za-z_]\w*)\s*=(.*)", re.S)
+range_pattern = re.compile(r"(-?\d+)\s*\.\.\s*(-?\d+)")
+
+cache_dir_name = ".dat_cache"
+
+
+# Replace comments with spaces so that positions in the masked text
+# line up with positions in the original text
+def mask_comments(text):
+    return comment_pattern.sub(lambda m: re.sub(r"[^\n]", " ", m.group(0)), text)
+
+
+# Position of the ";" that ends the statement starting at start, or -1. A ";" inside a
+# string literal is skipped: it has an odd number of quotes between it and the start.
+def statement_end(masked, start):
+    end = masked.find(";", start)
+    while end != -1 and masked.count('"', start, end) % 2:
+        end = masked.find(";", end + 1)
+    return end
+
+
+# Find the (start, end) span of the uncommented "name = ...;" statement
+def find_block(text, name, masked=None):
+    if masked is None:
+        masked = mask_comments(text)
+    match = re.search(r"(?m)^[ \t]*" + re.escape(name) + r"\s*=", masked)
+    if match is None:
+        return None
+    end = statement_end(masked, match.end())
+    if end == -1:
+        raise ValueError(f"Statement for '{name}' is not terminated with ';'")
+    return match.start(), end + 1
+
+
+# Value literal of the uncommented "name = ...;" statement, or None
+def block_literal(text, name):
+    span = find_block(text, name)
+    if span is None:
+        return None
+    start, end = span
+    return text[start:end - 1].split("=", 1)[1].strip()
+
+
+# Value literals of the given statements that exist, masking the comments once.
+# Reading a few blocks this way is much faster than parsing a large file.
+def block_literals(text, names):
+    masked = mask_comments(text)
+    literals = {}
+    for name in names:
+        span = find_block(text, name, masked)
+        if span is not None:
+            start, end = span
+            literals[name] = text[start:end - 1].split("=", 1)[1].strip()
+    return literals
+
+
+# Value literals for name in file order: the active statement and every
+# single-line "// name = ...;" alternative that is commented out
+def block_alternatives(text, name):
+    found = []
+    pattern = r"(?m)^[ \t]*//[ \t]*" + re.escape(name) + r"\s*=\s*(.*?);[ \t]*$"
+    for match in re.finditer(pattern, text):
+        found.append((match.start(), match.group(1).strip()))
+    span = find_block(text, name)
+    if span is not None:
+        found.append((span[0], block_literal(text, name)))
+    return [literal for _, literal in sorted(found)]
+
+
+# Format a (nested) list or array of numbers as an OPL array literal
+def format_array(values, fmt="{}", row_separator=",\n"):
+    if hasattr(values, "tolist"):
+        values = values.tolist()
+    if len(values) and isinstance(values[0], (list, tuple)):
+        # Only the outermost level is split over several lines
+        inner = [format_array(row, fmt, ", ") for row in values]
+        return "[" + row_separator.join(inner) + "]"
+    return "[" + ", ".join(fmt.format(v) for v in values) + "]"
+
+
+# Replace the statement for name in text with the given value literal,
+# or append it to the end of the text if the statement does not exist
+def replace_block(text, name, literal):
+    statement = f"{name} = {literal};"
+    span = find_block(text, name)
+    if span is None:
+        if text and not text.endswith("\n"):
+            text += "\n"
+        return text + "\n" + statement + "\n"
+    start, end = span
+    return text[:start] + statement + text[end:]
+
+
+# Remove the statement for name from text, if it exists
+def remove_block(text, name):
+    span = find_block(text, name)
+    if span is None:
+        return text
+    start, end = span
+    return text[:start] + text[end:]
+
+
+# Names of the data elements a .mod file reads from .dat files ("... = ...;")
+def declared_data(mod_text):
+    masked = mask_comments(mod_text)
+    return set(re.findall(r"(\w+)\s*(?:\[[^\]]*\]\s*)*=\s*\.\.\.\s*;", masked))
+
+
+# Write several blocks into a .dat file in place
+@instrument.span("dat.write_blocks")
+def write_blocks(dat_path, blocks):
+    with open(dat_path, "r") as f:
+        text = f.read()
+    for name, literal in blocks.items():
+        text = replace_block(text, name, literal)
+    with open(dat_path, "w") as f:
+        f.write(text)
+
+
+# Parsed .dat contents: a dict from names to values, with the kind of each value in kinds:
+#   "set"     {1, 2, 3}                 1-D array in the order of the set
+#   "tuples"  {<1,2>, <2,3>}            2-D array with one row per tuple
+#   "array"   [[0.1, 0.2], [0.3, 0.4]]  n-D array
+#   "nested"  [{1, 2}, {<1,2>}, {}]     list of set or tuple arrays
+#   "scalar"  5, 0.5 or "text"
+class DatData(dict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.kinds = {}
+
+
+def to_numbers(tokens):
+    if any("." in token or "e" in token or "E" in token for token in tokens):
+        return np.array(tokens, dtype=float)
+    return np.array(tokens, dtype=np.int64)
+
+
+def parse_set(literal):
+    inner = literal.strip()[1:-1]
+    if "<" in inner:
+        tuples = re.findall(r"<([^>]*)>", inner)
+        width = tuples[0].count(",") + 1
+        return "tuples", to_numbers(number_pattern.findall(inner)).reshape(len(tuples), width)
+    items = [item.strip() for item in inner.split(",") if item.strip()]
+    if items and items[0].startswith('"'):
+        return "set", np.array([item.strip('"') for item in items])
+    return "set", to_numbers(items)
+
+
+# Split the elements of a [...] literal at its top level
+def split_elements(literal):
+    inner = literal.strip()[1:-1]
+    elements, depth, start = [], 0, 0
+    for position, char in enumerate(inner):
+        if char in "[{<":
+            depth += 1
+        elif char in "]}>":
+            depth -= 1
+        elif char == "," and depth == 0:
+            elements.append(inner[start:position])
+            start = position + 1
+    elements.append(inner[start:])
+    return [element.strip() for element in elements if element.strip()]
+
+
+# Shape of a [...] literal of numbers, checking that the rows at each level have the same length
+def array_shape(literal):
+    if "[" not in literal[1:]:
+        # A row of numbers has no nested elements, so its commas can be split at directly
+        return (len([element for element in literal.strip()[1:-1].split(",") if element.strip()]),)
+    elements = split_elements(literal)
+    shapes = {array_shape(element) for element in elements}
+    if len(shapes) > 1:
+        raise ValueError("Arrays with rows of different lengths are not supported")
+    return (len(elements),) + shapes.pop()
+
+
+def parse_value(literal):
+    literal = literal.strip()
+    if literal.startswith("{"):
+        return parse_set(literal)
+    if literal.startswith("["):
+        if "{" in literal:
+            sets = [parse_set(element)[1] for element in split_elements(literal)]
+            # Empty sets take the shape of the tuple sets next to them
+            widths = {values.shape[1] for values in sets if values.ndim == 2}
+            if widths:
+                width = widths.pop()
+                sets = [values.reshape(len(values), width) for values in sets]
+            return "nested", sets
+        # Any OPL number literal (1., .5, +3, 1e-3), in the shape of the brackets
+        shape = array_shape(literal)
+        tokens = number_pattern.findall(literal)
+        if len(tokens) != np.prod(shape, dtype=np.int64):
+            raise ValueError(f"Array literal with values that are not numbers: {literal[:40]}")
+        return "array", to_numbers(tokens).reshape(shape)
+    match = range_pattern.fullmatch(literal)
+    if match:
+        return "set", np.arange(int(match.group(1)), int(match.group(2)) + 1)
+    if literal.startswith('"'):
+        return "scalar", literal.strip('"')
+    return "scalar", to_numbers([literal])[0].item()
+
+
+def parse_dat(text):
+    data = DatData()
+    masked = mask_comments(text)
+    start = 0
+    while start < len(masked):
+        end = statement_end(masked, start)
+        if end == -1:
+            end = len(masked)
+        match = statement_pattern.match(masked, start, end)
+        if match:
+            name, literal = match.groups()
+            data.kinds[name], data[name] = parse_value(literal)
+        start = end + 1
+    return data
+
+
+def format_set(values):
+    values = np.asarray(values)
+    if values.ndim == 2:
+        return "{" + ", ".join("<" + ",".join(map(str, row)) + ">" for row in values.tolist()) + "}"
+    return "{" + ", ".join(map(str, values.tolist())) + "}"
+
+
+def format_value(value, kind):
+    if kind in ("set", "tuples"):
+        return format_set(value)
+    if kind == "nested":
+        return "[" + ",\n".join(format_set(values) for values in value) + "]"
+    if kind == "array":
+        return format_array(value)
+    if isinstance(value, str):
+        return f'"{value}"'
+    return str(value)
+
+
+def format_dat(data):
+    return "\n".join(f"{name} = {format_value(value, data.kinds[name])};\n" for name, value in data.items())
+
+
+@instrument.span("dat.write")
+def write_dat(dat_path, data):
+    with open(dat_path, "w") as f:
+        f.write(format_dat(data))
+
+
+def file_hash(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# Parses a .dat file, keeping its arrays as .npy files in a sidecar cache next to it.
+# The cache is keyed by the hash of the file, so it is rebuilt whenever the file changes.
+# Cached arrays are memory-mapped (read-only) unless mmap is False.
+def load_dat(dat_path, use_cache=True, mmap=True):
+    with instrument.span("dat.load", path=os.path.basename(dat_path)) as fields:
+        return read_dat(dat_path, use_cache, mmap, fields)
+
+
+def read_dat(dat_path, use_cache, mmap, fields):
+    if not use_cache:
+        fields["cache"] = "off"
+        with open(dat_path, "r") as f:
+            return parse_dat(f.read())
+
+    directory, base_name = os.path.split(os.path.abspath(dat_path))
+    digest = file_hash(dat_path)
+    cache_root = os.path.join(directory, cache_dir_name)
+    cache_path = os.path.join(cache_root, f"{base_name}-{digest[:16]}")
+    manifest_path = os.path.join(cache_path, "manifest.json")
+
+    if os.path.exists(manifest_path):
+        fields["cache"] = "hit"
+        return read_cache(cache_path, mmap)
+
+    fields["cache"] = "miss"
+    with open(dat_path, "r") as f:
+        data = parse_dat(f.read())
+
+    # Remove the caches of older versions of the file
+    if os.path.isdir(cache_root):
+        for entry in os.scandir(cache_root):
+            if entry.name.startswith(base_name + "-"):
+                shutil.rmtree(entry.path, ignore_errors=True)
+    write_cache(cache_path, data, digest)
+    return data
+
+
+def write_cache(cache_path, data, digest):
+    staging = f"{cache_path}.{os.getpid()}.tmp"
+    os.makedirs(staging, exist_ok=True)
+    manifest = {"hash": digest, "kinds": data.kinds, "scalars": {}}
+    for name, value in data.items():
+        kind = data.kinds[name]
+        if kind == "scalar":
+            manifest["scalars"][name] = value
+        elif kind == "nested":
+            offsets = np.cumsum([0] + [len(values) for values in value])
+            flat = np.concatenate(value) if value else np.empty(0, dtype=np.int64)
+            np.save(os.path.join(staging, f"{name}.values.npy"), flat)
+            np.save(os.path.join(staging, f"{name}.offsets.npy"), offsets)
+        else:
+            np.save(os.path.join(staging, f"{name}.npy"), value)
+    # The manifest is written last, a cache without it is incomplete
+    with open(os.path.join(staging, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    try:
+        os.replace(staging, cache_path)
+    except OSError:
+        # Another process wrote the same cache at the same time
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def read_cache(cache_path, mmap=True):
+    with open(os.path.join(cache_path, "manifest.json"), "r") as f:
+        manifest = json.load(f)
+    mmap_mode = "r" if mmap else None
+    data = DatData()
+    for name, kind in manifest["kinds"].items():
+        data.kinds[name] = kind
+        if kind == "scalar":
+            data[name] = manifest["scalars"][name]
+        elif kind == "nested":
+            flat = np.load(os.path.join(cache_path, f"{name}.values.npy"), mmap_mode=mmap_mode)
+            offsets = np.load(os.path.join(cache_path, f"{name}.offsets.npy"))
+            data[name] = [flat[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        else:
+            data[name] = np.load(os.path.join(cache_path, f"{name}.npy"), mmap_mode=mmap_mode)
+    return data
@@ -0,0 +1,225 @@
+import argparse
+import json
+import math
+import re
+import numpy as np
+import networkx as nx
+import calculate_risk
+import generate_network
+import instrument
+import presolve
+
+# Converts a road graph into the cells of the cell transmission model and writes a matching
+# .dat and info JSON pair, like generate_network.py does for synthetic networks.
+#
+# The graph is read with networkx from GraphML or node-link JSON. Nodes need x and y
+# coordinates (meters, or longitude and latitude with --geographic) and may have a "type"
+# ("source", "shelter" or "node") and, for sources, a "demand". Edges may have a "length"
+# in meters, a number of "lanes" and a free-flow speed ("speed_kph" or "maxspeed" in km/h).
+# Undirected edges are roads in both directions. OSMnx graphs can be used as they are.
+#
+# Every node becomes one cell. Every directed link becomes a chain of road cells, each as long
+# as a vehicle travels at the free-flow speed in one time step, so vehicles move one cell per
+# period. For a road cell with cell length L, lanes l, free-flow speed v and time step dt:
+#   Q        = l * saturation flow * dt            vehicles that can enter or leave per period
+#   N        = l * jam density * L                 vehicles the cell can hold
+#   s_factor = min(1, backward wave speed / v)
+#   delta    = saturation flow * dt                capacity of one more lane (Expressions 8-9)
+# The last cell of each chain is in R_prime, with the node at its end as its downstream node.
+# Links into sources and out of shelters are left out, as in toy.dat.
+
+earth_radius = 6378137.0
+number_pattern = re.compile(r"\d+(?:\.\d+)?")
+
+
+# First number in an attribute value, which OSMnx stores as e.g. "2", ["2", "3"] or "30 mph"
+def attribute_number(value, default):
+    if value is None:
+        return default
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+        return attribute_number(value, default)
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = number_pattern.search(str(value))
+    if not match:
+        return default
+    number = float(match.group())
+    return number * 1.609344 if "mph" in str(value) else number
+
+
+def read_graph(path):
+    if path.endswith(".json"):
+        with open(path, "r") as f:
+            return nx.node_link_graph(json.load(f), edges="links")
+    return nx.read_graphml(path)
+
+
+# Node coordinates in meters, and the geographic center for the info JSON
+def node_coordinates(graph, geographic=False, center=None):
+    nodes = list(graph.nodes)
+    x = np.array([float(graph.nodes[node]["x"]) for node in nodes])
+    y = np.array([float(graph.nodes[node]["y"]) for node in nodes])
+    if geographic:
+        # Longitude and latitude, projected around their mean
+        center_lat, center_lon = float(y.mean()), float(x.mean())
+        x = np.radians(x - center_lon) * earth_radius * math.cos(math.radians(center_lat))
+        y = np.radians(y - center_lat) * earth_radius
+        return np.column_stack([x, y]), {"lat": center_lat, "lon": center_lon}
+    return np.column_stack([x, y]), center or generate_network.default_geo_center
+
+
+# Directed links (from node, to node, attributes), both ways for undirected graphs
+def directed_links(graph):
+    if graph.is_directed():
+        return [(u, v, data) for u, v, data in graph.edges(data=True)]
+    return [link for u, v, data in graph.edges(data=True) for link in ((u, v, data), (v, u, data))]
+
+
+# Cells, arcs and parameters in the same dict layout as generate_network.generate_network
+def discretize(graph, time_step=10, sources=None, sinks=None, geographic=False, center=None,
+               default_speed=50, default_lanes=1, saturation_flow=1800, jam_density=133, wave_speed=20,
+               vp_degree=3, max_vp=100):
+    nodes = list(graph.nodes)
+    types = {node: graph.nodes[node].get("type", "node") for node in nodes}
+    demand = {node: int(attribute_number(graph.nodes[node].get("demand"), 0)) for node in nodes}
+    for node, value in (sources or {}).items():
+        types[node], demand[node] = "source", value
+    for node in sinks or ():
+        types[node] = "shelter"
+    if "source" not in types.values() or "shelter" not in types.values():
+        raise ValueError("The graph needs at least one source and one shelter")
+
+    coords, geo_center = node_coordinates(graph, geographic, center)
+    cell_of = {node: k + 1 for k, node in enumerate(nodes)}
+    position_of = {node: coords[k] for k, node in enumerate(nodes)}
+
+    next_cell = len(nodes) + 1
+    arcs, road_positions, downstream = [], [], {}
+    flow, holding, s_factor, lane_flow = [], [], [], []
+    graph_edges = []
+    with instrument.span("discretize.links", links=graph.number_of_edges()):
+        for u, v, data in directed_links(graph):
+            if types[v] == "source" or types[u] == "shelter" or u == v:
+                continue
+            start, end = position_of[u], position_of[v]
+            length = attribute_number(data.get("length"), None) or float(np.hypot(*(end - start)))
+            speed = attribute_number(data.get("speed_kph", data.get("maxspeed")), default_speed)
+            lanes = max(1.0, attribute_number(data.get("lanes"), default_lanes))
+            cell_length = speed / 3.6 * time_step
+            n_cells = max(1, round(length / cell_length))
+
+            chain = list(range(next_cell, next_cell + n_cells))
+            next_cell += n_cells
+            fractions = (np.arange(n_cells) + 0.5) / n_cells
+            road_positions.append(start + fractions[:, None] * (end - start))
+            path = [cell_of[u], *chain, cell_of[v]]
+            arcs.extend(zip(path[:-1], path[1:]))
+            downstream[chain[-1]] = cell_of[v]
+
+            flow.extend([lanes * saturation_flow / 3600 * time_step] * n_cells)
+            holding.extend([lanes * jam_density / 1000 * length / n_cells] * n_cells)
+            s_factor.extend([min(1.0, wave_speed / speed)] * n_cells)
+            lane_flow.extend([saturation_flow / 3600 * time_step] * n_cells)
+            # Resources move one cell per period at speed 1, as the vehicles do
+            graph_edges.append((str(cell_of[u]), str(cell_of[v]), n_cells + 1))
+
+    # Resources can be allocated at the shelters and the busiest intersections
+    degree = dict(graph.degree)
+    shelters = [cell_of[node] for node in nodes if types[node] == "shelter"]
+    junctions = sorted((node for node in nodes if types[node] == "node" and degree[node] >= vp_degree),
+                       key=lambda node: -degree[node])
+    vp = sorted(shelters + [cell_of[node] for node in junctions[:max(0, max_vp - len(shelters))]])
+
+    cells = [{"cell_number": cell_of[node], "x_coord": round(float(x), 2), "y_coord": round(float(y), 2),
+              "type": types[node], "node": str(node)} for node, (x, y) in zip(nodes, coords.tolist())]
+    road_coords = np.vstack(road_positions) if road_positions else np.zeros((0, 2))
+    cells += [{"cell_number": len(nodes) + k + 1, "x_coord": round(float(x), 2), "y_coord": round(float(y), 2),
+               "type": "road"} for k, (x, y) in enumerate(road_coords.tolist())]
+
+    source_nodes = [node for node in nodes if types[node] == "source"]
+    r_prime = np.array(sorted(downstream))
+    return {
+        "I": np.arange(1, next_cell),
+        "S_o": np.array([cell_of[node] for node in source_nodes]),
+        "S_e": np.array(sorted(shelters)),
+        "R": np.arange(len(nodes) + 1, next_cell),
+        "R_prime": r_prime,
+        "A": np.array(arcs, dtype=np.int64).reshape(-1, 2),
+        "Vp": np.array(vp, dtype=np.int64),
+        "D": np.array([demand[node] for node in source_nodes]),
+        "Q": np.round(flow, 3),
+        "N": np.round(holding, 3),
+        "downstreamNode": np.array([downstream[cell] for cell in r_prime.tolist()]),
+        "delta": np.round(lane_flow, 3),
+        "s_factor": np.round(s_factor, 3),
+        "graph_nodes": [str(cell_of[node]) for node in nodes],
+        "graph_edges": graph_edges,
+        "cells": cells,
+        "geo_center": geo_center,
+    }
+
+
+# "id:demand,id:demand" or "id,id" with graph node ids as strings (GraphML ids are strings)
+def parse_nodes(text, graph, with_values=False):
+    lookup = {str(node): node for node in graph.nodes}
+    entries = {}
+    for item in text.split(","):
+        node, _, value = item.strip().partition(":")
+        if node not in lookup:
+            raise ValueError(f"Node {node} is not in the graph")
+        entries[lookup[node]] = int(value) if with_values else None
+    return entries if with_values else list(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a road graph into cells and write a .dat and info JSON pair.")
+    parser.add_argument("graph_file", help="Road graph as GraphML or node-link JSON.")
+    parser.add_argument("name", help="Output name, writes <name>.dat and <name>_info.json.")
+    parser.add_argument("--time-step", type=float, default=10, help="Length of a period in seconds.")
+    parser.add_argument("--periods", type=int, default=60)
+    parser.add_argument("--sources", help="Source nodes with their demand, e.g. '12:400,40:250' "
+                                          "(default: the nodes with type 'source').")
+    parser.add_argument("--sinks", help="Shelter nodes, e.g. '77,78' (default: the nodes with type 'shelter').")
+    parser.add_argument("--geographic", action="store_true", help="Node x and y are longitude and latitude.")
+    parser.add_argument("--center", help="lat,lon of the origin of the coordinates (without --geographic).")
+    parser.add_argument("--speed", type=float, default=50, help="Free-flow speed in km/h of links without one.")
+    parser.add_argument("--lanes", type=float, default=1, help="Lanes of links without a lane count.")
+    parser.add_argument("--saturation-flow", type=float, default=1800, help="Vehicles per hour and lane.")
+    parser.add_argument("--jam-density", type=float, default=133, help="Vehicles per km and lane.")
+    parser.add_argument("--wave-speed", type=float, default=20, help="Backward wave speed in km/h.")
+    parser.add_argument("--vp-degree", type=int, default=3,
+                        help="Intersections with at least this many streets can hold resources.")
+    parser.add_argument("--max-vp", type=int, default=100,
+                        help="Largest Vp, the busiest intersections are kept (tau grows with the square of Vp).")
+    parser.add_argument("--speeds", default="1,1",
+                        help="Comma-separated speed of each resource in cells per period (default: 1,1).")
+    parser.add_argument("--disaster", help="JSON file with a disaster entry as in toy_info.json "
+                                           "(default: crossing the network from the west within the horizon).")
+    args = parser.parse_args()
+
+    graph = read_graph(args.graph_file)
+    center = None
+    if args.center:
+        lat, lon = (float(value) for value in args.center.split(","))
+        center = {"lat": lat, "lon": lon}
+    network = discretize(
+        graph, args.time_step,
+        parse_nodes(args.sources, graph, with_values=True) if args.sources else None,
+        parse_nodes(args.sinks, graph) if args.sinks else None,
+        args.geographic, center, args.speed, args.lanes, args.saturation_flow, args.jam_density,
+        args.wave_speed, args.vp_degree, args.max_vp)
+
+    info = generate_network.network_info(network, args.periods, unit_length=1, time_step_length=args.time_step,
+                                         geo_center=network["geo_center"])
+    if args.disaster:
+        with open(args.disaster, "r") as f:
+            info["disaster"] = json.load(f)["disaster"]
+    risk = calculate_risk.risk_matrix(info, args.periods)
+    tau, tau_max = generate_network.network_tau(network, [float(speed) for speed in args.speeds.split(",")])
+    data = generate_network.network_data(network, tau, tau_max, args.periods)
+    blocks = generate_network.dat_blocks(network, data, risk)
+    blocks.update(presolve.presolve_blocks(data))
+    generate_network.write_network(f"{args.name}.dat", f"{args.name}_info.json", blocks, info)
+    print(f"{args.name}.dat and {args.name}_info.json written: {len(network['I'])} cells, {len(network['A'])} arcs, "
+          f"{len(network['S_o'])} sources, {len(network['S_e'])} sinks, {len(network['Vp'])} nodes in Vp")
@@ -0,0 +1,235 @@
+import argparse
+import json
+import numpy as np
+import calculate_risk
+import calculate_tau
+import dat_io
+import presolve
+
+# Synthetic road networks for scaling tests. Intersections are laid out on a rows x cols
+# grid, and every street between two intersections becomes one chain of road cells per
+# direction. The "random-planar" layout moves the intersections randomly within their grid
+# square, removes some streets and adds one diagonal to some squares; a random spanning
+# tree of the streets is always kept, so every cell can still reach every other cell.
+#
+# Sources are attached to intersections in the left half of the grid and shelters to
+# intersections in the rightmost column, each through its own chain of road cells. The
+# disaster starts at the left edge and moves towards the shelters. The cells are numbered
+# like toy.dat: sources, intersections ("node"), shelters, then road cells. Resources can be
+# allocated at the shelters and at the intersections (Vp); max_vp keeps the intersections with
+# the most streets, as tau grows with the square of Vp.
+
+default_geo_center = {"lat": 35.48596539197836, "lon": -97.5477143572888}
+
+
+# Positions of the intersections (in units) and the streets between them as index pairs
+def street_layout(layout, rows, cols, spacing, rng, keep=0.7, diagonals=0.3):
+    row, col = np.divmod(np.arange(rows * cols), cols)
+    positions = np.column_stack([col, row]).astype(float) * spacing
+    index = row * cols + col
+    right = index[col < cols - 1]
+    up = index[row < rows - 1]
+    streets = np.vstack([np.column_stack([right, right + 1]), np.column_stack([up, up + cols])])
+    if layout == "grid":
+        return positions, streets
+    if layout != "random-planar":
+        raise ValueError(f"Unknown layout '{layout}'")
+
+    # Moving each intersection by less than a quarter of the spacing keeps the streets from crossing
+    positions += rng.uniform(-0.25, 0.25, positions.shape) * spacing
+    corners = index[(col < cols - 1) & (row < rows - 1)]
+    corners = corners[rng.random(len(corners)) < diagonals]
+    flip = rng.random(len(corners)) < 0.5
+    diagonal = np.where(flip[:, None], np.column_stack([corners + 1, corners + cols]),
+                        np.column_stack([corners, corners + cols + 1]))
+    streets = np.vstack([streets, diagonal])
+
+    # Kruskal's algorithm over the streets in random order gives a random spanning tree
+    parent = np.arange(rows * cols)
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    order = rng.permutation(len(streets))
+    in_tree = np.zeros(len(streets), dtype=bool)
+    for k in order:
+        a, b = root(streets[k, 0]), root(streets[k, 1])
+        if a != b:
+            parent[a] = b
+            in_tree[k] = True
+    return positions, streets[in_tree | (rng.random(len(streets)) < keep)]
+
+
+# Cells, arcs and parameters of the network. Returns a dict with the sets and arrays of the
+# .dat file (as NumPy arrays), the street graph for calculate_tau and the cells of the info JSON.
+def generate_network(layout="grid", rows=5, cols=5, cells_per_link=2, n_sources=3, n_sinks=3,
+                     seed=0, demand=(5, 20), max_capacity=2, delta=5, max_vp=None):
+    rng = np.random.default_rng(seed)
+    spacing = cells_per_link + 1
+    positions, streets = street_layout(layout, rows, cols, spacing, rng)
+    n_nodes = rows * cols
+
+    # Sources in the left half of the grid, shelters on the rightmost column
+    col = np.arange(n_nodes) % cols
+    left = np.flatnonzero(col < max(1, cols // 2))
+    right = np.flatnonzero(col == cols - 1)
+    if n_sources > len(left) or n_sinks > len(right):
+        raise ValueError(f"At most {len(left)} sources and {len(right)} sinks fit in a {rows}x{cols} grid")
+    source_nodes = np.sort(rng.choice(left, n_sources, replace=False))
+    sink_nodes = np.sort(rng.choice(right, n_sinks, replace=False))
+
+    sources = np.arange(1, n_sources + 1)
+    nodes = np.arange(n_sources + 1, n_sources + n_nodes + 1)
+    sinks = np.arange(nodes[-1] + 1, nodes[-1] + n_sinks + 1)
+    source_positions = positions[source_nodes] - [spacing / 2, 0]
+    sink_positions = positions[sink_nodes] + [spacing / 2, 0]
+
+    # Every link (a street direction, a source exit or a shelter entrance) is a chain of road
+    # cells from one cell to another
+    links = [(nodes[a], nodes[b], positions[a], positions[b]) for a, b in streets]
+    links += [(nodes[b], nodes[a], positions[b], positions[a]) for a, b in streets]
+    links += [(s, nodes[n], p, positions[n]) for s, n, p in zip(sources, source_nodes, source_positions)]
+    links += [(nodes[n], s, positions[n], p) for s, n, p in zip(sinks, sink_nodes, sink_positions)]
+
+    next_cell = sinks[-1] + 1
+    arcs, road_positions, downstream = [], [], {}
+    fractions = np.arange(1, cells_per_link + 1) / (cells_per_link + 1)
+    for start, end, start_position, end_position in links:
+        chain = np.arange(next_cell, next_cell + cells_per_link)
+        next_cell += cells_per_link
+        road_positions.append(start_position + fractions[:, None] * (end_position - start_position))
+        path = [start, *chain.tolist(), end]
+        arcs.extend(zip(path[:-1], path[1:]))
+        downstream[int(chain[-1])] = int(end)
+    roads = np.arange(sinks[-1] + 1, next_cell)
+    coords = np.vstack([source_positions, positions, sink_positions, *road_positions])
+
+    capacity = rng.integers(1, max_capacity + 1, len(roads))
+    # Resources are moved between intersections and shelters, a street takes spacing periods at speed 1
+    graph_nodes = [str(cell) for cell in (*nodes, *sinks)]
+    graph_edges = [(str(nodes[a]), str(nodes[b]), spacing) for a, b in streets]
+    graph_edges += [(str(nodes[n]), str(s), spacing) for s, n in zip(sinks, sink_nodes)]
+
+    junctions = np.argsort(-np.bincount(streets.ravel(), minlength=n_nodes), kind="stable")
+    if max_vp is not None:
+        junctions = junctions[:max(0, max_vp - n_sinks)]
+    vp = np.concatenate([np.sort(nodes[junctions]), sinks])
+
+    cell_types = ["source"] * len(sources) + ["node"] * len(nodes) + ["shelter"] * len(sinks) + ["road"] * len(roads)
+    r_prime = np.array(sorted(downstream))
+    return {
+        "I": np.arange(1, next_cell),
+        "S_o": sources,
+        "S_e": sinks,
+        "R": roads,
+        "R_prime": r_prime,
+        "A": np.array(arcs, dtype=np.int64),
+        "Vp": vp,
+        "D": rng.integers(demand[0], demand[1] + 1, len(sources)),
+        "Q": capacity,
+        "N": 4 * capacity,
+        "downstreamNode": np.array([downstream[cell] for cell in r_prime.tolist()]),
+        "delta": np.full(len(roads), delta),
+        "s_factor": np.ones(len(roads), dtype=np.int64),
+        "graph_nodes": graph_nodes,
+        "graph_edges": graph_edges,
+        "cells": [{"cell_number": i + 1, "x_coord": round(float(x), 3), "y_coord": round(float(y), 3), "type": kind}
+                  for i, ((x, y), kind) in enumerate(zip(coords.tolist(), cell_types))],
+    }
+
+
+# Info JSON of the network. The disaster starts at the middle of the left edge and moves +x
+# so that it crosses the grid within the horizon.
+def network_info(network, periods, unit_length=110, time_step_length=2, geo_center=None):
+    coords = np.array([[cell["x_coord"], cell["y_coord"]] for cell in network["cells"]])
+    (x_min, y_min), (x_max, y_max) = coords.min(axis=0), coords.max(axis=0)
+    width = (x_max - x_min) * unit_length
+    return {
+        "cells": network["cells"],
+        "disaster": {
+            "x_coord": float(x_min),
+            "y_coord": float((y_min + y_max) / 2),
+            "velocity_in_kmh": round(width / (periods * time_step_length) * 3.6, 3),
+            "direction": "+x",
+            "radius_in_meters": round(max(width, (y_max - y_min) * unit_length) * 0.3, 1),
+        },
+        "setting": {
+            "unit_length_in_meters": unit_length,
+            "time_step_length_in_secs": time_step_length,
+            "n_time_steps": periods,
+            "geo_center": geo_center or default_geo_center,
+        },
+    }
+
+
+def network_tau(network, speeds):
+    return calculate_tau.calculate_tau(network["graph_nodes"], network["graph_edges"],
+                                       [str(cell) for cell in network["Vp"]], speeds)
+
+
+# Sets and arrays of the .dat file that presolve.py needs
+def network_data(network, tau, tau_max, periods):
+    data = {name: network[name] for name in ("I", "S_o", "S_e", "R", "R_prime", "A", "Vp")}
+    data["T"] = data["Tp"] = np.arange(1, periods + 1)
+    data["P"] = np.arange(1, len(tau) + 1)
+    data["tau"], data["tau_max"] = tau, tau_max
+    return data
+
+
+# Blocks of the .dat file in the order of toy.dat, without the blocks of presolve.py
+def dat_blocks(network, data, risk):
+    blocks = {name: dat_io.format_set(data[name]) for name in
+              ("I", "S_o", "S_e", "R", "R_prime", "T", "Tp", "A", "P", "Vp")}
+    blocks.update({name: dat_io.format_array(network[name]) for name in ("D", "Q")})
+    blocks["c"] = calculate_risk.format_risk_matrix(risk)
+    blocks["N"] = dat_io.format_array(network["N"])
+    blocks.update(calculate_tau.format_tau_blocks(data["tau"], data["tau_max"]))
+    blocks.update({name: dat_io.format_array(network[name]) for name in ("downstreamNode", "delta", "s_factor")})
+    return blocks
+
+
+def write_network(dat_file, json_file, blocks, info):
+    with open(dat_file, "w") as f:
+        f.write("\n".join(f"{name} = {literal};\n" for name, literal in blocks.items()))
+    with open(json_file, "w") as f:
+        json.dump(info, f, indent="\t")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic road network as a .dat and info JSON pair.")
+    parser.add_argument("name", help="Output name, writes <name>.dat and <name>_info.json.")
+    parser.add_argument("--layout", choices=["grid", "random-planar"], default="grid")
+    parser.add_argument("--rows", type=int, default=5, help="Rows of intersections.")
+    parser.add_argument("--cols", type=int, default=5, help="Columns of intersections.")
+    parser.add_argument("--cells-per-link", type=int, default=2, help="Road cells between two intersections.")
+    parser.add_argument("--sources", type=int, default=3)
+    parser.add_argument("--sinks", type=int, default=3)
+    parser.add_argument("--periods", type=int, default=30)
+    parser.add_argument("--speeds", default="1,1",
+                        help="Comma-separated speed of each resource in road cells per period (default: 1,1).")
+    parser.add_argument("--demand", default="5,20", help="Range of the demand of a source (default: 5,20).")
+    parser.add_argument("--max-capacity", type=int, default=2, help="Largest Q of a road cell, N is 4 * Q.")
+    parser.add_argument("--max-vp", type=int,
+                        help="Largest Vp, the shelters and the intersections with the most streets are kept "
+                             "(default: every intersection).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.cells_per_link < 1:
+        parser.error("--cells-per-link must be at least 1")
+    network = generate_network(args.layout, args.rows, args.cols, args.cells_per_link, args.sources, args.sinks,
+                               args.seed, tuple(int(d) for d in args.demand.split(",")), args.max_capacity,
+                               max_vp=args.max_vp)
+    info = network_info(network, args.periods)
+    risk = calculate_risk.risk_matrix(info, args.periods)
+    tau, tau_max = network_tau(network, [float(speed) for speed in args.speeds.split(",")])
+    data = network_data(network, tau, tau_max, args.periods)
+    blocks = dat_blocks(network, data, risk)
+    blocks.update(presolve.presolve_blocks(data))
+    write_network(f"{args.name}.dat", f"{args.name}_info.json", blocks, info)
+    print(f"{args.name}.dat and {args.name}_info.json written: {len(network['I'])} cells, {len(network['A'])} arcs, "
+          f"{len(network['S_o'])} sources, {len(network['S_e'])} sinks, {len(network['Vp'])} nodes in Vp, "
+          f"{args.periods} periods")
@@ -1,17 +1,176 @@
 import subprocess
 import os
-import time
+import queue
+import re
+import sys
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from threading import Thread
+from threading import Event, Lock, Thread
 import webbrowser
 import requests
+import solve
+
+# Regular expression for the progress lines printed by solve.py
+progress_pattern = re.compile(r"^(progress|phase): (.*)$")
+server_ready_pattern = re.compile(r"Running on|Dash is running")
+jobs_dir = "jobs"
+
+
+# A solve run in its own working directory under jobs/
+class Job:
+    def __init__(self, number, mod_file, dat_file, oplrun, json_file=None, visualize_after=False):
+        self.number = number
+        self.mod_file = mod_file
+        self.dat_file = dat_file
+        self.oplrun = oplrun
+        self.json_file = json_file
+        self.visualize_after = visualize_after
+        self.directory = os.path.abspath(os.path.join(jobs_dir, f"job_{number:03d}"))
+        self.status = "queued"
+        self.progress = ""
+        self.process = None
+        self.cancelled = False
+
+    def describe(self):
+        text = f"#{self.number} {os.path.basename(self.dat_file)}: {self.status}"
+        return f"{text} ({self.progress})" if self.progress else text
+
+
+# Runs queued jobs in worker threads, at most max_running at once. Workers never touch the
+# GUI; they put (event, job) pairs into the events queue, which the GUI reads with root.after.
+class JobManager:
+    def __init__(self, events, max_running=2):
+        self.events = events
+        self.max_running = max_running
+        self.jobs = []
+        self.waiting = []
+        self.running = 0
+        self.lock = Lock()
+
+    def submit(self, job):
+        with self.lock:
+            self.jobs.append(job)
+            self.waiting.append(job)
+        self.events.put(("update", job))
+        self.start_waiting()
+
+    def start_waiting(self):
+        with self.lock:
+            while self.waiting and self.running < self.max_running:
+                job = self.waiting.pop(0)
+                self.running += 1
+                Thread(target=self.run, args=(job,), daemon=True).start()
+
+    def run(self, job):
+        try:
+            self.solve(job)
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.events.put(("finished", job))
+            self.start_waiting()
+
+    def solve(self, job):
+        os.makedirs(job.directory, exist_ok=True)
+        command = [sys.executable, "solve.py", job.mod_file, job.dat_file, "--oplrun", job.oplrun,
+                   "--output-dir", job.directory]
+        with self.lock:
+            if job.cancelled:
+                job.status = "cancelled"
+                return
+            job.status = "running"
+            job.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                           text=True, bufsize=1)
+        self.events.put(("update", job))
+        with open(os.path.join(job.directory, "solve.log"), "w") as log:
+            for line in job.process.stdout:
+                log.write(line)
+                match = progress_pattern.match(line.strip())
+                if match:
+                    job.progress = match.group(2)
+                    self.events.put(("update", job))
+        job.process.wait()
+        if job.cancelled:
+            job.status = "cancelled"
+        elif job.process.returncode == 0:
+            job.status = "done"
+        else:
+            job.status = f"failed (see {os.path.join(job.directory, 'solve.log')})"
+
+    def cancel(self, job):
+        with self.lock:
+            job.cancelled = True
+            if job in self.waiting:
+                self.waiting.remove(job)
+                job.status = "cancelled"
+                self.events.put(("update", job))
+                return
+            process = job.process
+        if process and process.poll() is None:
+            # solve.py stops oplrun when it is interrupted
+            Thread(target=solve.stop_process, args=(process,), daemon=True).start()
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.cancel(job)
+
+
+# One visualization server for the whole session. Results are switched with its /load route.
+class VisualizationServer:
+    def __init__(self, port=8050):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}/"
+        self.process = None
+        self.ready = Event()
+        # Held while checking and starting the server, so two shows never start two servers
+        self.lock = Lock()
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self, json_file, results_dir):
+        self.ready.clear()
+        command = [sys.executable, "visualize.py", json_file, "--results-dir", results_dir, "--port", str(self.port)]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+        Thread(target=self.read_output, args=(self.process,), daemon=True).start()
+
+    # The server's output is read until it exits, so its pipe never fills up
+    def read_output(self, process):
+        for line in process.stdout:
+            if server_ready_pattern.search(line):
+                self.ready.set()
+
+    # Show the results in results_dir, starting the server if needed. Runs in a worker thread.
+    def show(self, json_file, results_dir):
+        with self.lock:
+            started = not self.running()
+            if started:
+                self.start(json_file, results_dir)
+        if not self.ready.wait(timeout=60):
+            raise RuntimeError("The visualization server did not start.")
+        if not started:
+            response = requests.post(self.url + "load", json={"json_file": json_file, "results_dir": results_dir})
+            if response.status_code != 200:
+                raise RuntimeError(response.text)
+        webbrowser.open_new(self.url)
+
+    def stop(self):
+        try:
+            requests.post(self.url + "shutdown", timeout=2)
+        except requests.ConnectionError:
+            pass  # Server may not be running
+        if self.process:
+            self.process.kill()  # Terminate if still running
+            self.process = None
+
 
 class FileSelectorApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Solve and Visualize")
-        self.server_process = None  # Track the server process
+        self.events = queue.Queue()
+        self.manager = JobManager(self.events)
+        self.server = VisualizationServer()
 
         # Labels to display chosen file paths
         self.dat_label = tk.Label(root, text="No .dat file selected", fg="gray")
@@ -23,6 +182,11 @@ class FileSelectorApp:
         self.json_label = tk.Label(root, text="No .json file selected", fg="gray")
         self.json_label.pack(pady=5)
 
+        oplrun = os.environ.get("OPLRUN")
+        self.oplrun_label = tk.Label(root, text=f"oplrun: {oplrun}" if oplrun else "No oplrun executable selected",
+                                     fg="black" if oplrun else "gray")
+        self.oplrun_label.pack(pady=5)
+
         # Buttons to select files
         self.dat_button = tk.Button(root, text="Choose .dat File", command=self.select_dat_file)
         self.dat_button.pack(pady=5)
@@ -33,6 +197,19 @@ class FileSelectorApp:
         self.json_button = tk.Button(root, text="Choose .json File", command=self.select_json_file)
         self.json_button.pack(pady=5)
 
+        self.oplrun_button = tk.Button(root, text="Choose oplrun Executable", command=self.select_oplrun_file)
+        self.oplrun_button.pack(pady=5)
+
+        # Number of solves that run at the same time
+        concurrency_frame = tk.Frame(root)
+        concurrency_frame.pack(pady=5)
+        tk.Label(concurrency_frame, text="Parallel solves:").pack(side=tk.LEFT)
+        self.concurrency = tk.Spinbox(concurrency_frame, from_=1, to=os.cpu_count() or 1, width=4,
+                                      command=self.set_concurrency)
+        self.concurrency.delete(0, tk.END)
+        self.concurrency.insert(0, str(self.manager.max_running))
+        self.concurrency.pack(side=tk.LEFT)
+
         # Buttons for solving and visualization
         self.solve_button = tk.Button(root, text="Solve", command=self.run_solve)
         self.solve_button.pack(pady=5)
@@ -43,12 +220,21 @@ class FileSelectorApp:
         self.solve_visualize_button = tk.Button(root, text="Solve and Visualize", command=self.run_solve_and_visualize)
         self.solve_visualize_button.pack(pady=5)
 
+        # Job list; Visualize shows the selected job, or the results in the current directory
+        self.job_list = tk.Listbox(root, width=120, height=12)
+        self.job_list.pack(pady=5)
+
+        self.cancel_button = tk.Button(root, text="Cancel Selected Job", command=self.cancel_job)
+        self.cancel_button.pack(pady=5)
+
         # Exit button
         self.exit_button = tk.Button(root, text="Exit", command=self.quit_app)
         self.exit_button.pack(pady=10)
 
         # Store file paths
-        self.file_paths = {"dat": None, "mod": None, "json": None}
+        self.file_paths = {"dat": None, "mod": None, "json": None, "oplrun": oplrun}
+        self.next_job_number = 1
+        self.root.after(200, self.process_events)
 
     def select_dat_file(self):
         file_path = filedialog.askopenfilename(filetypes=[("DAT files", "*.dat")])
@@ -68,79 +254,91 @@ class FileSelectorApp:
             self.file_paths["json"] = file_path
             self.json_label.config(text=f"Selected: {file_path}", fg="black")
 
-    def run_solve(self):
-        Thread(target=self.solve).start()
-
-    def solve(self):
+    def select_oplrun_file(self):
+        file_path = filedialog.askopenfilename()
+        if file_path:
+            self.file_paths["oplrun"] = file_path
+            self.oplrun_label.config(text=f"oplrun: {file_path}", fg="black")
+
+    def set_concurrency(self):
+        self.manager.max_running = int(self.concurrency.get())
+        self.manager.start_waiting()
+
+    # Handle the events of the worker threads in the GUI thread
+    def process_events(self):
+        while True:
+            try:
+                event, job = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event == "error":
+                messagebox.showerror("Error", job)
+                continue
+            self.job_list.delete(job.number - 1)
+            self.job_list.insert(job.number - 1, job.describe())
+            if event == "finished" and job.status == "done" and job.visualize_after:
+                self.visualize(job.json_file, job.directory)
+        self.root.after(200, self.process_events)
+
+    def queue_solve(self, visualize_after=False):
         dat_file = self.file_paths["dat"]
         mod_file = self.file_paths["mod"]
         if not dat_file or not mod_file:
             messagebox.showerror("Error", "Please select both .dat and .mod files.")
             return
+        if visualize_after and not self.file_paths["json"]:
+            messagebox.showerror("Error", "Please select a .json file.")
+            return
+        # Checked here, as the solve would only fail once the job runs
+        oplrun = self.file_paths["oplrun"]
+        if not oplrun or not os.path.isfile(oplrun):
+            messagebox.showerror("Error", "Please select the oplrun executable (or set $OPLRUN).")
+            return
+        job = Job(self.next_job_number, mod_file, dat_file, oplrun, self.file_paths["json"], visualize_after)
+        self.next_job_number += 1
+        self.job_list.insert(tk.END, job.describe())
+        self.manager.submit(job)
 
-        try:
-            command = ["python", "solve.py", mod_file, dat_file]  # Call solve.py with the selected files
-            subprocess.run(command, check=True)
-            messagebox.showinfo("Success", "Solve completed successfully.")
-        except subprocess.CalledProcessError as e:
-            messagebox.showerror("Error", f"Error during solve: {e}")
+    def run_solve(self):
+        self.queue_solve()
 
-    def run_visualize(self):
-        Thread(target=self.visualize).start()
+    def run_solve_and_visualize(self):
+        self.queue_solve(visualize_after=True)
 
-    def visualize(self):
+    def selected_job(self):
+        selection = self.job_list.curselection()
+        return self.manager.jobs[selection[0]] if selection else None
+
+    def run_visualize(self):
         json_file = self.file_paths["json"]
         if not json_file:
             messagebox.showerror("Error", "Please select a .json file.")
             return
-
-        if not os.path.exists("evac.csv") or not os.path.exists("vehicles.csv"):
-            messagebox.showerror("Error", "Required CSV files not found. Please run the solver first.")
+        job = self.selected_job()
+        results_dir = job.directory if job else os.getcwd()
+        if not any(os.path.exists(os.path.join(results_dir, name)) for name in ("results.json", "vehicles.csv")):
+            messagebox.showerror("Error", "No results found. Please run the solver first.")
             return
+        self.visualize(json_file, results_dir)
 
-        try:
-            # Start a new server with the selected JSON file
-            command = ["python", "visualize.py", json_file]
-            self.server_process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            # Wait for the server to become reachable
-            url = "http://127.0.0.1:8050/"
-            for _ in range(30):  # Check for 15 seconds (30 x 0.5)
-                try:
-                    response = requests.get(url)
-                    if response.status_code == 200:
-                        webbrowser.open_new(url)  # Open browser when ready
-                        break
-                except requests.ConnectionError:
-                    time.sleep(0.5)
-
-            messagebox.showinfo("Success", "Visualization started successfully.")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error during visualization: {e}")
+    def visualize(self, json_file, results_dir):
+        def show():
+            try:
+                self.server.show(os.path.abspath(json_file), results_dir)
+            except Exception as e:
+                self.events.put(("error", f"Error during visualization: {e}"))
+        Thread(target=show, daemon=True).start()
+
+    def cancel_job(self):
+        job = self.selected_job()
+        if job:
+            self.manager.cancel(job)
 
     def quit_app(self):
-        self.terminate_server()
+        self.manager.cancel_all()
+        self.server.stop()
         self.root.quit()
 
-    def run_solve_and_visualize(self):
-        Thread(target=self.solve_and_visualize).start()
-
-    def solve_and_visualize(self):
-        if self.server_process:
-            self.terminate_server()
-
-        self.solve()
-        self.visualize()
-
-    def terminate_server(self):
-        try:
-            requests.post("http://127.0.0.1:8050/shutdown")
-        except requests.ConnectionError:
-            pass  # Server may not be running
-        if self.server_process:
-            self.server_process.kill()  # Terminate if still running
-            self.server_process = None
-
 
 # Run the application
 if __name__ == "__main__":
@@ -148,4 +346,3 @@ if __name__ == "__main__":
     root.geometry("1280x960")  # Set default window size to 1280x960
     app = FileSelectorApp(root)
     root.mainloop()
-
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Timing traces shared by the scripts. Tracing is off unless JESDRA_TRACE names a JSON-lines
+# file, so the calls below cost almost nothing by default. Every line of the trace is one record:
+#   {"type": "span", "name", "start", "duration", "pid", "tid", "peak_rss_mb", ...fields}
+#   {"type": "counter", "name", "time", "value", "pid", ...fields}
+# start and time are seconds since the epoch, so the records of several processes (e.g. the
+# workers of sweep.py) can be written into the same file and lined up.
+# Debug messages are only printed when JESDRA_DEBUG is set.
+#
+# python instrument.py trace.jsonl prints the total time of each span name, and
+# --chrome trace.json converts the trace for chrome://tracing or https://ui.perfetto.dev.
+
+trace_path = os.environ.get("JESDRA_TRACE")
+debug_enabled = bool(os.environ.get("JESDRA_DEBUG"))
+enabled = bool(trace_path)
+
+trace_file = None
+trace_lock = threading.Lock()
+
+
+def write_record(record):
+    global trace_file
+    with trace_lock:
+        if trace_file is None:
+            trace_file = open(trace_path, "a", buffering=1)
+        trace_file.write(json.dumps(record) + "\n")
+
+
+# Peak resident memory of this process in MB. With children=True, the peak of the largest
+# finished (waited-for) child process instead: the maximum over the children, not their sum.
+def peak_memory(children=False):
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(usage.ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+# Record a span that has already ended, with its start in seconds since the epoch
+def add_span(name, start, duration, **fields):
+    if not enabled:
+        return
+    write_record({"type": "span", "name": name, "start": round(start, 6), "duration": round(duration, 6),
+                  "pid": os.getpid(), "tid": threading.get_ident(), "peak_rss_mb": peak_memory(), **fields})
+
+
+# Time the block inside it. Fields can be added to the span while it runs through the yielded dict.
+# Also works as a decorator, which records one span per call.
+@contextmanager
+def span(name, **fields):
+    if not enabled:
+        yield fields
+        return
+    start = time.time()
+    counter = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        add_span(name, start, time.perf_counter() - counter, **fields)
+
+
+def count(name, value=1, **fields):
+    if enabled:
+        write_record({"type": "counter", "name": name, "time": round(time.time(), 6), "value": value,
+                      "pid": os.getpid(), **fields})
+
+
+def debug(*values):
+    if debug_enabled:
+        print(*values, flush=True)
+
+
+def read_trace(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Chrome trace event format: complete events for the spans and counter events for the counters
+def chrome_trace(records):
+    events = []
+    for record in records:
+        fields = {key: value for key, value in record.items()
+                  if key not in ("type", "name", "start", "duration", "time", "pid", "tid", "value")}
+        if record["type"] == "span":
+            events.append({"name": record["name"], "ph": "X", "ts": record["start"] * 1e6,
+                           "dur": record["duration"] * 1e6, "pid": record["pid"], "tid": record["tid"],
+                           "args": fields})
+        elif record["type"] == "counter":
+            events.append({"name": record["name"], "ph": "C", "ts": record["time"] * 1e6,
+                           "pid": record["pid"], "args": {record["name"]: record["value"]}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def span_totals(records):
+    totals = defaultdict(lambda: {"name": None, "count": 0, "total": 0.0, "max": 0.0, "peak_rss_mb": None})
+    for record in records:
+        if record["type"] != "span":
+            continue
+        row = totals[record["name"]]
+        row["name"] = record["name"]
+        row["count"] += 1
+        row["total"] += record["duration"]
+        row["max"] = max(row["max"], record["duration"])
+        if record.get("peak_rss_mb") is not None:
+            row["peak_rss_mb"] = max(row["peak_rss_mb"] or 0, record["peak_rss_mb"])
+    rows = sorted(totals.values(), key=lambda row: row["total"], reverse=True)
+    for row in rows:
+        row["mean"] = round(row["total"] / row["count"], 4)
+        row["total"] = round(row["total"], 4)
+        row["max"] = round(row["max"], 4)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a JESDRA_TRACE file or convert it to a Chrome trace.")
+    parser.add_argument("trace_file")
+    parser.add_argument("--chrome", help="Write the trace in the Chrome trace event format to this file.")
+    args = parser.parse_args()
+
+    records = read_trace(args.trace_file)
+    if args.chrome:
+        with open(args.chrome, "w") as f:
+            json.dump(chrome_trace(records), f)
+        print(f"{len(records)} records written to {args.chrome}")
+    rows = span_totals(records)
+    columns = ["name", "count", "total", "mean", "max", "peak_rss_mb"]
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) if rows else len(column)
+              for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row[column]).ljust(widths[column]) for column in columns))
+    counters = defaultdict(float)
+    for record in records:
+        if record["type"] == "counter":
+            counters[record["name"]] += record["value"]
+    for name, value in sorted(counters.items()):
+        print(f"{name}: {value:g}")
@@ -4,17 +4,26 @@ tuple Arc {
     int j;   // End node of the arc
 };
 
+tuple ConflictKey {
+    int n;   // Node of the resource at t1
+    int p;   // Resource
+    int d;   // Periods between t1 and t2
+};
+
 // Define Sets
 {int} I = ...;                   // Set of cells
 {int} S_o = ...;                 // Set of source cells
 {int} S_e = ...;                 // Set of sink cells
 {int} R = ...;                   // Set of road segment cells
 {int} R_prime = ...;             // Subset of road segment cells with downstream nodes
-{int} T = ...;                   // Set of evacuation time periods
+{int} T = ...;                   // Set of evacuation time periods (a window of them for jesdra_window.mod)
 {int} Tp = ...;                  // Set of disaster time periods (T')
 {Arc} A = ...;                   // Set of arcs as tuples (i, j)
 {int} P = ...;                   // Set of resources
 {int} Vp = ...;                  // Set of nodes eligible for resource allocation
+{Arc} activeArcs = ...;          // Arcs that can carry flow within the windows below (precomputed by presolve.py)
+{Arc} inArcs[i in I] = ...;      // Active arcs that end in cell i (precomputed by presolve.py)
+{Arc} outArcs[i in I] = ...;     // Active arcs that start in cell i (precomputed by presolve.py)
 
 // Parameters
 int D[i in S_o] = ...;              // Evacuation demand for source cell i
@@ -30,51 +39,77 @@ float delta[i in R] = ...; // Assume capacity increase from resource allocation
 // Mapping: Road segment cell to downstream node
 int downstreamNode[i in R_prime] = ...;  // Maps cell i in R_prime to its downstream node
 
+// Validity windows (precomputed by presolve.py): vehicles can only be in cell i
+// between the earliest period they can reach it from a source and the latest
+// period from which they can still reach a sink by the end of the horizon
+int earliest[i in I] = ...;
+int latest[i in I] = ...;
+
+// Resource conflicts (precomputed by presolve.py): for 1 <= d <= tau_max[p][n],
+// the nodes n2 that resource p cannot reach from n within d periods (tau[p][n][n2] >= d)
+{ConflictKey} conflictKeys = ...;
+{int} conflictNodes[conflictKeys] = ...;
+
 // Decision Variables
-dvar int+ x[I][T];            // Number of vehicles in cell i at time t
-dvar int+ y[A][T];            // Vehicle flow on arc (i,j) at time t
+// Variables outside the validity windows are fixed to 0
+dvar int+ x[i in I][t in T] in 0..((t >= earliest[i] && t <= latest[i]) ? maxint : 0);            // Number of vehicles in cell i at time t
+dvar int+ y[a in activeArcs][t in T] in 0..((t >= earliest[a.i] && t < latest[a.j]) ? maxint : 0);  // Vehicle flow on arc (i,j) at time t
 
 // Expression 17 & 18
 dvar boolean z[Vp][P][T];       // Resource allocation at node n for resource p at time t
 dvar boolean e[S_o];            // Evacuation decision for source cell i
 
+// Risk of the vehicles in the cells and of the demand left at the sources. The two terms are
+// defined by the constraints ctCellRisk and ctShelterRisk so that jesdra_resolve.mod can
+// change c and D in place.
+dvar float cellRisk;
+dvar float shelterRisk;
+
 // Objective Function
 minimize 
-  sum(i in I, t in T) c[i][t] * x[i][t] +
-  sum(i in S_o, t in Tp) D[i] * c[i][t] * (1 - e[i]);
+  cellRisk + shelterRisk;
 
 // Constraints
+// The labeled constraints keep every variable on the left-hand side, so that their
+// coefficients and bounds can be changed with setCoef, LB and UB (see jesdra_resolve.mod)
 subject to {
+    // Objective terms: sum of c[i][t] * x[i][t], and sum of D[i] * c[i][t] * (1 - e[i])
+    ctCellRisk:
+        cellRisk - sum(i in I, t in T) c[i][t] * x[i][t] >= 0;
+    ctShelterRisk:
+        shelterRisk + sum(i in S_o) (sum(t in Tp) D[i] * c[i][t]) * e[i] >= sum(i in S_o, t in Tp) D[i] * c[i][t];
+
     // Flow Balance (Expression 2)
-    forall (i in I, t in T: t > 1)
+    forall (i in I, t in T: t > first(T) && t >= earliest[i] && t <= latest[i] + 1)
         x[i][t] == x[i][t-1] +
-                  sum(a in A: a.j == i) y[a][t-1] -
-                  sum(a in A: a.i == i) y[a][t-1];
+                  sum(a in inArcs[i]) y[a][t-1] -
+                  sum(a in outArcs[i]) y[a][t-1];
 
     // Total Evacuation by Time T (Expression 3)
-    sum(i in S_e) x[i][card(T)] == sum(i in S_o) D[i] * e[i];
+    ctTotalEvacuation:
+        sum(i in S_e) x[i][last(T)] - sum(i in S_o) D[i] * e[i] == 0;
 
     // Capacity Constraints (Expressions 4-9)
-    forall (i in R, t in T: t < card(T))
+    forall (i in R, t in T: t < last(T) && t >= earliest[i] - 1 && t <= latest[i])
       // Expression 4
-        sum(a in A: a.j == i) y[a][t] <= s_factor[i] * (N[i] - x[i][t]);
+        ctHolding: sum(a in inArcs[i]) y[a][t] + s_factor[i] * x[i][t] <= s_factor[i] * N[i];
 
-    forall (i in I, t in T: t < card(T))
+    forall (i in I, t in T: t < last(T) && t >= earliest[i] && t <= latest[i])
       // Expression 5
-        sum(a in A: a.i == i) y[a][t] <= x[i][t];
+        sum(a in outArcs[i]) y[a][t] <= x[i][t];
 
-	forall (i in R diff R_prime, t in T: t < card(T)) {
+	forall (i in R diff R_prime, t in T: t < last(T) && t >= earliest[i] - 1 && t <= latest[i]) {
 	    // Expression 6
-	    sum(a in A: a.j == i) y[a][t] <= Q[i];
+	    ctInflowCapacity: sum(a in inArcs[i]) y[a][t] <= Q[i];
 	    
 	    // Expression 7
-	    sum(a in A: a.i == i) y[a][t] <= Q[i];
+	    ctOutflowCapacity: sum(a in outArcs[i]) y[a][t] <= Q[i];
 	}
 
-	forall (i in R_prime, t in T: t < card(T)) {
+	forall (i in R_prime, t in T: t < last(T) && t >= earliest[i] - 1 && t <= latest[i]) {
 	    // Updated constraints for flow
-	    sum(a in A: a.j == i) y[a][t] <= Q[i] + sum(p in P: downstreamNode[i] in Vp) z[downstreamNode[i]][p][t] * delta[i];
-	    sum(a in A: a.i == i) y[a][t] <= Q[i] + sum(p in P: downstreamNode[i] in Vp) z[downstreamNode[i]][p][t] * delta[i];
+	    ctInflowResource: sum(a in inArcs[i]) y[a][t] - sum(p in P: downstreamNode[i] in Vp) delta[i] * z[downstreamNode[i]][p][t] <= Q[i];
+	    ctOutflowResource: sum(a in outArcs[i]) y[a][t] - sum(p in P: downstreamNode[i] in Vp) delta[i] * z[downstreamNode[i]][p][t] <= Q[i];
 	}
 
     // Resource Allocation (Expressions 10-12)
@@ -87,24 +122,24 @@ subject to {
         sum(n in Vp) z[n][p][t] <= 1;
 
 	// Expression 12
-    // Fixed t2 filter using precomputed tau_max
-    forall (n in Vp, p in P, t1 in T, t2 in T: t2 - t1 <= tau_max[p][n])
-        z[n][p][t1] + sum(n2 in Vp: t1 + tau[p][n][n2] >= t2) z[n2][p][t2] <= 1;
+    // Only the (n, p, t1, t2 = t1 + d) combinations with a conflict are generated
+    forall (k in conflictKeys, t1 in T: t1 + k.d <= last(T))
+        z[k.n][k.p][t1] + sum(n2 in conflictNodes[k]) z[n2][k.p][t1 + k.d] <= 1;
 
     // Initial Conditions (Expressions 13-14)
     // Expression 13
     forall (i in S_o)
-        x[i][1] == D[i] * e[i];
+        ctInitialSource: x[i][first(T)] - D[i] * e[i] == 0;
 
 	// Expression 14
     forall (i in I diff S_o)
-        x[i][1] == 0;
+        ctInitialEmpty: x[i][first(T)] == 0;
 
     // Non-Negativity (Expressions 15-16)
-    forall (i in I, t in T)
+    forall (i in I, t in T: t >= earliest[i] && t <= latest[i])
         x[i][t] >= 0;
 
-    forall (a in A, t in T: t < card(T))
+    forall (a in activeArcs, t in T: t < last(T) && t >= earliest[a.i] && t < latest[a.j])
         y[a][t] >= 0;
 
 }
@@ -118,13 +153,47 @@ execute {
     // Write vehicle counts in cells over time to CSV format
     writeln("vehicles.csv:");
     for (i in I) {
+        var separator = "";
         for (t in T) {
-            write(x[i][t]);
-            if (t < T.size) 
-                write(",");
-            else
-                writeln();
+            write(separator, x[i][t]);
+            separator = ",";
         }
+        writeln();
+    }
+
+    // Order of the rows and columns of vehicles.csv
+    writeln("cells:");
+    var first = true;
+    for (i in I) {
+        if (!first)
+            write(",");
+        write(i);
+        first = false;
+    }
+    writeln();
+    writeln("periods:");
+    first = true;
+    for (t in T) {
+        if (!first)
+            write(",");
+        write(t);
+        first = false;
     }
+    writeln();
+
+    // Nonzero arc flows as i,j,t,value rows
+    writeln("flows.coo:");
+    for (a in activeArcs)
+        for (t in T)
+            if (y[a][t] > 0)
+                writeln(a.i, ",", a.j, ",", t, ",", y[a][t]);
+
+    // Resource allocations as n,p,t rows
+    writeln("allocations.coo:");
+    for (n in Vp)
+        for (p in P)
+            for (t in T)
+                if (z[n][p][t] > 0.5)
+                    writeln(n, ",", p, ",", t);
 }
 
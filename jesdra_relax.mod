@@ -0,0 +1,36 @@
+// Solves the LP relaxation of jesdra.mod for the fast mode of solve.py:
+//   oplrun jesdra_relax.mod relax.dat
+// relax.dat names the model and data files. The relaxed objective is a lower bound on the
+// objective of the model. It is printed with the relaxed e and the nonzero relaxed z, which
+// relaxation.py rounds into a plan.
+
+string modelFile = ...;
+string dataFile = ...;
+
+main {
+    var source = new IloOplModelSource(thisOplModel.modelFile);
+    var definition = new IloOplModelDefinition(source);
+    var opl = new IloOplModel(definition, cplex);
+    opl.addDataSource(new IloOplDataSource(thisOplModel.dataFile));
+    writeln("<<< generate");
+    opl.generate();
+    opl.convertAllIntVars();
+
+    writeln("<<< solve");
+    if (cplex.solve()) {
+        writeln("LP_BOUND: ", cplex.getObjValue());
+        writeln("relaxed e:");
+        for (var i in opl.S_o)
+            writeln(i, ",", opl.e[i].solutionValue);
+        writeln("relaxed z:");
+        for (var n in opl.Vp)
+            for (var p in opl.P)
+                for (var t in opl.T)
+                    if (opl.z[n][p][t].solutionValue > 1e-6)
+                        writeln(n, ",", p, ",", t, ",", opl.z[n][p][t].solutionValue);
+    } else {
+        writeln("No solution found");
+    }
+    writeln("<<< done");
+    opl.end();
+}
@@ -0,0 +1,160 @@
+// Solves a queue of scenarios of jesdra.mod in one oplrun process:
+//   oplrun jesdra_resolve.mod queue.dat
+// The queue .dat is written by scenario_queue.py. The model is generated once from the base
+// data. Before each scenario its deltas are applied to the data in memory and to the
+// generated model in place, by changing the coefficients and bounds of the labeled
+// constraints of jesdra.mod, so CPLEX also starts from the solution of the previous scenario.
+// The model is only generated again for a structural delta (downstreamNode), which changes
+// the variables of the constraints. Each scenario's output starts with a "scenario: <number>"
+// line.
+
+tuple Delta {
+    int scenario;
+    string param;    // D, Q, N, s_factor, delta, c or downstreamNode
+    int i;
+    int t;           // Only used by c
+    float value;
+}
+
+string modelFile = ...;
+string dataFile = ...;
+
+{int} scenarios = ...;
+{Delta} deltas = ...;
+
+main {
+    function contains(set, value) {
+        for (var v in set)
+            if (v == value)
+                return true;
+        return false;
+    }
+
+    // Periods of the capacity constraints (Expressions 4, 6 and 7) of road cell i
+    function capacityPeriod(opl, i, t) {
+        return t < lastPeriod && t >= opl.earliest[i] - 1 && t <= opl.latest[i];
+    }
+
+    // Changes the generated model for a delta that is already applied to data
+    function applyDelta(opl, data, d) {
+        var i = d.i;
+        var t;
+        if (d.param == "D") {
+            opl.ctInitialSource[i].setCoef(opl.e[i], -d.value);
+            opl.ctTotalEvacuation.setCoef(opl.e[i], -d.value);
+        } else if (d.param == "c") {
+            if (contains(opl.T, d.t))
+                opl.ctCellRisk.setCoef(opl.x[i][d.t], -d.value);
+        } else if (d.param == "Q") {
+            var resource = contains(opl.R_prime, i);
+            for (t in opl.T) {
+                if (!capacityPeriod(opl, i, t))
+                    continue;
+                if (resource) {
+                    opl.ctInflowResource[i][t].UB = d.value;
+                    opl.ctOutflowResource[i][t].UB = d.value;
+                } else {
+                    opl.ctInflowCapacity[i][t].UB = d.value;
+                    opl.ctOutflowCapacity[i][t].UB = d.value;
+                }
+            }
+        } else if (d.param == "N" || d.param == "s_factor") {
+            for (t in opl.T) {
+                if (!capacityPeriod(opl, i, t))
+                    continue;
+                opl.ctHolding[i][t].setCoef(opl.x[i][t], data.s_factor[i]);
+                opl.ctHolding[i][t].UB = data.s_factor[i] * data.N[i];
+            }
+        } else if (d.param == "delta") {
+            if (!contains(opl.R_prime, i) || !contains(opl.Vp, opl.downstreamNode[i]))
+                return;
+            var n = opl.downstreamNode[i];
+            for (t in opl.T) {
+                if (!capacityPeriod(opl, i, t))
+                    continue;
+                for (var p in opl.P) {
+                    opl.ctInflowResource[i][t].setCoef(opl.z[n][p][t], -d.value);
+                    opl.ctOutflowResource[i][t].setCoef(opl.z[n][p][t], -d.value);
+                }
+            }
+        }
+    }
+
+    // Coefficients and bound of ctShelterRisk after a change of D or c
+    function updateShelterRisk(opl, data) {
+        var total = 0;
+        for (var i in opl.S_o) {
+            var risk = 0;
+            for (var t in opl.Tp)
+                risk += data.c[i][t];
+            opl.ctShelterRisk.setCoef(opl.e[i], data.D[i] * risk);
+            total += data.D[i] * risk;
+        }
+        opl.ctShelterRisk.LB = total;
+    }
+
+    var definition = new IloOplModelDefinition(new IloOplModelSource(thisOplModel.modelFile));
+    var base = new IloOplModel(definition, cplex);
+    base.addDataSource(new IloOplDataSource(thisOplModel.dataFile));
+    base.generate();
+    var data = base.dataElements;
+    var opl = base;
+    var lastPeriod = 0;
+    for (var t in base.T)
+        lastPeriod = t;
+
+    for (var s in thisOplModel.scenarios) {
+        var structural = false;
+        var risk = false;
+        for (var d in thisOplModel.deltas) {
+            if (d.scenario != s)
+                continue;
+            if (d.param == "D")
+                data.D[d.i] = d.value;
+            else if (d.param == "Q")
+                data.Q[d.i] = d.value;
+            else if (d.param == "N")
+                data.N[d.i] = d.value;
+            else if (d.param == "s_factor")
+                data.s_factor[d.i] = d.value;
+            else if (d.param == "delta")
+                data.delta[d.i] = d.value;
+            else if (d.param == "c")
+                data.c[d.i][d.t] = d.value;
+            else if (d.param == "downstreamNode")
+                data.downstreamNode[d.i] = d.value;
+            if (d.param == "downstreamNode")
+                structural = true;
+            if (d.param == "D" || d.param == "c")
+                risk = true;
+        }
+        if (structural) {
+            // The base model owns the data elements, so it is kept until the end
+            if (opl != base)
+                opl.end();
+            opl = new IloOplModel(definition, cplex);
+            opl.addDataSource(data);
+            opl.generate();
+        } else {
+            for (var d in thisOplModel.deltas)
+                if (d.scenario == s)
+                    applyDelta(opl, data, d);
+            if (risk)
+                updateShelterRisk(opl, data);
+        }
+
+        // Same phase markers and objective line as a plain oplrun run, for solve.py
+        writeln("scenario: ", s);
+        writeln("<<< solve");
+        if (cplex.solve()) {
+            writeln("OBJECTIVE: ", cplex.getObjValue());
+            writeln("<<< post process");
+            opl.postProcess();
+        } else {
+            writeln("No solution found");
+        }
+    }
+    if (opl != base)
+        opl.end();
+    base.end();
+}
@@ -0,0 +1,60 @@
+// Solves jesdra.mod from a MIP start written by warm_start.py:
+//   oplrun jesdra_start.mod start.dat
+// The start .dat names the model and data files and holds the start values of e, x and y,
+// indexed like the decision variables of the model. With fixE, e is kept at its start value
+// and only the flows and resources are optimized (the polish of the fast mode of solve.py).
+
+tuple Arc {
+    int i;
+    int j;
+}
+
+string modelFile = ...;
+string dataFile = ...;
+
+{int} I = ...;
+{int} S_o = ...;
+{int} T = ...;
+{Arc} activeArcs = ...;
+
+int eStart[S_o] = ...;
+int xStart[I][T] = ...;
+int yStart[activeArcs][T] = ...;
+
+int fixE = ...;          // 1 to keep e at eStart
+float timeLimit = ...;   // Time limit of the solve in seconds, 0 for none
+
+main {
+    var source = new IloOplModelSource(thisOplModel.modelFile);
+    var definition = new IloOplModelDefinition(source);
+    var opl = new IloOplModel(definition, cplex);
+    opl.addDataSource(new IloOplDataSource(thisOplModel.dataFile));
+    writeln("<<< generate");
+    opl.generate();
+
+    var vectors = new IloOplCplexVectors();
+    vectors.attach(opl.e, thisOplModel.eStart);
+    vectors.attach(opl.x, thisOplModel.xStart);
+    vectors.attach(opl.y, thisOplModel.yStart);
+    vectors.setStart(cplex);
+
+    if (thisOplModel.fixE == 1) {
+        for (var i in thisOplModel.S_o) {
+            opl.e[i].LB = thisOplModel.eStart[i];
+            opl.e[i].UB = thisOplModel.eStart[i];
+        }
+    }
+    if (thisOplModel.timeLimit > 0)
+        cplex.tilim = thisOplModel.timeLimit;
+
+    // Same phase markers and objective line as a plain oplrun run, for solve.py
+    writeln("<<< solve");
+    if (cplex.solve()) {
+        writeln("OBJECTIVE: ", cplex.getObjValue());
+        writeln("<<< post process");
+        opl.postProcess();
+    } else {
+        writeln("No solution found");
+    }
+    opl.end();
+}
@@ -0,0 +1,80 @@
+// One window of the rolling-horizon decomposition of jesdra.mod (see rolling_horizon.py):
+//   oplrun jesdra_window.mod state.dat
+// The state .dat names the model and the data of the window, whose T holds the periods of the
+// window only, and holds the state left by the previous window. The model is generated for
+// the window and then changed in place through its labeled constraints:
+// - later windows start from the vehicles x0 instead of the demand at the sources
+//   (Expressions 13-14), and keep the decisions eFixed of the first window
+// - only the final window has to bring every evacuated vehicle to a sink (Expression 3)
+// - the demand left at the sources is charged over the periods of the window, like the
+//   vehicles in the cells
+
+string modelFile = ...;
+string dataFile = ...;
+
+{int} I = ...;
+{int} S_o = ...;
+
+int firstWindow = ...;             // 1 for the first window
+int finalWindow = ...;             // 1 for the window that ends with the last period
+int x0[I] = ...;                   // Vehicles in each cell at the first period of a later window
+int eFixed[S_o] = ...;             // Evacuation decisions of the first window
+
+main {
+    function contains(set, value) {
+        for (var v in set)
+            if (v == value)
+                return true;
+        return false;
+    }
+
+    var source = new IloOplModelSource(thisOplModel.modelFile);
+    var definition = new IloOplModelDefinition(source);
+    var opl = new IloOplModel(definition, cplex);
+    opl.addDataSource(new IloOplDataSource(thisOplModel.dataFile));
+    writeln("<<< generate");
+    opl.generate();
+
+    var i;
+    if (thisOplModel.firstWindow == 0) {
+        // x0 >= 0, so the upper bounds are raised before the lower bounds
+        for (i in thisOplModel.S_o) {
+            opl.e[i].UB = thisOplModel.eFixed[i];
+            opl.e[i].LB = thisOplModel.eFixed[i];
+            opl.ctInitialSource[i].setCoef(opl.e[i], 0);
+            opl.ctInitialSource[i].UB = thisOplModel.x0[i];
+            opl.ctInitialSource[i].LB = thisOplModel.x0[i];
+        }
+        for (i in thisOplModel.I) {
+            if (contains(thisOplModel.S_o, i))
+                continue;
+            opl.ctInitialEmpty[i].UB = thisOplModel.x0[i];
+            opl.ctInitialEmpty[i].LB = thisOplModel.x0[i];
+        }
+    }
+    if (thisOplModel.finalWindow == 0) {
+        opl.ctTotalEvacuation.LB = -Infinity;
+        opl.ctTotalEvacuation.UB = Infinity;
+    }
+
+    var total = 0;
+    for (i in opl.S_o) {
+        var risk = 0;
+        for (var t in opl.T)
+            risk += opl.c[i][t];
+        opl.ctShelterRisk.setCoef(opl.e[i], opl.D[i] * risk);
+        total += opl.D[i] * risk;
+    }
+    opl.ctShelterRisk.LB = total;
+
+    // Same phase markers and objective line as a plain oplrun run, for solve.py
+    writeln("<<< solve");
+    if (cplex.solve()) {
+        writeln("OBJECTIVE: ", cplex.getObjValue());
+        writeln("<<< post process");
+        opl.postProcess();
+    } else {
+        writeln("No solution found");
+    }
+    opl.end();
+}
@@ -0,0 +1,278 @@
+import argparse
+import heapq
+import json
+import math
+import sys
+import time
+import numpy as np
+import calculate_tau
+import dat_io
+import instrument
+import presolve
+
+# Incremental updates of a network during an incident: edges of the resource graph are closed,
+# reopened or get another weight, and the road cells get another Q, N or s_factor. Instead of
+# computing tau again from scratch, the distances from each node in Vp to every node (saved by
+# calculate_tau.py --save-distances) are updated:
+#   longer edges  only rows of Vp nodes with a shortest path over the edge can change. In those
+#                 rows, the nodes that are only reached through the edge are found in the order
+#                 of their distance, and only their distances are computed again.
+#   shorter edges the rows where the edge gives a shorter path to one of its ends are updated
+#                 by a Dijkstra search from that end, which stops where nothing improves
+# This is the dynamic shortest path update of Ramalingam and Reps, for each row of Vp.
+# Only the .dat blocks that change are written: tau and tau_max, the conflicts of presolve.py
+# for the changed rows of tau, and the cell parameters.
+#
+# Changes are given as JSON:
+#   {"edges": [{"nodes": ["3", "5"], "closed": true},     close an edge
+#              {"nodes": ["3", "5"], "closed": false},    reopen it with its weight before the closure
+#              {"nodes": ["4", "6"], "weight": 7.5}],     set the weight (adds the edge if needed)
+#    "cells": [{"cell": 12, "Q": 0, "N": 4}]}             change the parameters of a road cell
+
+cell_parameters = ("Q", "N", "s_factor")
+
+
+# Distances from the nodes in Vp to every node of an undirected graph, kept up to date under edge changes
+class NetworkDistances:
+    def __init__(self, nodes, edges, vp, distance=None, closed=()):
+        self.nodes = list(nodes)
+        self.node_to_index = {node: i for i, node in enumerate(self.nodes)}
+        self.vp = list(vp)
+        self.vp_index = np.array([self.node_to_index[node] for node in self.vp], dtype=np.int64)
+        self.adjacency = [{} for _ in self.nodes]
+        for node1, node2, weight in edges:
+            i, j = self.node_to_index[node1], self.node_to_index[node2]
+            self.set_weight(i, j, min(weight, self.weight(i, j)))
+        # Weight of each closed edge (by its sorted nodes) for when it is reopened
+        self.closed = {tuple(sorted((node1, node2))): weight for node1, node2, weight in closed}
+        if distance is None:
+            distance = calculate_tau.dijkstra_distances(self.nodes, self.edges(), self.vp)
+        self.distance = np.array(distance, dtype=float)
+
+    def edges(self):
+        return [(self.nodes[i], self.nodes[j], weight) for i, row in enumerate(self.adjacency)
+                for j, weight in row.items() if i < j]
+
+    def weight(self, i, j):
+        return self.adjacency[i].get(j, math.inf)
+
+    def set_weight(self, i, j, weight):
+        if math.isinf(weight):
+            self.adjacency[i].pop(j, None)
+            self.adjacency[j].pop(i, None)
+        else:
+            self.adjacency[i][j] = weight
+            self.adjacency[j][i] = weight
+
+    # Dijkstra's algorithm on one row of the distances, from the (distance, node) entries in queue.
+    # Nodes are only visited while their distance improves.
+    def propagate(self, row, queue):
+        distance = self.distance[row]
+        heapq.heapify(queue)
+        while queue:
+            d, i = heapq.heappop(queue)
+            if d > distance[i]:
+                continue
+            for j, weight in self.adjacency[i].items():
+                if d + weight < distance[j]:
+                    distance[j] = d + weight
+                    heapq.heappush(queue, (d + weight, j))
+
+    # Distances of one row after the edge into child got longer. The affected nodes are those whose
+    # shortest paths all lead through it; they are found in the order of their distance, so every
+    # predecessor of a node is decided before the node. Returns whether the row changed.
+    def lengthen(self, row, child):
+        distance = self.distance[row]
+
+        def tight(u, v, weight):
+            return abs(distance[u] + weight - distance[v]) <= 1e-9 * max(1.0, abs(distance[v]))
+
+        affected = set()
+        queue = [(distance[child], child)]
+        while queue:
+            _, v = heapq.heappop(queue)
+            if v in affected:
+                continue
+            if any(u not in affected and tight(u, v, weight) for u, weight in self.adjacency[v].items()):
+                continue
+            affected.add(v)
+            for u, weight in self.adjacency[v].items():
+                if u not in affected and tight(v, u, weight):
+                    heapq.heappush(queue, (distance[u], u))
+        if not affected:
+            return False
+
+        # Start the affected nodes from their best unaffected neighbor
+        for v in affected:
+            distance[v] = math.inf
+        seeds = []
+        for v in affected:
+            best = min((distance[u] + weight for u, weight in self.adjacency[v].items() if u not in affected),
+                       default=math.inf)
+            if best < distance[v]:
+                distance[v] = best
+                seeds.append((best, v))
+        self.propagate(row, seeds)
+        return True
+
+    # Apply (node1, node2, weight) changes, where weight is math.inf to close the edge and None
+    # to reopen it. Returns the rows of Vp whose distances were updated.
+    @instrument.span("network.update")
+    def apply(self, changes):
+        updated = set()
+        for node1, node2, weight in changes:
+            key = tuple(sorted((node1, node2)))
+            i, j = self.node_to_index[node1], self.node_to_index[node2]
+            old = self.weight(i, j)
+            if weight is None:
+                if key not in self.closed:
+                    raise ValueError(f"The edge between {node1} and {node2} is not closed")
+                weight = self.closed.pop(key)
+            elif math.isinf(weight) and not math.isinf(old):
+                self.closed[key] = old
+            if weight == old:
+                continue
+
+            d = self.distance
+            self.set_weight(i, j, weight)
+            for a, b in ((i, j), (j, i)):
+                if weight > old:
+                    # Rows where the edge from a to b is on a shortest path to b
+                    rows = np.flatnonzero(np.isfinite(d[:, a]) & np.isclose(d[:, a] + old, d[:, b]))
+                    updated.update(row for row in rows.tolist() if self.lengthen(row, b))
+                else:
+                    candidate = d[:, a] + weight
+                    for row in np.flatnonzero(candidate < d[:, b]).tolist():
+                        d[row, b] = candidate[row]
+                        self.propagate(row, [(candidate[row], b)])
+                        updated.add(row)
+        return sorted(updated)
+
+    def tau(self, speeds):
+        return calculate_tau.tau_from_distances(self.distance[:, self.vp_index], self.vp, speeds)
+
+
+def load_network(path):
+    saved = calculate_tau.load_distances(path)
+    network = NetworkDistances(saved["nodes"], saved["edges"], saved["vp"], saved["distance"], saved["closed"])
+    return network, saved["speeds"]
+
+
+def save_network(path, network, speeds):
+    closed = [(node1, node2, weight) for (node1, node2), weight in network.closed.items()]
+    calculate_tau.save_distances(path, network.nodes, network.edges(), network.vp, speeds, network.distance, closed)
+
+
+# Edge changes of a changes dict as (node1, node2, weight) for NetworkDistances.apply
+def edge_changes(changes):
+    edges = []
+    for change in changes.get("edges", []):
+        node1, node2 = (str(node) for node in change["nodes"])
+        if "closed" in change:
+            edges.append((node1, node2, math.inf if change["closed"] else None))
+        else:
+            edges.append((node1, node2, float(change["weight"])))
+    return edges
+
+
+# Blocks of the cell parameters with the changes of a changes dict applied
+def cell_blocks(data, changes):
+    position = {cell: k for k, cell in enumerate(np.asarray(data["R"]).tolist())}
+    arrays = {}
+    for change in changes.get("cells", []):
+        cell = int(change["cell"])
+        if cell not in position:
+            raise ValueError(f"Cell {cell} is not a road cell")
+        for name in cell_parameters:
+            if name in change:
+                values = arrays.get(name, np.asarray(data[name]))
+                arrays[name] = np.array(values, dtype=np.result_type(values, change[name]))
+                arrays[name][position[cell]] = change[name]
+    return {name: dat_io.format_array(values) for name, values in arrays.items()}
+
+
+# Conflict blocks of presolve.py with the keys of the given (resource index, node index) rows made
+# again. The node sets of the other keys are kept as they are written in the literals, unparsed.
+def conflict_blocks(literals, vp, resources, periods, tau, tau_max, rows):
+    vp, resources = np.asarray(vp), np.asarray(resources)
+    keys = np.array(dat_io.number_pattern.findall(literals["conflictKeys"]), dtype=np.int64).reshape(-1, 3)
+    node_sets = [chunk.strip().lstrip(",").strip() + "}" for chunk in literals["conflictNodes"][1:-1].split("}")[:-1]]
+    changed = {(int(vp[n_index]), int(resources[p_index])) for p_index, n_index in rows}
+    keep = [k for k, (n, p, _) in enumerate(keys.tolist()) if (n, p) not in changed]
+    new_keys, new_nodes = presolve.resource_conflicts(vp, resources, tau, tau_max, periods - 1, rows)
+    keys = np.vstack([keys[keep], new_keys])
+    node_sets = [node_sets[k] for k in keep] + [dat_io.format_set(nodes) for nodes in new_nodes]
+    # Same order as presolve.resource_conflicts: by resource, node and offset
+    vp_position = {n: k for k, n in enumerate(vp.tolist())}
+    resource_position = {p: k for k, p in enumerate(resources.tolist())}
+    order = np.lexsort((keys[:, 2], [vp_position[n] for n in keys[:, 0].tolist()],
+                        [resource_position[p] for p in keys[:, 1].tolist()]))
+    return {
+        "conflictKeys": dat_io.format_set(keys[order]),
+        "conflictNodes": "[" + ",\n".join(node_sets[k] for k in order.tolist()) + "]",
+    }
+
+
+# Blocks of tau, tau_max and the conflicts for the rows of tau that changed.
+# Returns the blocks and the number of (resource, node, node) entries of tau that changed.
+def tau_blocks(literals, data, old_tau, old_tau_max, tau, tau_max):
+    changed = tau != old_tau
+    rows = [tuple(row) for row in np.argwhere(changed.any(axis=2) | (tau_max != old_tau_max)).tolist()]
+    if not rows:
+        return {}, 0
+    blocks = calculate_tau.format_tau_blocks(tau, tau_max)
+    if "conflictKeys" in literals:
+        blocks.update(conflict_blocks(literals, data["Vp"], data["P"], len(data["T"]), tau, tau_max, rows))
+    return blocks, int(changed.sum())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply road closures and capacity changes to a .dat file "
+                                                 "without computing tau from scratch.")
+    parser.add_argument("distances", help="Sidecar of calculate_tau.py --save-distances, updated in place.")
+    parser.add_argument("dat_file", help=".dat file whose changed blocks are written in place.")
+    parser.add_argument("--changes", help="JSON file with the edge and cell changes.")
+    parser.add_argument("--close", action="append", default=[], metavar="NODE1,NODE2", help="Close an edge.")
+    parser.add_argument("--reopen", action="append", default=[], metavar="NODE1,NODE2", help="Reopen a closed edge.")
+    args = parser.parse_args()
+
+    changes = {}
+    if args.changes:
+        with open(args.changes, "r") as f:
+            changes = json.load(f)
+    changes.setdefault("edges", [])
+    changes["edges"] += [{"nodes": edge.split(","), "closed": True} for edge in args.close]
+    changes["edges"] += [{"nodes": edge.split(","), "closed": False} for edge in args.reopen]
+
+    start = time.perf_counter()
+    network, speeds = load_network(args.distances)
+    # Only the blocks that are needed are parsed, the .dat file can be large. tau in the .dat
+    # file is the tau of the saved distances, so it does not have to be read either.
+    with open(args.dat_file, "r") as f:
+        text = f.read()
+    literals = dat_io.block_literals(text, ("Vp", "P", "T", "R", *cell_parameters, "conflictKeys", "conflictNodes"))
+    names = ["Vp", "P", "T"]
+    if changes.get("cells"):
+        names += ["R", *cell_parameters]
+    data = {name: dat_io.parse_value(literals[name])[1] for name in names}
+    if [str(node) for node in np.asarray(data["Vp"]).tolist()] != network.vp:
+        print(f"Vp in {args.dat_file} differs from Vp in {args.distances}")
+        sys.exit(1)
+
+    old_tau, old_tau_max = network.tau(speeds)
+    rows = network.apply(edge_changes(changes))
+    try:
+        tau, tau_max = network.tau(speeds)
+    except ValueError as e:
+        # Nothing is written, so the closures can be given again without the one that cut the network
+        print(f"The changes disconnect the resource graph: {e}")
+        sys.exit(1)
+    blocks, changed_entries = tau_blocks(literals, data, old_tau, old_tau_max, tau, tau_max)
+    if changes.get("cells"):
+        blocks.update(cell_blocks(data, changes))
+    if blocks:
+        dat_io.write_blocks(args.dat_file, blocks)
+    save_network(args.distances, network, speeds)
+    print(f"{len(changes['edges'])} edge changes and {len(changes.get('cells', []))} cell changes applied in "
+          f"{time.perf_counter() - start:.3f} s: {len(rows)} of {len(network.vp)} rows of Vp updated, "
+          f"{changed_entries} entries of tau changed, blocks written: {', '.join(blocks) or 'none'}")
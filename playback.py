@@ -0,0 +1,76 @@
+import csv
+import os
+import numpy as np
+import results_io
+
+# Per-timestep colours and counts for the heatmap, precomputed for the whole
+# cells x time steps matrix so that playback only has to look them up.
+
+
+# Heatmap colour of every cell at every time step, normalized by the max count of the time step.
+# vehicle_counts has one row per cell, evacuated has one entry per cell (False for shelter-in-place).
+# Returns the red, green and blue components as integer arrays of the same shape as vehicle_counts.
+def color_components(vehicle_counts, evacuated):
+    counts = np.asarray(vehicle_counts, dtype=float)
+    # Max vehicle count of each time step; a time step without vehicles is all blue
+    max_count = counts.max(axis=0, initial=0)
+    normalized = counts / np.where(max_count == 0, 1, max_count)
+    r = (255 * normalized).astype(int)  # Red increases with count
+    g = (255 * (1 - normalized) * normalized * 4).astype(int)  # Creates purple-orange transition
+    b = (255 * (1 - normalized)).astype(int)  # Blue decreases with count
+
+    # Black for no evacuation order
+    restricted = ~np.asarray(evacuated, dtype=bool)
+    for component in (r, g, b):
+        component[restricted] = 0
+    return r, g, b
+
+
+class Playback:
+    def __init__(self, vehicle_counts, evacuated):
+        self.counts = np.asarray(vehicle_counts, dtype=np.int64).reshape(len(evacuated), -1)
+        self.n_cells, self.n_time_steps = self.counts.shape
+        self.max_counts = self.counts.max(axis=0, initial=0)
+        r, g, b = color_components(self.counts, evacuated)
+        self.rgb = np.stack([r, g, b], axis=-1)
+        self.colors = np.array([[f"rgb({r},{g},{b})" for r, g, b in row] for row in self.rgb.tolist()],
+                               dtype=object).reshape(self.n_cells, self.n_time_steps)
+
+    # Cells whose colour or count differs between two time steps
+    def changed_cells(self, previous, current):
+        if previous is None:
+            return np.arange(self.n_cells)
+        return np.flatnonzero((self.counts[:, previous] != self.counts[:, current]) |
+                              (self.colors[:, previous] != self.colors[:, current]))
+
+
+# Vehicle counts and evacuation orders of loaded results_io arrays (e.g. an archived run),
+# with the rows of x put in the order of cell_numbers
+def result_counts(results, cell_numbers):
+    row_of_cell = {cell: row for row, cell in enumerate(results["cells"].tolist())}
+    vehicle_counts = results["x"][[row_of_cell[cell] for cell in cell_numbers]]
+    evacuation_orders = dict(zip(results["sources"].tolist(), results["e"].tolist()))
+    return vehicle_counts, evacuation_orders
+
+
+# Vehicle counts (one row per cell in cell_numbers) and evacuation orders by source of the
+# solver output in results_dir, from the binary results if they exist or else the CSV files
+def read_results(results_dir, cell_numbers):
+    if results_io.has_results(results_dir):
+        # Memory-mapped binary output of solve.py
+        return result_counts(results_io.load_results(results_dir), cell_numbers)
+
+    # Read vehicle counts
+    vehicle_counts = []
+    with open(os.path.join(results_dir, 'vehicles.csv'), 'r') as vehicles_file:
+        reader = csv.reader(vehicles_file)
+        for row in reader:
+            vehicle_counts.append([int(value) for value in row])
+
+    evacuation_orders = {}
+    with open(os.path.join(results_dir, 'evac.csv'), 'r') as evac_file:
+        reader = csv.reader(evac_file)
+        for row in reader:
+            cell_number = int(row[0])
+            evacuation_orders[cell_number] = int(row[1])  # 1: evacuation order, 0: no order
+    return vehicle_counts, evacuation_orders
@@ -0,0 +1,157 @@
+import argparse
+from collections import deque
+import numpy as np
+import dat_io
+import instrument
+
+# Derived data blocks that jesdra.mod reads from the .dat file instead of
+# recomputing them while the model is generated:
+#   inArcs[i]   arcs that end in cell i (a.j == i)
+#   outArcs[i]  arcs that start in cell i (a.i == i)
+#   earliest[i] first period in which cell i can hold vehicles, as vehicles move one
+#               cell per period from the sources in S_o
+#   latest[i]   last period in which vehicles in cell i can still reach a sink in S_e by card(T)
+#   activeArcs  arcs that can carry flow within these windows
+#   conflictKeys, conflictNodes
+#               resource conflicts of Expression 12: if resource p is at node n at t1,
+#               it cannot be at any node n2 in conflictNodes[<n,p,d>] at t1 + d,
+#               because it takes at least d periods to get there (tau[p][n][n2] >= d)
+# A cell with earliest[i] > latest[i] never holds vehicles in a feasible solution.
+
+
+# Position of each cell number in the cell set I, as a lookup array
+def cell_positions(cells):
+    lookup = np.full(int(cells.max()) + 1, -1, dtype=np.int64)
+    lookup[cells] = np.arange(len(cells))
+    return lookup
+
+
+# Split the arcs into one group per cell, by the cell at the given end of the arc
+# (0 for the start cell, 1 for the end cell). The arcs keep their order in A within a group.
+def group_arcs(cells, arcs, end):
+    position = cell_positions(cells)[arcs[:, end]]
+    order = np.argsort(position, kind="stable")
+    bounds = np.searchsorted(position[order], np.arange(len(cells) + 1))
+    return [arcs[order[start:stop]] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def arc_index(cells, arcs):
+    cells = np.asarray(cells)
+    arcs = np.asarray(arcs).reshape(-1, 2)
+    return group_arcs(cells, arcs, 1), group_arcs(cells, arcs, 0)
+
+
+# Number of arcs on the shortest path from any of the start cells to each cell
+# (to the start cells if reverse is True), or -1 for cells that cannot be reached
+def arc_distances(cells, arcs, starts, reverse=False):
+    position = cell_positions(cells)
+    tails, heads = position[arcs[:, 0]], position[arcs[:, 1]]
+    if reverse:
+        tails, heads = heads, tails
+    order = np.argsort(tails, kind="stable")
+    bounds = np.searchsorted(tails[order], np.arange(len(cells) + 1))
+    neighbors = heads[order]
+
+    distance = np.full(len(cells), -1, dtype=np.int64)
+    queue = deque()
+    for cell in position[np.asarray(starts)]:
+        distance[cell] = 0
+        queue.append(cell)
+    while queue:
+        cell = queue.popleft()
+        for neighbor in neighbors[bounds[cell]:bounds[cell + 1]]:
+            if distance[neighbor] < 0:
+                distance[neighbor] = distance[cell] + 1
+                queue.append(neighbor)
+    return distance
+
+
+# Validity windows of the cells and the arcs that can carry flow within them
+def reachability_windows(cells, arcs, sources, sinks, periods):
+    cells = np.asarray(cells)
+    arcs = np.asarray(arcs).reshape(-1, 2)
+    first, last = int(np.min(periods)), int(np.max(periods))
+
+    from_sources = arc_distances(cells, arcs, sources)
+    to_sinks = arc_distances(cells, arcs, sinks, reverse=True)
+    earliest = np.where(from_sources >= 0, first + from_sources, last + 1)
+    latest = np.where(to_sinks >= 0, last - to_sinks, first - 1)
+
+    # An arc moves vehicles from a.i at t into a.j at t + 1
+    position = cell_positions(cells)
+    active = earliest[position[arcs[:, 0]]] + 1 <= latest[position[arcs[:, 1]]]
+    return earliest, latest, arcs[active]
+
+
+# Conflict keys (n, p, d) for 1 <= d <= min(tau_max[p][n], max_offset) and the nodes
+# n2 with tau[p][n][n2] >= d for each key. The nodes of a row are sorted by travel time
+# once, so each key takes a prefix of the sorted row instead of a scan over Vp.
+# rows limits the keys to the given (resource index, node index) pairs.
+def resource_conflicts(vp, resources, tau, tau_max, max_offset, rows=None):
+    vp = np.asarray(vp)
+    tau = np.asarray(tau)
+    if rows is None:
+        rows = [(p_index, n_index) for p_index in range(len(resources)) for n_index in range(len(vp))]
+    keys, nodes = [], []
+    for p_index, n_index in rows:
+        p, n = resources[p_index], vp[n_index]
+        row = tau[p_index, n_index]
+        order = np.argsort(-row, kind="stable")
+        sorted_times = row[order]
+        # Number of nodes with tau >= d, for every d
+        limit = min(int(tau_max[p_index][n_index]), max_offset)
+        counts = np.searchsorted(-sorted_times, -np.arange(1, limit + 1), side="right")
+        for d, count in enumerate(counts, start=1):
+            if count == 0:
+                break
+            keys.append((int(n), int(p), d))
+            nodes.append(vp[np.sort(order[:count])])
+    return np.array(keys, dtype=np.int64).reshape(-1, 3), nodes
+
+
+@instrument.span("presolve")
+def presolve_blocks(data):
+    earliest, latest, active_arcs = reachability_windows(data["I"], data["A"], data["S_o"], data["S_e"], data["T"])
+    in_arcs, out_arcs = arc_index(data["I"], active_arcs)
+    conflict_keys, conflict_nodes = resource_conflicts(data["Vp"], data["P"], data["tau"], data["tau_max"],
+                                                       len(data["T"]) - 1)
+    return {
+        "activeArcs": dat_io.format_set(active_arcs),
+        "inArcs": dat_io.format_value(in_arcs, "nested"),
+        "outArcs": dat_io.format_value(out_arcs, "nested"),
+        "earliest": dat_io.format_array(earliest),
+        "latest": dat_io.format_array(latest),
+        "conflictKeys": dat_io.format_set(conflict_keys),
+        "conflictNodes": dat_io.format_value(conflict_nodes, "nested"),
+    }
+
+
+# Number of x and y variables that are not fixed to zero by the windows, and the totals
+def window_statistics(data, earliest, latest, active_arcs):
+    periods = len(data["T"])
+    x_free = int(np.clip(np.minimum(latest, np.max(data["T"])) - np.maximum(earliest, np.min(data["T"])) + 1,
+                         0, None).sum())
+    position = cell_positions(np.asarray(data["I"]))
+    arc_periods = latest[position[active_arcs[:, 1]]] - earliest[position[active_arcs[:, 0]]]
+    y_free = int(np.clip(arc_periods, 0, None).sum())
+    return {
+        "cells": f"{int((earliest <= latest).sum())}/{len(data['I'])}",
+        "arcs": f"{len(active_arcs)}/{len(data['A'])}",
+        "x": f"{x_free}/{len(data['I']) * periods}",
+        "y": f"{y_free}/{len(data['A']) * periods}",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the derived data blocks needed by jesdra.mod into .dat files.")
+    parser.add_argument("dat_files", nargs="+")
+    args = parser.parse_args()
+
+    for dat_file in args.dat_files:
+        data = dat_io.load_dat(dat_file, use_cache=False)
+        blocks = presolve_blocks(data)
+        dat_io.write_blocks(dat_file, blocks)
+        print(f"{', '.join(blocks)} written to {dat_file}")
+        windows = reachability_windows(data["I"], data["A"], data["S_o"], data["S_e"], data["T"])
+        statistics = window_statistics(data, *windows)
+        print("Active: " + ", ".join(f"{name} {value}" for name, value in statistics.items()))
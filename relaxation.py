@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import numpy as np
+
+# Fast approximate solve of jesdra.mod. jesdra_relax.mod solves the LP relaxation, which
+# gives a lower bound on the objective and fractional e and z. The plan is built from them:
+#   e  rounded at 0.5, then repaired with the simulator: while vehicles are stranded (which
+#      Expression 3 does not allow), the evacuated source with the smallest relaxed e is
+#      sheltered instead. Single flips are then made while they lower the simulated objective.
+#   x, y  the simulated flows of the rounded e. They satisfy Expressions 2-7 and 13-16
+#      without any resources.
+#   z  rounded greedily from the largest relaxed value down, skipping allocations that break
+#      Expressions 10-12. Resources only raise capacities (Expressions 8-9), so the flows stay
+#      feasible.
+# The plan can then be polished with jesdra_start.mod: CPLEX starts from it with e fixed and
+# a time limit.
+
+relax_model = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jesdra_relax.mod")
+
+bound_pattern = re.compile(r"^LP_BOUND:\s*(\S+)")
+relaxed_sections = {"relaxed e:": "e", "relaxed z:": "z"}
+
+
+def write_relax_data(mod_file, dat_file, relax_file):
+    with open(relax_file, "w") as f:
+        # json.dumps gives an OPL string literal with escaped backslashes
+        f.write(f"modelFile = {json.dumps(os.path.abspath(mod_file))};\n")
+        f.write(f"dataFile = {json.dumps(os.path.abspath(dat_file))};\n")
+
+
+# Bound, relaxed e by source and relaxed z as (n, p, t, value) rows from the output of jesdra_relax.mod
+def parse_relaxation(lines):
+    relaxation = {"bound": None, "e": {}, "z": []}
+    section = None
+    for line in lines:
+        line = line.strip()
+        match = bound_pattern.match(line)
+        if match:
+            relaxation["bound"] = float(match.group(1))
+        elif line in relaxed_sections:
+            section = relaxed_sections[line]
+        elif line.startswith("<<<"):
+            section = None
+        elif section == "e" and "," in line:
+            i, value = line.split(",")
+            relaxation["e"][int(i)] = float(value)
+        elif section == "z" and "," in line:
+            n, p, t, value = line.split(",")
+            relaxation["z"].append((int(n), int(p), int(t), float(value)))
+    return relaxation
+
+
+# Round the relaxed e into a plan without stranded vehicles. Returns e and the simulated result.
+def round_decisions(model, relaxed_e):
+    relaxed = np.array([relaxed_e.get(int(i), 0.0) for i in model.sources])
+    e = (relaxed >= 0.5).astype(np.int64)
+    result = model.run(e)
+    while result["stranded"][0] > 0:
+        evacuated = np.flatnonzero(e)
+        e[evacuated[np.argmin(relaxed[evacuated])]] = 0
+        result = model.run(e)
+
+    # Flip single decisions while that helps, simulating all flips at once
+    best = result["objective"][0]
+    while True:
+        candidates = np.repeat(e[None, :], len(e), axis=0)
+        candidates[np.arange(len(e)), np.arange(len(e))] ^= 1
+        flipped = model.run(candidates)
+        objective = np.where(flipped["stranded"] == 0, flipped["objective"], np.inf)
+        k = int(np.argmin(objective))
+        if objective[k] >= best - 1e-9:
+            break
+        e, best = candidates[k], objective[k]
+    return e, model.run(e, keep_history=True)
+
+
+# Round the relaxed z greedily into (n, p, t) rows that satisfy Expressions 10-12
+def round_allocations(data, relaxed_z, min_value=0.5):
+    vp = np.asarray(data["Vp"])
+    node_index = {int(n): k for k, n in enumerate(vp.tolist())}
+    resource_index = {int(p): k for k, p in enumerate(np.asarray(data["P"]).tolist())}
+    tau = np.asarray(data["tau"])
+    used_nodes, used_resources = set(), set()
+    placed = {p: [] for p in resource_index}
+    rows = []
+
+    # Resource p cannot be at n1 at t1 and at n2 at t2 > t1 if it needs at least t2 - t1
+    # periods to travel from n1 to n2 (Expression 12). tau holds directed shortest paths, so
+    # the travel time is taken from the earlier node to the later one.
+    def conflict(p, n1, t1, n2, t2):
+        if t1 > t2:
+            n1, t1, n2, t2 = n2, t2, n1, t1
+        return t1 != t2 and tau[resource_index[p], node_index[n1], node_index[n2]] >= t2 - t1
+
+    for n, p, t, value in sorted(relaxed_z, key=lambda row: -row[3]):
+        if value < min_value or (n, t) in used_nodes or (p, t) in used_resources:
+            continue
+        if any(conflict(p, n, t, n2, t2) for n2, t2 in placed[p]):
+            continue
+        used_nodes.add((n, t))
+        used_resources.add((p, t))
+        placed[p].append((n, t))
+        rows.append((n, p, t))
+    return np.array(sorted(rows, key=lambda row: (row[2], row[0], row[1])), dtype=np.int64).reshape(-1, 3)
+
+
+def relaxation_gap(objective, bound):
+    if objective is None or bound is None:
+        return None
+    return round((objective - bound) / max(abs(objective), 1e-10), 6)
+
@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.patches import Circle
+from PIL import Image
+import calculate_risk
+import dat_io
+import playback
+
+# Headless rendering of the evacuation playback, without a browser. Every time step of the
+# heatmap of visualize.py is drawn into a PNG frame with matplotlib, with the same colours
+# (playback.color_components over the whole cells x time steps matrix). The frames are
+# rendered in parallel worker processes and can be joined into an animated GIF (Pillow) or an
+# MP4 (ffmpeg). Coordinates are drawn in meters from the info JSON, without a map underneath.
+
+# Figure state of a worker process, built once by init_worker
+scene = None
+
+
+# Everything a worker needs to draw any frame of one result set
+def build_scene(json_file, results_dir, dat_file=None):
+    with open(json_file, "r") as f:
+        info = json.load(f)
+    settings = info["setting"]
+    cells = info["cells"]
+    cell_numbers = [cell["cell_number"] for cell in cells]
+    vehicle_counts, evacuation_orders = playback.read_results(results_dir, cell_numbers)
+    # Only an explicit "no evacuation order" is drawn black, as in visualize.py
+    evacuated = [evacuation_orders.get(cell, None) != 0 for cell in cell_numbers]
+    counts = np.asarray(vehicle_counts, dtype=np.int64).reshape(len(cells), -1)
+    r, g, b = playback.color_components(counts, evacuated)
+
+    coords = calculate_risk.cell_positions(cells, settings)
+    arcs = None
+    if dat_file:
+        row = {cell: k for k, cell in enumerate(cell_numbers)}
+        arcs = np.array([(coords[row[i]], coords[row[j]]) for i, j in dat_io.load_dat(dat_file)["A"].tolist()
+                         if i in row and j in row]).reshape(-1, 2, 2)
+    return {
+        "coords": coords,
+        "road": np.array([cell["type"] == "road" for cell in cells]),
+        "rgb": np.stack([r, g, b], axis=-1) / 255,
+        "totals": counts.sum(axis=0),
+        "disaster": calculate_risk.disaster_positions(info["disaster"], settings, counts.shape[1]),
+        "radius": info["disaster"]["radius_in_meters"],
+        "time_step_length": settings["time_step_length_in_secs"],
+        "arcs": arcs,
+    }
+
+
+# (x min, x max), (y min, y max) of the axes: the cells and the disaster circle of every time step
+def axes_limits(shared_scene):
+    coords, disaster, radius = shared_scene["coords"], shared_scene["disaster"], shared_scene["radius"]
+    margin = radius * 0.1 + 1
+    low = np.minimum(coords.min(axis=0), (disaster - radius).min(axis=0)) - margin
+    high = np.maximum(coords.max(axis=0), (disaster + radius).max(axis=0)) + margin
+    return (low[0], high[0]), (low[1], high[1])
+
+
+def init_worker(shared_scene, size, dpi):
+    global scene
+    scene = dict(shared_scene)
+    coords, road = scene["coords"], scene["road"]
+    figure, axes = plt.subplots(figsize=size, dpi=dpi)
+    axes.set_aspect("equal")
+    axes.set_axis_off()
+    x_limits, y_limits = axes_limits(scene)
+    axes.set_xlim(*x_limits)
+    axes.set_ylim(*y_limits)
+    if scene["arcs"] is not None and len(scene["arcs"]):
+        axes.add_collection(LineCollection(scene["arcs"], colors="lightgray", linewidths=0.5, zorder=0))
+    # Road cells are squares and the other cells circles, as on the map
+    scene["roads"] = axes.scatter(coords[road, 0], coords[road, 1], marker="s", s=12, zorder=1)
+    scene["others"] = axes.scatter(coords[~road, 0], coords[~road, 1], marker="o", s=40, zorder=2)
+    scene["circle"] = axes.add_patch(Circle(scene["disaster"][0], scene["radius"], fill=False, color="red",
+                                            linewidth=2, zorder=3))
+    scene["title"] = axes.set_title("")
+    scene["figure"] = figure
+
+
+def render_frames(frames, output_dir):
+    paths = []
+    road = scene["road"]
+    for n in frames:
+        colors = scene["rgb"][:, n]
+        scene["roads"].set_facecolor(colors[road])
+        scene["roads"].set_edgecolor(colors[road])
+        scene["others"].set_facecolor(colors[~road])
+        scene["others"].set_edgecolor(colors[~road])
+        scene["circle"].set_center(scene["disaster"][n])
+        scene["title"].set_text(f"Time step {n + 1} ({n * scene['time_step_length']} s), "
+                                f"{scene['totals'][n]} vehicles")
+        path = os.path.join(output_dir, f"frame_{n:04d}.png")
+        scene["figure"].savefig(path)
+        paths.append(path)
+    return paths
+
+
+# Render every time step into output_dir/frame_NNNN.png with the given number of worker processes
+def render(shared_scene, output_dir, workers=None, size=(8, 8), dpi=100):
+    os.makedirs(output_dir, exist_ok=True)
+    n_frames = shared_scene["rgb"].shape[1]
+    workers = workers or os.cpu_count() or 1
+    # Contiguous chunks, a few per worker so that they finish at about the same time
+    chunks = [chunk.tolist() for chunk in np.array_split(np.arange(n_frames), min(n_frames, workers * 4)) if len(chunk)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(shared_scene, size, dpi)) as executor:
+        paths = [path for chunk in executor.map(render_frames, chunks, [output_dir] * len(chunks)) for path in chunk]
+    return paths
+
+
+def write_gif(paths, gif_file, frame_duration):
+    images = [Image.open(path) for path in paths]
+    images[0].save(gif_file, save_all=True, append_images=images[1:], duration=frame_duration, loop=0)
+
+
+def write_mp4(output_dir, mp4_file, fps):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("Writing MP4 files needs ffmpeg on the PATH")
+    subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-framerate", str(fps),
+                    "-i", os.path.join(output_dir, "frame_%04d.png"),
+                    "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", mp4_file], check=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the evacuation playback to PNG frames, a GIF or an MP4.")
+    parser.add_argument("json_file", help="Path to the JSON file containing coordinates and settings.")
+    parser.add_argument("--results-dir", nargs="+", default=["."],
+                        help="Solver output directories; each one is rendered into its own subdirectory "
+                             "of --output-dir when more than one is given (e.g. sweep/*).")
+    parser.add_argument("--output-dir", default="frames", help="Directory for the PNG frames.")
+    parser.add_argument("--dat", help="Also draw the arcs in A of this .dat file.")
+    parser.add_argument("--gif", action="store_true", help="Also write playback.gif next to the frames.")
+    parser.add_argument("--mp4", action="store_true", help="Also write playback.mp4 next to the frames (needs ffmpeg).")
+    parser.add_argument("--fps", type=float, default=4, help="Frames per second of the GIF and MP4.")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core).")
+    parser.add_argument("--size", default="8,8", help="Figure size in inches (default: 8,8).")
+    parser.add_argument("--dpi", type=int, default=100)
+    args = parser.parse_args()
+
+    size = tuple(float(value) for value in args.size.split(","))
+    for results_dir in args.results_dir:
+        if not any(os.path.exists(os.path.join(results_dir, name)) for name in ("results.json", "vehicles.csv")):
+            # Failed runs of a sweep have no output, the others are still rendered
+            print(f"No results in {results_dir}, skipped")
+            continue
+        output_dir = args.output_dir
+        if len(args.results_dir) > 1:
+            output_dir = os.path.join(args.output_dir, os.path.basename(os.path.normpath(results_dir)))
+        paths = render(build_scene(args.json_file, results_dir, args.dat), output_dir, args.workers, size, args.dpi)
+        print(f"{len(paths)} frames of {results_dir} written to {output_dir}")
+        if args.gif:
+            write_gif(paths, os.path.join(output_dir, "playback.gif"), round(1000 / args.fps))
+        if args.mp4:
+            write_mp4(output_dir, os.path.join(output_dir, "playback.mp4"), args.fps)
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import shutil
+import results_io
+
+# Disk cache for solve results, keyed by the contents of the model file, the data file,
+# any other input files (e.g. the model and data of a warm start) and the solver settings. Each entry is a directory holding the CSV and binary outputs
+# and the run metrics. The least recently used entries are evicted when the cache gets too big.
+
+default_cache_dir = ".solve_cache"
+result_files = ("evac.csv", "vehicles.csv") + results_io.result_files
+metrics_name = "metrics.json"
+
+
+def file_digest(path, hasher):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+
+
+def cache_key(mod_file, dat_file, settings=None, extra_files=()):
+    hasher = hashlib.sha256()
+    for path in (mod_file, dat_file, *extra_files):
+        file_digest(path, hasher)
+        hasher.update(b"\0")
+    hasher.update(json.dumps(settings or {}, sort_keys=True).encode())
+    return hasher.hexdigest()
+
+
+def directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class ResultCache:
+    def __init__(self, cache_dir=default_cache_dir, max_size_mb=1024, max_entries=200):
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    # Copy the cached outputs for key into output_dir and return the cached metrics,
+    # or return None if there is no entry for key
+    def get(self, key, output_dir="."):
+        path = self.entry_path(key)
+        metrics_path = os.path.join(path, metrics_name)
+        if not os.path.exists(metrics_path):
+            return None
+        for name in result_files:
+            shutil.copyfile(os.path.join(path, name), os.path.join(output_dir, name))
+        # Mark the entry as recently used
+        os.utime(metrics_path)
+        with open(metrics_path) as f:
+            return json.load(f)
+
+    # Store the outputs in output_dir and the metrics under key
+    def put(self, key, output_dir, metrics):
+        path = self.entry_path(key)
+        staging = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(staging, exist_ok=True)
+        for name in result_files:
+            shutil.copyfile(os.path.join(output_dir, name), os.path.join(staging, name))
+        # The metrics file is written last, an entry without it is incomplete
+        with open(os.path.join(staging, metrics_name), "w") as f:
+            json.dump(metrics, f)
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.replace(staging, path)
+        except OSError:
+            # Another process stored the same result at the same time
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    # Remove the least recently used entries until the cache is within its limits
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            metrics_path = os.path.join(entry.path, metrics_name)
+            if entry.is_dir() and os.path.exists(metrics_path):
+                entries.append((os.stat(metrics_path).st_mtime, directory_size(entry.path), entry.path))
+        entries.sort(reverse=True)
+
+        total_size = 0
+        for count, (_, size, path) in enumerate(entries):
+            total_size += size
+            if count >= self.max_entries or total_size > self.max_size:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
@@ -0,0 +1,90 @@
+import json
+import os
+import numpy as np
+import instrument
+
+# Binary form of the solver output, written by solve.py next to evac.csv and vehicles.csv.
+#   x.npy        vehicles in each cell at each period, shape (cells, periods), dense
+#   cells.npy    cell number of each row of x (the order of I)
+#   periods.npy  period of each column of x (the order of T)
+#   sources.npy  source cells in S_o, and e.npy their evacuation decisions
+#   y.npy        nonzero arc flows as COO rows (i, j, t, value)
+#   z.npy        resource allocations as COO rows (n, p, t), every listed entry is 1
+#   results.json manifest with the shape and dtype of each array and the objective
+# load_results memory-maps the arrays, so large outputs are not read into memory.
+
+manifest_name = "results.json"
+array_dtypes = {
+    "x": np.int32,
+    "cells": np.int64,
+    "periods": np.int64,
+    "sources": np.int64,
+    "e": np.int8,
+    "y": np.int64,
+    "z": np.int64,
+}
+coo_widths = {"y": 4, "z": 3}
+result_files = tuple(f"{name}.npy" for name in array_dtypes) + (manifest_name,)
+
+
+def empty_array(name):
+    shape = (0, coo_widths[name]) if name in coo_widths else (0, 0) if name == "x" else (0,)
+    return np.zeros(shape, dtype=array_dtypes[name])
+
+
+# Write the given arrays into directory. Missing arrays are written empty,
+# and the manifest is written last so an incomplete output has no manifest.
+@instrument.span("results.write")
+def write_results(directory, arrays, objective=None):
+    manifest = {"format": 1, "objective": objective, "arrays": {}}
+    for name, dtype in array_dtypes.items():
+        value = arrays.get(name)
+        value = empty_array(name) if value is None or np.size(value) == 0 else np.asarray(value, dtype=dtype)
+        if name in coo_widths:
+            value = value.reshape(-1, coo_widths[name])
+        np.save(os.path.join(directory, f"{name}.npy"), value)
+        manifest["arrays"][name] = {"shape": list(value.shape), "dtype": str(value.dtype)}
+    with open(os.path.join(directory, manifest_name), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def has_results(directory):
+    return os.path.exists(os.path.join(directory, manifest_name))
+
+
+# Arrays of a results directory as a dict, with the manifest under "manifest"
+@instrument.span("results.load")
+def load_results(directory, mmap=True):
+    with open(os.path.join(directory, manifest_name), "r") as f:
+        manifest = json.load(f)
+    results = {"manifest": manifest}
+    for name in manifest["arrays"]:
+        path = os.path.join(directory, f"{name}.npy")
+        # np.load cannot memory-map an empty array
+        mode = "r" if mmap and manifest["arrays"][name]["shape"] and 0 not in manifest["arrays"][name]["shape"] else None
+        results[name] = np.load(path, mmap_mode=mode)
+    return results
+
+
+# Dense flows of shape (arcs, periods) for the given arcs, from the COO rows of y
+def dense_flows(results, arcs):
+    arcs = np.asarray(arcs).reshape(-1, 2)
+    periods = np.asarray(results["periods"])
+    flows = np.zeros((len(arcs), len(periods)), dtype=np.int64)
+    y = np.asarray(results["y"])
+    if len(y) == 0:
+        return flows
+    arc_row = {(int(i), int(j)): row for row, (i, j) in enumerate(arcs.tolist())}
+    rows = np.array([arc_row[(i, j)] for i, j in y[:, :2].tolist()])
+    columns = np.searchsorted(periods, y[:, 2])
+    flows[rows, columns] = y[:, 3]
+    return flows
+
+
+# Parse the comma-separated integer lines of an output section into an array
+def parse_lines(lines, width=None):
+    if not lines:
+        return None
+    values = np.array([int(value) for line in lines for value in line.split(",")], dtype=np.int64)
+    return values.reshape(len(lines), -1) if width is None else values.reshape(-1, width)
@@ -0,0 +1,112 @@
+import json
+import os
+import numpy as np
+import dat_io
+import presolve
+
+# Rolling-horizon decomposition of jesdra.mod. The periods of T are split into overlapping
+# windows of `window` periods that start every `step` periods. Each window is solved with
+# jesdra_window.mod, which generates jesdra.mod for the periods of the window; only its
+# first `step` periods are kept (all of them for the final window), and the vehicles in each
+# cell at the first period after them become the initial state x0 of the next window. The
+# sources to evacuate are chosen in the first window. Every window charges the risk of the
+# cells and of the sources over its own periods. Resource conflicts (Expression 12) are only
+# enforced within a window.
+
+window_model = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jesdra_window.mod")
+model_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jesdra.mod")
+
+
+# (start, stop) positions in T of each window
+def window_ranges(periods, window, step):
+    if not 0 < step < window:
+        raise ValueError("The step must be at least 1 and shorter than the window")
+    n_periods = len(periods)
+    ranges = []
+    start = 0
+    while True:
+        stop = min(start + window, n_periods)
+        ranges.append((start, stop))
+        if stop == n_periods:
+            return ranges
+        start += step
+
+
+# Data blocks of jesdra.mod for the window at positions start:stop of T. x0 is the state
+# left by the previous window, or None for the first window.
+def window_blocks(data, start, stop, x0=None):
+    periods = np.asarray(data["T"])
+    window_periods = periods[start:stop]
+    cells = np.asarray(data["I"])
+    if x0 is None:
+        # The first window starts from the sources, as in the full model
+        earliest = np.asarray(data["earliest"])
+    else:
+        # The validity windows start from the cells that hold vehicles
+        occupied = cells[np.asarray(x0) > 0]
+        arcs = np.asarray(data["activeArcs"]).reshape(-1, 2)
+        distance = presolve.arc_distances(cells, arcs, occupied)
+        earliest = np.where(distance >= 0, window_periods[0] + distance, periods[-1] + 1)
+    return {
+        "T": dat_io.format_set(window_periods),
+        "earliest": dat_io.format_array(earliest),
+        # Vehicles still have to reach a sink by the last period of the horizon
+        "latest": dat_io.format_array(np.asarray(data["latest"])),
+    }
+
+
+# Data blocks of jesdra_window.mod for the window at positions start:stop of T, whose
+# jesdra.mod data is window_dat. x0 and e are the state left by the previous window, or
+# None for the first window.
+def state_blocks(data, window_dat, start, stop, x0=None, e=None):
+    if x0 is None:
+        x0 = np.zeros(len(data["I"]), dtype=np.int64)
+        e = np.zeros(len(data["S_o"]), dtype=np.int64)
+    return {
+        # json.dumps gives an OPL string literal with escaped backslashes
+        "modelFile": json.dumps(model_file),
+        "dataFile": json.dumps(os.path.abspath(window_dat)),
+        "I": dat_io.format_set(np.asarray(data["I"])),
+        "S_o": dat_io.format_set(np.asarray(data["S_o"])),
+        "firstWindow": "1" if start == 0 else "0",
+        "finalWindow": "1" if stop == len(data["T"]) else "0",
+        "x0": dat_io.format_array(np.asarray(x0)),
+        "eFixed": dat_io.format_array(np.asarray(e)),
+    }
+
+
+# Number of periods of the window that are kept
+def committed_periods(data, start, stop, step):
+    return stop - start if stop == len(data["T"]) else step
+
+
+# Join the kept periods of each window into the results of the whole horizon.
+# parts holds (start position, kept periods, results_io results of the window).
+def stitch(data, parts):
+    periods = np.asarray(data["T"])
+    x = np.zeros((len(data["I"]), len(periods)), dtype=np.int64)
+    y, z = [], []
+    for start, kept, results in parts:
+        x[:, start:start + kept] = np.asarray(results["x"])[:, :kept]
+        kept_periods = periods[start:start + kept]
+        for rows, name in ((y, "y"), (z, "z")):
+            values = np.asarray(results[name])
+            rows.append(values[np.isin(values[:, 2], kept_periods)])
+    return {
+        "x": x,
+        "cells": np.asarray(data["I"]),
+        "periods": periods,
+        "sources": np.asarray(data["S_o"]),
+        "e": np.asarray(parts[0][2]["e"]),
+        "y": np.vstack(y),
+        "z": np.vstack(z),
+    }
+
+
+# Objective of jesdra.mod for the vehicle counts x (cells, periods) and decisions e
+def plan_objective(data, x, e):
+    risk = np.asarray(data["c"], dtype=float)
+    columns = np.searchsorted(np.asarray(data["Tp"]), np.asarray(data["T"]))
+    source_rows = presolve.cell_positions(np.asarray(data["I"]))[np.asarray(data["S_o"])]
+    shelter = np.asarray(data["D"]) * risk[source_rows].sum(axis=1) * (1 - np.asarray(e))
+    return float((risk[:, columns] * x).sum() + shelter.sum())
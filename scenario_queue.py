@@ -0,0 +1,79 @@
+import json
+import os
+import numpy as np
+import dat_io
+
+# Queue of parameter changes for jesdra_resolve.mod, which reads the model and the base
+# data once and solves every scenario of the queue in a single oplrun process:
+#   scenarios  scenario numbers in the order they are solved (1, 2, ...)
+#   deltas     <scenario, param, i, t, value> entries, setting param[i] (or param[i][t]) to value
+#              before the scenario is solved
+# The deltas of a scenario are its differences from the previous scenario (or from the base
+# data for the first one), so they also revert the changes of the previous scenario.
+# jesdra_resolve.mod changes the generated model in place for every parameter except the
+# structural ones, for which the model is generated again.
+
+resolve_model = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jesdra_resolve.mod")
+
+# Parameters that can change between scenarios, with the index sets of each dimension
+parameter_indices = {
+    "D": ("S_o",),
+    "Q": ("R",),
+    "N": ("R",),
+    "s_factor": ("R",),
+    "delta": ("R",),
+    "c": ("I", "Tp"),
+    "downstreamNode": ("R_prime",),
+}
+
+# Parameters that change which variables appear in the constraints
+structural_parameters = {"downstreamNode"}
+
+
+def parse_literal(name, literal):
+    return np.asarray(dat_io.parse_dat(f"{name} = {literal};")[name], dtype=float)
+
+
+# Delta rows (scenario, param, i, t, value) for a list of (run id, labels, blocks) variants
+# as returned by sweep.expand_grid
+def scenario_deltas(base_text, variants):
+    base = dat_io.parse_dat(base_text)
+    current = {name: np.asarray(base[name], dtype=float) for name in parameter_indices if name in base}
+    rows = []
+    for scenario, (run_id, _, blocks) in enumerate(variants, start=1):
+        for name in blocks:
+            if name not in current:
+                raise ValueError(f"'{name}' cannot be changed between re-solves, "
+                                 f"only {', '.join(current)}")
+        for name, values in current.items():
+            target = parse_literal(name, blocks[name]) if name in blocks else np.asarray(base[name], dtype=float)
+            if target.shape != values.shape:
+                raise ValueError(f"{run_id}: '{name}' has shape {target.shape} instead of {values.shape}")
+            indices = [np.asarray(base[index]) for index in parameter_indices[name]]
+            for position in np.argwhere(target != values).tolist():
+                i = int(indices[0][position[0]])
+                t = int(indices[1][position[1]]) if len(position) > 1 else 0
+                rows.append((scenario, name, i, t, float(target[tuple(position)])))
+            current[name] = target
+    return rows
+
+
+def format_deltas(rows):
+    return "{" + ",\n".join(f'<{scenario}, "{name}", {i}, {t}, {value!r}>'
+                            for scenario, name, i, t, value in rows) + "}"
+
+
+def write_queue(mod_file, dat_file, variants, queue_file):
+    with open(dat_file, "r") as f:
+        base_text = f.read()
+    rows = scenario_deltas(base_text, variants)
+    blocks = {
+        # json.dumps gives an OPL string literal with escaped backslashes
+        "modelFile": json.dumps(os.path.abspath(mod_file)),
+        "dataFile": json.dumps(os.path.abspath(dat_file)),
+        "scenarios": dat_io.format_set(np.arange(1, len(variants) + 1)),
+        "deltas": format_deltas(rows),
+    }
+    with open(queue_file, "w") as f:
+        f.write("\n".join(f"{name} = {literal};\n" for name, literal in blocks.items()))
+    return rows
@@ -0,0 +1,230 @@
+import argparse
+import itertools
+import os
+import time
+import numpy as np
+import dat_io
+import instrument
+import presolve
+import results_io
+
+# Cell-transmission simulator for the JESDRA model. Given the evacuation decisions e, it
+# moves the vehicles through the network period by period under the capacity and holding
+# rules of jesdra.mod and computes the same objective, without solving the model:
+#   Expression 2  x[i][t+1] = x[i][t] + inflow - outflow
+#   Expression 4  inflow of a road cell <= s_factor[i] * (N[i] - x[i][t])
+#   Expression 5  outflow of a cell <= x[i][t]
+#   Expression 6-7 inflow and outflow of a road cell <= Q[i]
+# Resources are not simulated (z = 0), so the R_prime cells keep their capacity Q[i].
+#
+# Routing is greedy over the arcs in a fixed priority order. With the "priority" policy the
+# arcs that lead to a cell closer to a sink come first; with the "greedy" policy the arcs
+# keep their order in A. Vehicles never enter a cell from which no sink can be reached,
+# and sinks do not send vehicles. Each period runs a few rounds of:
+#   1. each cell offers its remaining vehicles to its out arcs in priority order, each arc
+#      taking at most what its head can still receive,
+#   2. each cell accepts the offers on its in arcs in priority order, up to what it can receive.
+# Both steps are cumulative sums within groups of arcs with the same tail or head, so a
+# period is a handful of array operations on all arcs, for any number of plans at once.
+
+# Stands in for "no capacity limit" in the integer arithmetic
+unlimited = 1 << 40
+
+
+# Cumulative sum of the values before each position within its group. The values are
+# sorted by group along the last axis and starts holds the first position of each element's group.
+def grouped_exclusive_cumsum(values, starts):
+    before = np.cumsum(values, axis=-1) - values
+    return before - before[..., starts]
+
+
+# Sum of values (plans, arcs) into bins (plans, size) by the index of each arc
+def scatter_sum(values, index, size):
+    plans = values.shape[0]
+    flat = (np.arange(plans)[:, None] * size + index[None, :]).ravel()
+    return np.bincount(flat, weights=values.ravel(), minlength=plans * size).reshape(plans, size).astype(np.int64)
+
+
+def group_starts(groups):
+    first = np.r_[True, groups[1:] != groups[:-1]]
+    return np.maximum.accumulate(np.where(first, np.arange(len(groups)), 0))
+
+
+class CellTransmissionModel:
+    def __init__(self, data, policy="priority", rounds=4):
+        self.cells = np.asarray(data["I"])
+        self.sources = np.asarray(data["S_o"])
+        self.sinks = np.asarray(data["S_e"])
+        self.periods = np.asarray(data["T"])
+        self.rounds = rounds
+        n = len(self.cells)
+        position = presolve.cell_positions(self.cells)
+        self.source_index = position[self.sources]
+        self.sink_index = position[self.sinks]
+        self.demand = np.asarray(data["D"], dtype=np.int64)
+
+        # Capacities per cell, unlimited for the cells that are not road segments
+        road = position[np.asarray(data["R"])]
+        self.flow_capacity = np.full(n, unlimited, dtype=np.int64)
+        self.flow_capacity[road] = np.floor(np.asarray(data["Q"], dtype=float)).astype(np.int64)
+        self.holding = np.full(n, np.nan)
+        self.holding[road] = np.asarray(data["N"], dtype=float)
+        self.s_factor = np.zeros(n)
+        self.s_factor[road] = np.asarray(data["s_factor"], dtype=float)
+        self.is_road = np.zeros(n, dtype=bool)
+        self.is_road[road] = True
+        self.can_send = np.ones(n, dtype=bool)
+        self.can_send[self.sink_index] = False
+
+        # Risk of each cell in each period of T, and the risk of staying at each source over Tp
+        risk = np.asarray(data["c"], dtype=float)
+        self.risk = risk[:, np.searchsorted(np.asarray(data["Tp"]), self.periods)]
+        self.shelter_risk = self.demand * risk[self.source_index].sum(axis=1)
+
+        # Arcs into cells that can still reach a sink, in priority order
+        arcs = np.asarray(data["A"]).reshape(-1, 2)
+        to_sink = presolve.arc_distances(self.cells, arcs, self.sinks, reverse=True)
+        tail, head = position[arcs[:, 0]], position[arcs[:, 1]]
+        usable = to_sink[head] >= 0
+        arcs, tail, head = arcs[usable], tail[usable], head[usable]
+        if policy == "priority":
+            rank = np.argsort(to_sink[head], kind="stable")
+        elif policy == "greedy":
+            rank = np.arange(len(arcs))
+        else:
+            raise ValueError(f"Unknown policy '{policy}'")
+        priority = np.empty(len(arcs), dtype=np.int64)
+        priority[rank] = np.arange(len(arcs))
+
+        # The sparse incidence of the arcs, once grouped by tail and once by head
+        by_tail = np.lexsort((priority, tail))
+        self.arcs = arcs[by_tail]
+        self.tail, self.head = tail[by_tail], head[by_tail]
+        self.tail_starts = group_starts(self.tail)
+        self.to_head = np.lexsort((priority[by_tail], self.head))
+        self.to_tail = np.argsort(self.to_head)
+        self.head_starts = group_starts(self.head[self.to_head])
+
+    # Integer flows on the arcs for one period, for vehicle counts x of shape (plans, cells)
+    def step(self, x):
+        n = len(self.cells)
+        send = np.where(self.can_send, np.minimum(x, self.flow_capacity), 0)
+        space = np.floor(self.s_factor * np.clip(self.holding - x, 0, None))
+        receive = np.where(self.is_road, np.minimum(self.flow_capacity, np.nan_to_num(space)), unlimited)
+        receive = receive.astype(np.int64)
+
+        flow = np.zeros((x.shape[0], len(self.arcs)), dtype=np.int64)
+        for _ in range(self.rounds):
+            capacity = receive[:, self.head]
+            offer = np.clip(send[:, self.tail] - grouped_exclusive_cumsum(capacity, self.tail_starts), 0, capacity)
+            offer_by_head = offer[:, self.to_head]
+            accepted = np.clip(receive[:, self.head[self.to_head]] -
+                               grouped_exclusive_cumsum(offer_by_head, self.head_starts), 0, offer_by_head)
+            accepted = accepted[:, self.to_tail]
+            if not accepted.any():
+                break
+            flow += accepted
+            send -= scatter_sum(accepted, self.tail, n)
+            receive -= scatter_sum(accepted, self.head, n)
+        return flow
+
+    # Simulate the plans e (one 0/1 entry per source, or an array of shape (plans, sources)).
+    # Returns the objective and the vehicles that did not reach a sink by the last period for
+    # each plan, and with keep_history also x (plans, cells, periods) and y (plans, arcs, periods - 1).
+    @instrument.span("simulate.run")
+    def run(self, e, keep_history=False):
+        e = np.atleast_2d(np.asarray(e, dtype=np.int64))
+        plans = e.shape[0]
+        n = len(self.cells)
+        x = np.zeros((plans, n), dtype=np.int64)
+        x[:, self.source_index] = self.demand * e
+
+        cost = x @ self.risk[:, 0]
+        history_x = [x] if keep_history else None
+        history_y = [] if keep_history else None
+        for t in range(1, len(self.periods)):
+            flow = self.step(x)
+            x = x + scatter_sum(flow, self.head, n) - scatter_sum(flow, self.tail, n)
+            cost += x @ self.risk[:, t]
+            if keep_history:
+                history_x.append(x)
+                history_y.append(flow)
+
+        result = {
+            "objective": cost + (1 - e) @ self.shelter_risk,
+            "evacuated": x[:, self.sink_index].sum(axis=1),
+            "stranded": (self.demand * e).sum(axis=1) - x[:, self.sink_index].sum(axis=1),
+        }
+        if keep_history:
+            result["x"] = np.stack(history_x, axis=-1)
+            result["y"] = np.stack(history_y, axis=-1) if history_y else np.zeros((plans, len(self.arcs), 0), dtype=np.int64)
+        return result
+
+    # Results of a single plan in the results_io layout, so it can be visualized like a solve
+    def results_arrays(self, e, result, plan=0):
+        y = result["y"][plan]
+        arc, period = np.nonzero(y)
+        return {
+            "x": result["x"][plan],
+            "cells": self.cells,
+            "periods": self.periods,
+            "sources": self.sources,
+            "e": np.asarray(e),
+            "y": np.column_stack([self.arcs[arc], self.periods[period], y[arc, period]]),
+        }
+
+
+# Every 0/1 decision vector for the given number of sources, in chunks of at most chunk_size
+def all_subsets(n_sources, chunk_size=4096):
+    vectors = itertools.product((0, 1), repeat=n_sources)
+    while True:
+        chunk = np.array(list(itertools.islice(vectors, chunk_size)), dtype=np.int64)
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate evacuation plans on a .dat file without solving the model.")
+    parser.add_argument("dat_file")
+    parser.add_argument("--e", help="Comma-separated evacuation decision (0/1) of each source in S_o (default: evacuate all).")
+    parser.add_argument("--all-subsets", action="store_true", help="Simulate every evacuation decision vector.")
+    parser.add_argument("--top", type=int, default=10, help="Number of plans to print with --all-subsets.")
+    parser.add_argument("--policy", choices=["priority", "greedy"], default="priority")
+    parser.add_argument("--output-dir", help="Write the simulated x and y of the plan as solver results (see results_io.py).")
+    args = parser.parse_args()
+
+    data = dat_io.load_dat(args.dat_file)
+    model = CellTransmissionModel(data, args.policy)
+
+    if args.all_subsets:
+        if len(model.sources) > 24:
+            parser.error(f"{len(model.sources)} sources have too many subsets")
+        start = time.perf_counter()
+        plans, objectives, stranded = [], [], []
+        for chunk in all_subsets(len(model.sources)):
+            result = model.run(chunk)
+            plans.append(chunk)
+            objectives.append(result["objective"])
+            stranded.append(result["stranded"])
+        plans, objectives, stranded = np.vstack(plans), np.concatenate(objectives), np.concatenate(stranded)
+        elapsed = time.perf_counter() - start
+        print(f"{len(plans)} plans simulated in {elapsed:.3f} s")
+        # Plans that leave vehicles behind do not satisfy Expression 3
+        order = np.lexsort((objectives, stranded > 0))
+        for k in order[:args.top]:
+            print(f"e = {','.join(map(str, plans[k]))}  objective {objectives[k]:.4f}  stranded {stranded[k]}")
+    else:
+        e = [int(value) for value in args.e.split(",")] if args.e else [1] * len(model.sources)
+        if len(e) != len(model.sources):
+            parser.error(f"--e needs {len(model.sources)} values")
+        start = time.perf_counter()
+        result = model.run(e, keep_history=args.output_dir is not None)
+        elapsed = time.perf_counter() - start
+        print(f"objective {result['objective'][0]:.4f}, evacuated {result['evacuated'][0]}, "
+              f"stranded {result['stranded'][0]} ({elapsed * 1000:.1f} ms)")
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            results_io.write_results(args.output_dir, model.results_arrays(e, result),
+                                     float(result["objective"][0]))
+            print(f"Simulated results written to {args.output_dir}")
@@ -1,81 +1,632 @@
-import subprocess
+import argparse
+import json
+import os
 import re
+import signal
+import subprocess
 import sys
+import time
+import archive
+import dat_io
+import instrument
+import result_cache
+import results_io
+import relaxation
+import rolling_horizon
+import scenario_queue
+import simulate
+import warm_start as warm_start_io
 
 # Regular expressions to locate sections in the oplrun output
 evac_start_pattern = re.compile(r"evac\.csv:")
 vehicles_start_pattern = re.compile(r"vehicles\.csv:")
+section_end_lines = ("<<< post process", "<<< done")
+# Sections that are only kept in memory and saved with results_io
+array_sections = {"cells:": "cells", "periods:": "periods", "flows.coo:": "y", "allocations.coo:": "z"}
+
+# Lines written into the CSV sections
+evac_line_pattern = re.compile(r"^\d+,-?[\d.]+(e[+-]?\d+)?$")
+vehicles_line_pattern = re.compile(r"^\d+(,\d+)*$")
+
+# Regular expressions for the progress lines in the oplrun/CPLEX log
+number = r"-?\d+(?:\.\d*)?(?:e[+-]?\d+)?"
+phase_pattern = re.compile(r"^<<< (.+)$")
+# Node log lines with an incumbent, e.g.
+# "*   100+   50                          125.0000      118.0000            5.60%"
+node_log_pattern = re.compile(
+    r"^\s*[*A-Za-z]?\s*(\d+)\+?\s+(\d+)\+?\s.*?\s(" + number + r")\s+(" + number + r")\s+(?:\d+\s+)?(" + number + r")%\s*$")
+elapsed_pattern = re.compile(r"^Elapsed time = (" + number + r") sec\.")
+incumbent_pattern = re.compile(r"Found incumbent of value (" + number + r") after (" + number + r") sec\.")
+objective_pattern = re.compile(r"^OBJECTIVE:\s*(" + number + r")")
+# Start of the output of one scenario of jesdra_resolve.mod
+scenario_pattern = re.compile(r"^scenario: (\d+)$")
+
+
+# Parses the oplrun output line by line as it arrives. The CSV sections are written
+# to output_dir while they are being emitted, and the solver progress is collected
+# into metrics records that are passed to metrics_callback and/or appended to metrics_file.
+# The decision variables are also saved as binary arrays (see results_io.py) when the run ends.
+class OplOutputParser:
+    def __init__(self, output_dir=".", metrics_callback=None, metrics_file=None):
+        self.output_dir = output_dir
+        self.metrics_callback = metrics_callback
+        self.metrics_file = open(metrics_file, "a") if metrics_file else None
+        self.start_time = time.monotonic()
+        self.start_epoch = time.time()
+        self.section = None
+        self.files = {}
+        self.line_counts = {"evac.csv": 0, "vehicles.csv": 0}
+        self.array_lines = {"x": [], "evac": [], **{name: [] for name in array_sections.values()}}
+        self.cplex_elapsed = None
+        self.summary = {
+            "phases": {},
+            "objective": None,
+            "incumbent": None,
+            "best_bound": None,
+            "gap": None,
+            "nodes": None,
+            "first_incumbent_time": None,
+        }
+
+    def wall_time(self):
+        return time.monotonic() - self.start_time
+
+    def emit(self, record):
+        record["time"] = round(self.wall_time(), 3)
+        if self.metrics_file:
+            self.metrics_file.write(json.dumps(record) + "\n")
+            self.metrics_file.flush()
+        if self.metrics_callback:
+            return bool(self.metrics_callback(record))
+        return False
 
-def parse_and_write_csv(output):
-    evac_lines = []
-    vehicles_lines = []
+    def write_section_line(self, name, line):
+        if name not in self.files:
+            self.files[name] = open(os.path.join(self.output_dir, name), "w")
+        self.files[name].write(line + "\n")
+        self.line_counts[name] += 1
 
-    # Split the output into lines
-    lines = output.splitlines()
+    def incumbent_found(self, value, solver_time):
+        if self.summary["first_incumbent_time"] is None:
+            self.summary["first_incumbent_time"] = round(self.wall_time(), 3)
+            self.summary["first_incumbent_solver_time"] = solver_time
+        self.summary["incumbent"] = value
 
-    # Flags to identify the current section
-    in_evac_section = False
-    in_vehicles_section = False
+    # Handle one line of output. Returns True if the callback asked to stop the run.
+    def feed(self, line):
+        line = line.strip()
 
-    for line in lines:
         if evac_start_pattern.search(line):
-            in_evac_section = True
-            in_vehicles_section = False
-            continue
+            self.section = "evac.csv"
+            return False
         elif vehicles_start_pattern.search(line):
-            in_evac_section = False
-            in_vehicles_section = True
-            continue
-        elif line.strip() == "<<< post process" or line.strip() == "<<< done":
-            # Stop parsing when we reach these markers
-            in_vehicles_section = False
-            in_evac_section = False
-
-        if in_evac_section:
-            evac_lines.append(line.strip())
-        elif in_vehicles_section:
+            self.section = "vehicles.csv"
+            return False
+        elif line in array_sections:
+            self.section = array_sections[line]
+            return False
+        elif line in section_end_lines:
+            # Stop parsing the sections when we reach these markers
+            self.section = None
+
+        if self.section == "evac.csv":
+            if evac_line_pattern.match(line):
+                self.write_section_line("evac.csv", line)
+                self.array_lines["evac"].append(line)
+            return False
+        elif self.section == "vehicles.csv":
             # Validate the line structure before adding
-            if re.match(r"^\d+(,\d+)*$", line.strip()):
-                vehicles_lines.append(line.strip())
+            if vehicles_line_pattern.match(line):
+                self.write_section_line("vehicles.csv", line)
+                self.array_lines["x"].append(line)
+            return False
+        elif self.section in array_sections.values():
+            if vehicles_line_pattern.match(line):
+                self.array_lines[self.section].append(line)
+            return False
+
+        match = phase_pattern.match(line)
+        if match:
+            phase = match.group(1)
+            self.summary["phases"][phase] = round(self.wall_time(), 3)
+            return self.emit({"event": "phase", "phase": phase})
+
+        match = elapsed_pattern.match(line)
+        if match:
+            self.cplex_elapsed = float(match.group(1))
+            return False
+
+        match = incumbent_pattern.search(line)
+        if match:
+            self.incumbent_found(float(match.group(1)), float(match.group(2)))
+            return self.emit({"event": "incumbent", "incumbent": float(match.group(1)),
+                              "solver_time": float(match.group(2))})
+
+        match = node_log_pattern.match(line)
+        if match:
+            record = {
+                "event": "progress",
+                "node": int(match.group(1)),
+                "nodes_left": int(match.group(2)),
+                "incumbent": float(match.group(3)),
+                "best_bound": float(match.group(4)),
+                "gap": float(match.group(5)) / 100,
+                "solver_time": self.cplex_elapsed,
+            }
+            if self.summary["incumbent"] is None:
+                self.incumbent_found(record["incumbent"], self.cplex_elapsed)
+            self.summary.update({key: record[key] for key in ("incumbent", "best_bound", "gap")})
+            self.summary["nodes"] = record["node"]
+            return self.emit(record)
+
+        match = objective_pattern.match(line)
+        if match:
+            self.summary["objective"] = float(match.group(1))
+            return self.emit({"event": "objective", "objective": self.summary["objective"]})
+
+        return False
 
-    # Write evac.csv
-    with open("evac.csv", "w") as evac_file:
-        evac_file.write("\n".join(evac_lines))
-    print("evac.csv written successfully.")
+    # Trace each oplrun phase (e.g. oplrun.generate, oplrun.solve) from its marker to the next one
+    def trace_phases(self, end_time):
+        phases = list(self.summary["phases"].items())
+        for (phase, start), (_, stop) in zip(phases, phases[1:] + [(None, end_time)]):
+            instrument.add_span(f"oplrun.{phase}", self.start_epoch + start, stop - start,
+                                output_dir=self.output_dir)
 
-    # Write vehicles.csv
-    with open("vehicles.csv", "w") as vehicles_file:
-        vehicles_file.write("\n".join(vehicles_lines))
-    print("vehicles.csv written successfully.")
+    def close(self):
+        # The CSV files are always written, even if a section was missing from the output
+        for name in ("evac.csv", "vehicles.csv"):
+            if name not in self.files:
+                self.files[name] = open(os.path.join(self.output_dir, name), "w")
+            self.files[name].close()
+            instrument.count("csv.rows", self.line_counts[name], file=name)
+        self.write_arrays()
+        self.summary["wall_time"] = round(self.wall_time(), 3)
+        self.trace_phases(self.summary["wall_time"])
+        self.summary["rows"] = dict(self.line_counts)
+        self.emit(dict(self.summary, event="summary"))
+        if self.metrics_file:
+            self.metrics_file.close()
 
-def run_opl_and_generate_csv(opl_executable, mod_file, dat_file):
+    @instrument.span("results.parse")
+    def write_arrays(self):
+        lines = self.array_lines
+        arrays = {
+            "x": results_io.parse_lines(lines["x"]),
+            "y": results_io.parse_lines(lines["y"], 4),
+            "z": results_io.parse_lines(lines["z"], 3),
+        }
+        for name in ("cells", "periods"):
+            values = results_io.parse_lines(lines[name])
+            arrays[name] = None if values is None else values.ravel()
+        if lines["evac"]:
+            rows = [line.split(",") for line in lines["evac"]]
+            arrays["sources"] = [int(cell) for cell, _ in rows]
+            arrays["e"] = [round(float(value)) for _, value in rows]
+        results_io.write_results(self.output_dir, arrays, self.summary["objective"])
+
+
+def parse_and_write_csv(output, output_dir="."):
+    parser = OplOutputParser(output_dir)
+    for line in output.splitlines():
+        parser.feed(line)
+    parser.close()
+    instrument.debug("evac.csv written successfully.")
+    instrument.debug("vehicles.csv written successfully.")
+    return parser.summary
+
+
+# Print a compact line for each progress record
+def print_progress(record):
+    if record["event"] == "progress":
+        print(f"progress: node {record['node']}, incumbent {record['incumbent']}, "
+              f"bound {record['best_bound']}, gap {record['gap']:.2%}", flush=True)
+    elif record["event"] == "phase":
+        print(f"phase: {record['phase']}", flush=True)
+
+
+# Ask oplrun to stop, and kill it if it does not exit in time
+def stop_process(process, grace_period=10):
+    if os.name != "posix":
+        # terminate() only stops the process itself, which would leave e.g. the oplrun started
+        # by a solve.py process running, so the whole process tree is killed
+        try:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+        except OSError:
+            process.kill()
+        process.wait()
+        return
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=grace_period)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# Write a MIP start for the model into output_dir and return the oplrun arguments that
+# solve the model from it, or None if no start could be built
+def warm_start_arguments(mod_file, dat_file, output_dir):
+    start_file = os.path.abspath(os.path.join(output_dir, "start.dat"))
+    try:
+        objective = warm_start_io.write_start(mod_file, dat_file, start_file)
+    # ValueError: the simulated plan does not fit the model, e.g. it uses an inactive arc
+    except (OSError, ValueError) as e:
+        print("Could not build a warm start, solving without it:", e)
+        return None, None
+    print(f"Warm start with simulated objective {objective:.4f} written to {start_file}")
+    return [warm_start_io.start_model, start_file], objective
+
+
+# Runs oplrun and reads its output as it arrives. The run is stopped early when
+# metrics_callback returns True for a record, or when the gap falls to stop_gap.
+# With warm_start, the solve starts from a heuristic solution (see warm_start.py).
+def run_opl_and_generate_csv(opl_executable, mod_file, dat_file, output_dir=".", metrics_file=None,
+                             metrics_callback=None, stop_gap=None, extra_args=(), cwd=None, warm_start=False,
+                             start=None):
+    summary = None
     try:
         # Construct the command
-        command = [opl_executable, mod_file, dat_file]
+        command = [opl_executable, *extra_args, mod_file, dat_file]
+        # start is the result of warm_start_arguments, if the caller already built the warm start
+        start_arguments, start_objective = start or (None, None)
+        if warm_start and start is None:
+            start_arguments, start_objective = warm_start_arguments(mod_file, dat_file, output_dir)
+        if start_arguments:
+            command = [opl_executable, *extra_args, *start_arguments]
 
-        # Run the command and capture output
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        output, _ = process.communicate()  # Get full output
+        def on_record(record):
+            stop = bool(metrics_callback(record)) if metrics_callback else False
+            if stop_gap is not None and record.get("gap") is not None and record["gap"] <= stop_gap:
+                stop = True
+            return stop
 
-        # Parse the output and generate CSV files
-        parse_and_write_csv(output)
+        parser = OplOutputParser(output_dir, on_record, metrics_file)
+        # Run the command and read its output line by line
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, bufsize=1, cwd=cwd)
+        stopped = False
+        try:
+            with instrument.span("oplrun", mod=os.path.basename(mod_file), dat=os.path.basename(dat_file)) as fields:
+                for line in process.stdout:
+                    if parser.feed(line) and not stopped:
+                        print("Stopping oplrun early.")
+                        stopped = True
+                        stop_process(process)
+                process.wait()
+                fields["return_code"] = process.returncode
+                fields["oplrun_peak_rss_mb"] = instrument.peak_memory(children=True)
+        finally:
+            if process.poll() is None:
+                process.kill()
+            parser.summary["stopped_early"] = stopped
+            parser.summary["return_code"] = process.returncode
+            parser.summary["warm_start"] = bool(start_arguments)
+            parser.summary["start_objective"] = start_objective
+            parser.close()
+        summary = parser.summary
 
-    except Exception as e:
-        print("Error running oplrun or processing output:", e)
+        instrument.debug("evac.csv written successfully.")
+        instrument.debug("vehicles.csv written successfully.")
 
-if __name__ == "__main__":
-    # Ensure the correct number of arguments are provided
-    if len(sys.argv) != 3:
-        print("Usage: python solve.py <mod_file> <dat_file>")
-        sys.exit(1)
+    except (OSError, subprocess.SubprocessError) as e:
+        print("Error running oplrun:", e)
+
+    return summary
 
-    # Extract file paths from arguments
-    mod_file = sys.argv[1]
-    dat_file = sys.argv[2]
 
+# Same as run_opl_and_generate_csv, but the result is taken from the cache when the
+# model, the data and the solver settings are identical to a previous run
+def run_with_cache(cache, opl_executable, mod_file, dat_file, output_dir=".", metrics_file=None,
+                   metrics_callback=None, stop_gap=None, extra_args=(), cwd=None, warm_start=False):
+    settings = {"stop_gap": stop_gap, "extra_args": list(extra_args)}
+    start, start_files = None, ()
+    if warm_start:
+        settings["warm_start"] = True
+        # The start model and the start .dat shape the result as well, so they are part of the key
+        start = warm_start_arguments(mod_file, dat_file, output_dir)
+        start_files = tuple(start[0] or ())
+    key = result_cache.cache_key(mod_file, dat_file, settings, start_files)
+    summary = cache.get(key, output_dir)
+    if summary is not None:
+        print(f"Using the cached result {key[:12]}.")
+        summary["cached"] = True
+        return summary
+
+    summary = run_opl_and_generate_csv(opl_executable, mod_file, dat_file, output_dir, metrics_file,
+                                       metrics_callback, stop_gap, extra_args, cwd, warm_start, start)
+    # Only complete runs are cached
+    if summary is not None and summary["return_code"] == 0 and not summary["stopped_early"] \
+            and summary["rows"]["vehicles.csv"] > 0:
+        cache.put(key, output_dir, summary)
+    return summary
+
+
+# Solves every variant (run id, labels, blocks) in a single oplrun process with
+# jesdra_resolve.mod, which only applies the parameter changes between the scenarios.
+# The output of each scenario is written into output_dir/<run id>. Returns the summary
+# of each scenario by run id; scenarios without output are missing.
+def run_resolve(opl_executable, mod_file, dat_file, variants, output_dir=".", metrics_callback=None,
+                extra_args=()):
+    os.makedirs(output_dir, exist_ok=True)
+    queue_file = os.path.abspath(os.path.join(output_dir, "queue.dat"))
+    rows = scenario_queue.write_queue(mod_file, dat_file, variants, queue_file)
+    print(f"{len(variants)} scenarios with {len(rows)} parameter changes written to {queue_file}")
+    regenerated = {row[0] for row in rows if row[1] in scenario_queue.structural_parameters}
+    if regenerated:
+        print(f"The model is generated again for {len(regenerated)} scenarios with structural changes")
+    run_ids = [run_id for run_id, _, _ in variants]
+
+    summaries = {}
+    parser = None
+
+    def finish(parser):
+        parser.close()
+        summaries[parser.summary["scenario"]] = parser.summary
+
+    command = [opl_executable, *extra_args, scenario_queue.resolve_model, queue_file]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, bufsize=1, cwd=output_dir)
+    try:
+        with instrument.span("oplrun.resolve", scenarios=len(variants)):
+            for line in process.stdout:
+                match = scenario_pattern.match(line.strip())
+                if match:
+                    if parser:
+                        finish(parser)
+                    run_id = run_ids[int(match.group(1)) - 1]
+                    run_dir = os.path.join(output_dir, run_id)
+                    os.makedirs(run_dir, exist_ok=True)
+                    parser = OplOutputParser(run_dir, metrics_callback, os.path.join(run_dir, "metrics.jsonl"))
+                    parser.summary["scenario"] = run_id
+                elif parser:
+                    parser.feed(line)
+            process.wait()
+    finally:
+        if process.poll() is None:
+            process.kill()
+        if parser:
+            finish(parser)
+    for summary in summaries.values():
+        summary["return_code"] = process.returncode
+    return summaries
+
+
+# Solves the model window by window (see rolling_horizon.py). Each window is solved in
+# output_dir/window_NNN, and the kept periods of all windows are written to output_dir
+# as evac.csv, vehicles.csv and the binary results. Returns None if a window fails.
+def run_rolling(opl_executable, dat_file, output_dir=".", window=20, step=10, metrics_callback=None,
+                stop_gap=None, extra_args=()):
+    start_time = time.monotonic()
+    data = dat_io.load_dat(dat_file)
+    with open(dat_file, "r") as f:
+        base_text = f.read()
+    ranges = rolling_horizon.window_ranges(data["T"], window, step)
+
+    parts, window_summaries = [], []
+    x0, e = None, None
+    for number, (start, stop) in enumerate(ranges):
+        window_dir = os.path.abspath(os.path.join(output_dir, f"window_{number:03d}"))
+        os.makedirs(window_dir, exist_ok=True)
+        text = base_text
+        for name, literal in rolling_horizon.window_blocks(data, start, stop, x0).items():
+            text = dat_io.replace_block(text, name, literal)
+        window_dat = os.path.join(window_dir, "window.dat")
+        with open(window_dat, "w") as f:
+            f.write(text)
+        state_dat = os.path.join(window_dir, "state.dat")
+        with open(state_dat, "w") as f:
+            f.write("\n".join(f"{name} = {literal};\n" for name, literal in
+                              rolling_horizon.state_blocks(data, window_dat, start, stop, x0, e).items()))
+
+        print(f"Window {number + 1}/{len(ranges)}: periods {data['T'][start]}-{data['T'][stop - 1]}")
+        with instrument.span("rolling.window", window=number + 1, start=int(data["T"][start])):
+            summary = run_opl_and_generate_csv(opl_executable, rolling_horizon.window_model, state_dat, window_dir,
+                                               os.path.join(window_dir, "metrics.jsonl"), metrics_callback,
+                                               stop_gap, extra_args, cwd=window_dir)
+        if summary is None or summary["return_code"] != 0 or not summary["rows"]["vehicles.csv"]:
+            print(f"Window {number + 1} has no solution, stopping.")
+            return None
+        window_summaries.append(summary)
+        results = results_io.load_results(window_dir, mmap=False)
+        kept = rolling_horizon.committed_periods(data, start, stop, step)
+        parts.append((start, kept, results))
+        if stop < len(data["T"]):
+            x0 = results["x"][:, kept]
+        if e is None:
+            e = results["e"]
+
+    arrays = rolling_horizon.stitch(data, parts)
+    objective = rolling_horizon.plan_objective(data, arrays["x"], arrays["e"])
+    write_plan(output_dir, arrays, objective)
+
+    return {
+        "objective": objective,
+        "windows": len(ranges),
+        "window_objectives": [summary["objective"] for summary in window_summaries],
+        "first_incumbent_time": window_summaries[0]["first_incumbent_time"],
+        "wall_time": round(time.monotonic() - start_time, 3),
+        "return_code": 0,
+        "stopped_early": any(summary["stopped_early"] for summary in window_summaries),
+        "rows": {"evac.csv": len(arrays["sources"]), "vehicles.csv": len(arrays["x"])},
+    }
+
+
+# Write a plan that was not printed by oplrun (results_io arrays) as evac.csv, vehicles.csv
+# and the binary results
+def write_plan(output_dir, arrays, objective):
+    with open(os.path.join(output_dir, "evac.csv"), "w") as f:
+        for source, decision in zip(arrays["sources"].tolist(), arrays["e"].tolist()):
+            f.write(f"{source},{decision}\n")
+    with open(os.path.join(output_dir, "vehicles.csv"), "w") as f:
+        for row in arrays["x"].tolist():
+            f.write(",".join(map(str, row)) + "\n")
+    results_io.write_results(output_dir, arrays, objective)
+    instrument.debug("evac.csv written successfully.")
+    instrument.debug("vehicles.csv written successfully.")
+
+
+# Approximate solve through the LP relaxation (see relaxation.py). The rounded plan is written
+# to output_dir, or with polish (seconds), the plan of a time-limited solve with e fixed that
+# starts from it. The summary holds the LP bound and the gap of the objective to it.
+def run_fast(opl_executable, mod_file, dat_file, output_dir=".", polish=None, metrics_callback=None,
+             extra_args=()):
+    start_time = time.monotonic()
+    os.makedirs(output_dir, exist_ok=True)
+    relax_file = os.path.abspath(os.path.join(output_dir, "relax.dat"))
+    relaxation.write_relax_data(mod_file, dat_file, relax_file)
+    with instrument.span("oplrun.relax", dat=os.path.basename(dat_file)):
+        process = subprocess.run([opl_executable, *extra_args, relaxation.relax_model, relax_file],
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, cwd=output_dir)
+    relaxed = relaxation.parse_relaxation(process.stdout.splitlines())
+    if relaxed["bound"] is None:
+        print("The LP relaxation has no solution.")
+        return None
+    lp_time = round(time.monotonic() - start_time, 3)
+
+    data = dat_io.load_dat(dat_file)
+    model = simulate.CellTransmissionModel(data)
+    e, result = relaxation.round_decisions(model, relaxed["e"])
+    arrays = model.results_arrays(e, result)
+    arrays["z"] = relaxation.round_allocations(data, relaxed["z"])
+    objective = float(result["objective"][0])
+    write_plan(output_dir, arrays, objective)
+    summary = {
+        "objective": objective,
+        "rounded_objective": objective,
+        "bound": relaxed["bound"],
+        "lp_time": lp_time,
+        "polished": False,
+        "return_code": process.returncode,
+        "stopped_early": False,
+        "rows": {"evac.csv": len(e), "vehicles.csv": len(arrays["x"])},
+    }
+
+    if polish:
+        start_file = os.path.abspath(os.path.join(output_dir, "start.dat"))
+        values = warm_start_io.plan_values(data, model, e, objective)
+        blocks = warm_start_io.start_blocks(data, values, mod_file, dat_file, fix_e=True, time_limit=polish)
+        with open(start_file, "w") as f:
+            f.write("\n".join(f"{name} = {literal};\n" for name, literal in blocks.items()))
+        polished = run_opl_and_generate_csv(opl_executable, warm_start_io.start_model, start_file, output_dir,
+                                            metrics_callback=metrics_callback, extra_args=extra_args,
+                                            cwd=output_dir)
+        if polished and polished["objective"] is not None and polished["objective"] <= objective:
+            summary.update(objective=polished["objective"], polished=True, return_code=polished["return_code"],
+                           rows=polished["rows"])
+        else:
+            # The polish found nothing better, keep the rounded plan
+            write_plan(output_dir, arrays, objective)
+
+    summary["gap"] = relaxation.relaxation_gap(summary["objective"], summary["bound"])
+    summary["wall_time"] = round(time.monotonic() - start_time, 3)
+    return summary
+
+
+# Archive the output of a finished run (see archive.py) and print its run id. A cached result
+# is only archived if the run that produced it was not, e.g. because of --no-archive.
+def archive_output(output_dir, mod_file, dat_file, summary, params, mode, archive_dir=archive.default_archive_dir):
+    if summary is None or not results_io.has_results(output_dir) or summary["rows"]["vehicles.csv"] == 0:
+        return None
+    if summary.get("cached"):
+        run_id = archive.archived_run(mod_file, dat_file, params, mode, archive_dir)
+        if run_id is not None:
+            print(f"Cached result of run {run_id} in {archive_dir}, not archived again")
+            return run_id
+    run_id = archive.archive_run(output_dir, mod_file, dat_file, summary, params, mode, archive_dir)
+    print(f"Archived as run {run_id} in {archive_dir}")
+    return run_id
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a JESDRA model with oplrun and write evac.csv and vehicles.csv.")
+    parser.add_argument("mod_file")
+    parser.add_argument("dat_file")
     # Path to oplrun executable
-    opl_executable = ""
+    parser.add_argument("--oplrun", default=os.environ.get("OPLRUN", ""),
+                        help="Path to the oplrun executable (default: $OPLRUN).")
+    parser.add_argument("--output-dir", default=".", help="Directory to write the CSV files to.")
+    parser.add_argument("--metrics", help="Append the solver progress to this JSON-lines file.")
+    parser.add_argument("--stop-gap", type=float, help="Stop the solve once the relative gap is at most this value, e.g. 0.01.")
+    parser.add_argument("--resolve", metavar="GRID_FILE",
+                        help="Solve every variant of this sweep.py grid in one oplrun process, "
+                             "writing each into its own directory under --output-dir.")
+    parser.add_argument("--rolling", type=int, metavar="WINDOW",
+                        help="Solve windows of this many periods in sequence with jesdra_window.mod instead of the whole horizon.")
+    parser.add_argument("--rolling-step", type=int,
+                        help="Periods between the starts of two windows (default: half the window).")
+    parser.add_argument("--fast", action="store_true",
+                        help="Solve the LP relaxation and round it into a plan instead of solving the MIP.")
+    parser.add_argument("--polish", type=float, metavar="SECONDS",
+                        help="With --fast, improve the rounded plan with a MIP solve of at most this many seconds "
+                             "with the evacuation decisions fixed.")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="Start the solve from a heuristic solution built with the simulator.")
+    parser.add_argument("--quiet", action="store_true", help="Do not print the solver progress.")
+    parser.add_argument("--no-cache", action="store_true", help="Always run oplrun, even if a cached result exists.")
+    parser.add_argument("--cache-dir", default=result_cache.default_cache_dir)
+    parser.add_argument("--cache-size", type=float, default=1024, help="Maximum size of the result cache in MB.")
+    parser.add_argument("--no-archive", action="store_true", help="Do not add the run to the run archive.")
+    parser.add_argument("--archive-dir", default=archive.default_archive_dir)
+    args = parser.parse_args()
 
-    # Run the OPL model and generate CSV files
-    run_opl_and_generate_csv(opl_executable, mod_file, dat_file)
+    if not args.oplrun:
+        print("Usage: python solve.py <mod_file> <dat_file> --oplrun <path to oplrun>")
+        sys.exit(1)
 
+    # Run the OPL model and generate CSV files
+    callback = None if args.quiet else print_progress
+    if args.resolve:
+        # sweep.py imports this module, so it is only imported here
+        import sweep
+        with open(args.resolve, "r") as f:
+            grid = json.load(f)
+        with open(args.dat_file, "r") as f:
+            variants = sweep.expand_grid(grid, f.read())
+        summaries = run_resolve(args.oplrun, args.mod_file, args.dat_file, variants, args.output_dir, callback)
+        rows = []
+        for run_id, labels, _ in variants:
+            summary = summaries.get(run_id)
+            run_dir = os.path.join(args.output_dir, run_id)
+            rows.append({"run_id": run_id, **labels,
+                         **sweep.summary_row(summary, run_dir, summary["wall_time"] if summary else 0)})
+        sweep.write_summary(args.output_dir, list(grid.keys()), rows)
+        sys.exit(0 if len(summaries) == len(variants) else 1)
+    if args.rolling:
+        step = args.rolling_step or max(1, args.rolling // 2)
+        summary = run_rolling(args.oplrun, args.dat_file, args.output_dir, args.rolling, step, callback,
+                              args.stop_gap)
+        if summary is None:
+            sys.exit(1)
+        if not args.no_archive:
+            archive_output(args.output_dir, rolling_horizon.window_model, args.dat_file, summary,
+                           {"stop_gap": args.stop_gap, "window": args.rolling, "step": step}, "rolling",
+                           args.archive_dir)
+        print(f"Objective of the stitched plan: {summary['objective']:.4f} ({summary['windows']} windows, "
+              f"{summary['wall_time']} s)")
+        sys.exit(0)
+    if args.fast:
+        summary = run_fast(args.oplrun, args.mod_file, args.dat_file, args.output_dir, args.polish, callback)
+        if summary is None:
+            sys.exit(1)
+        if not args.no_archive:
+            archive_output(args.output_dir, args.mod_file, args.dat_file, summary, {"polish": args.polish}, "fast",
+                           args.archive_dir)
+        gap = "unknown" if summary["gap"] is None else f"{summary['gap']:.2%}"
+        print(f"Objective {summary['objective']:.4f} ({'polished' if summary['polished'] else 'rounded'}), "
+              f"LP bound {summary['bound']:.4f}, gap {gap} ({summary['wall_time']} s)")
+        sys.exit(0)
+    if args.no_cache:
+        summary = run_opl_and_generate_csv(args.oplrun, args.mod_file, args.dat_file, args.output_dir,
+                                           args.metrics, callback, args.stop_gap, warm_start=args.warm_start)
+    else:
+        cache = result_cache.ResultCache(args.cache_dir, args.cache_size)
+        summary = run_with_cache(cache, args.oplrun, args.mod_file, args.dat_file, args.output_dir,
+                                 args.metrics, callback, args.stop_gap, warm_start=args.warm_start)
+    if summary is None:
+        sys.exit(1)
+    if not args.no_archive:
+        archive_output(args.output_dir, args.mod_file, args.dat_file, summary,
+                       {"stop_gap": args.stop_gap, "warm_start": args.warm_start}, "mip", args.archive_dir)
+    if summary.get("first_incumbent_time") is not None:
+        start = "with" if summary.get("warm_start") else "without"
+        print(f"First incumbent after {summary['first_incumbent_time']} s ({start} warm start)")
@@ -0,0 +1,184 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import dat_io
+import result_cache
+import results_io
+import solve
+
+# Runs the model over a grid of parameter overrides of a base .dat file.
+#
+# The grid is a JSON object mapping a parameter name (D, s_factor, Q, N, delta, c, ...)
+# to its alternatives. Each alternative is either
+#   - a number or a (nested) list of numbers,
+#   - a string with an OPL literal, e.g. "[450, 1005, 535, 675]",
+#   - "@path" to read the literal from a file (the file may also hold a full "name = ...;" statement),
+# or the whole entry can be the string "comments" to use the active value of the parameter
+# in the base .dat together with every commented-out "// name = ...;" alternative.
+# Every combination of alternatives is materialized as a .dat file in its own run directory.
+
+
+def literal_for(value):
+    if isinstance(value, str):
+        if value.startswith("@"):
+            with open(value[1:], "r") as f:
+                text = f.read()
+            literal = text.strip().rstrip(";")
+            if "=" in literal:
+                literal = literal.split("=", 1)[1].strip()
+            return literal
+        return value
+    if isinstance(value, (list, tuple)):
+        return dat_io.format_array(value)
+    return str(value)
+
+
+# List of (name, [literal, ...]) for each parameter in the grid
+def expand_alternatives(grid, base_text):
+    alternatives = []
+    for name, values in grid.items():
+        if values == "comments":
+            literals = dat_io.block_alternatives(base_text, name)
+            if not literals:
+                raise ValueError(f"'{name}' does not appear in the base .dat file")
+        else:
+            literals = [literal_for(value) for value in values]
+        alternatives.append((name, literals))
+    return alternatives
+
+
+# Every combination of alternatives, as a list of (run id, {name: alternative index}, {name: literal})
+def expand_grid(grid, base_text):
+    alternatives = expand_alternatives(grid, base_text)
+    names = [name for name, _ in alternatives]
+    variants = []
+    choices = itertools.product(*[range(len(literals)) for _, literals in alternatives])
+    for number, indices in enumerate(choices):
+        labels = dict(zip(names, indices))
+        blocks = {name: alternatives[k][1][index] for k, (name, index) in enumerate(labels.items())}
+        variants.append((f"run_{number:03d}", labels, blocks))
+    return variants
+
+
+def evacuated_sources(run_dir):
+    if results_io.has_results(run_dir):
+        results = results_io.load_results(run_dir)
+        return results["sources"][results["e"] == 1].tolist()
+    sources = []
+    evac_path = os.path.join(run_dir, "evac.csv")
+    if not os.path.exists(evac_path):
+        return sources
+    with open(evac_path, "r") as evac_file:
+        for row in csv.reader(evac_file):
+            if row and float(row[1]) >= 0.5:
+                sources.append(int(row[0]))
+    return sources
+
+
+# Materialize one variant and solve it in its own directory
+def run_variant(opl_executable, mod_file, base_text, run_dir, blocks, use_cache, cache_dir):
+    os.makedirs(run_dir, exist_ok=True)
+    dat_file = os.path.join(run_dir, "variant.dat")
+    text = base_text
+    for name, literal in blocks.items():
+        text = dat_io.replace_block(text, name, literal)
+    with open(dat_file, "w") as f:
+        f.write(text)
+
+    start = time.monotonic()
+    metrics_file = os.path.join(run_dir, "metrics.jsonl")
+    if use_cache:
+        cache = result_cache.ResultCache(cache_dir)
+        summary = solve.run_with_cache(cache, opl_executable, mod_file, dat_file, run_dir, metrics_file,
+                                       cwd=run_dir)
+    else:
+        summary = solve.run_opl_and_generate_csv(opl_executable, mod_file, dat_file, run_dir, metrics_file,
+                                                 cwd=run_dir)
+    runtime = time.monotonic() - start
+    return summary_row(summary, run_dir, runtime)
+
+
+# Row of summary.csv for the solve summary of the run in run_dir
+def summary_row(summary, run_dir, runtime):
+    sources = evacuated_sources(run_dir)
+    return {
+        "objective": summary.get("objective") if summary else None,
+        "gap": summary.get("gap") if summary else None,
+        "evacuated": len(sources),
+        "evacuated_sources": " ".join(map(str, sources)),
+        "runtime": round(runtime, 3),
+        "status": "error" if summary is None or summary["return_code"] != 0 else
+                  "cached" if summary.get("cached") else "solved",
+    }
+
+
+# Runs every variant of the grid in a process pool and writes summary.csv into output_dir
+def run_sweep(opl_executable, mod_file, base_dat, grid, output_dir, workers=None, use_cache=True,
+              cache_dir=result_cache.default_cache_dir):
+    with open(base_dat, "r") as f:
+        base_text = f.read()
+    variants = expand_grid(grid, base_text)
+    mod_file = os.path.abspath(mod_file)
+    # The runs do not share the current directory, so a relative oplrun path has to be resolved here
+    if os.path.dirname(opl_executable):
+        opl_executable = os.path.abspath(opl_executable)
+    cache_dir = os.path.abspath(cache_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    rows = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_variant, opl_executable, mod_file, base_text,
+                            os.path.abspath(os.path.join(output_dir, run_id)), blocks,
+                            use_cache, cache_dir): (run_id, labels)
+            for run_id, labels, blocks in variants
+        }
+        for future in as_completed(futures):
+            run_id, labels = futures[future]
+            rows[run_id] = {"run_id": run_id, **labels, **future.result()}
+            print(f"{run_id} {labels}: {rows[run_id]['status']}, objective {rows[run_id]['objective']}")
+
+    rows = [rows[run_id] for run_id in sorted(rows)]
+    write_summary(output_dir, list(grid.keys()), rows)
+    return rows
+
+
+def write_summary(output_dir, names, rows):
+    fields = ["run_id", *names, "objective", "gap", "evacuated", "evacuated_sources", "runtime", "status"]
+    summary_path = os.path.join(output_dir, "summary.csv")
+    with open(summary_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    print(f"Summary of {len(rows)} runs written to {summary_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a .dat file over a grid of parameter overrides.")
+    parser.add_argument("mod_file")
+    parser.add_argument("dat_file", help="Base .dat file.")
+    parser.add_argument("grid_file", nargs="?", help="JSON file mapping parameter names to their alternatives.")
+    parser.add_argument("--from-comments", nargs="+", default=[], metavar="NAME",
+                        help="Sweep over the commented-out alternatives of these parameters in the base .dat.")
+    parser.add_argument("--oplrun", default=os.environ.get("OPLRUN", ""),
+                        help="Path to the oplrun executable (default: $OPLRUN).")
+    parser.add_argument("--output-dir", default="sweep", help="Directory for the run directories and summary.csv.")
+    parser.add_argument("--workers", type=int, help="Number of oplrun processes to run at once.")
+    parser.add_argument("--no-cache", action="store_true", help="Always run oplrun, even if a cached result exists.")
+    args = parser.parse_args()
+
+    grid = {}
+    if args.grid_file:
+        with open(args.grid_file, "r") as f:
+            grid = json.load(f)
+    for name in args.from_comments:
+        grid[name] = "comments"
+    if not grid:
+        parser.error("Give a grid file or --from-comments")
+
+    run_sweep(args.oplrun, args.mod_file, args.dat_file, grid, args.output_dir, args.workers, not args.no_cache)
@@ -0,0 +1,30 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import dat_io  # noqa: E402
+import results_io  # noqa: E402
+import simulate  # noqa: E402
+
+
+def repo_file(name):
+    return os.path.join(root, name)
+
+
+# Results directory of a simulated plan on toy.dat, in the format solve.py writes
+def simulated_results(directory, e=(1, 1, 0)):
+    model = simulate.CellTransmissionModel(dat_io.load_dat(repo_file("toy.dat"), use_cache=False))
+    e = np.array(e)
+    result = model.run(e, keep_history=True)
+    os.makedirs(directory, exist_ok=True)
+    results_io.write_results(directory, model.results_arrays(e, result), float(result["objective"][0]))
+    return directory
+
+
+@pytest.fixture
+def toy_results(tmp_path):
+    return simulated_results(str(tmp_path / "results"))
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import dat_io  # noqa: E402
+
+# Stands in for oplrun in the tests: "stub_oplrun.py [options] model.mod data.dat" prints the
+# sections of jesdra.mod for the plan that evacuates every source, with all vehicles still at
+# their sources, so solve.py and sweep.py can be run without CPLEX. The objective is the total
+# demand, so it depends on the data.
+
+
+def set_literal(text, name):
+    return [int(value) for value in dat_io.block_literal(text, name).strip("{} ").split(",")]
+
+
+if __name__ == "__main__":
+    with open(sys.argv[-1]) as f:
+        text = f.read()
+    cells = set_literal(text, "I")
+    sources = set_literal(text, "S_o")
+    periods = set_literal(text, "T")
+    demand = [int(float(value)) for value in dat_io.block_literal(text, "D").strip("[] ").split(",")]
+    vehicles = {source: d for source, d in zip(sources, demand)}
+
+    print("<<< generate")
+    print("<<< solve")
+    print(f"OBJECTIVE: {float(sum(demand))}")
+    print("<<< post process")
+    print("evac.csv:")
+    for source in sources:
+        print(f"{source},1")
+    print("vehicles.csv:")
+    for cell in cells:
+        print(",".join([str(vehicles.get(cell, 0))] * len(periods)))
+    print("cells:")
+    print(",".join(map(str, cells)))
+    print("periods:")
+    print(",".join(map(str, periods)))
+    print("flows.coo:")
+    print("allocations.coo:")
+    print("<<< done")
@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pytest
+import archive
+import results_io
+import solve
+from conftest import repo_file, simulated_results
+
+
+def test_archive_queries(tmp_path):
+    archive_dir = str(tmp_path / "runs")
+    runs = []
+    for name, e, objective in (("a", (1, 1, 0), 10.0), ("b", (1, 0, 1), 12.5)):
+        directory = simulated_results(str(tmp_path / name), e)
+        runs.append(archive.archive_run(directory, repo_file("jesdra.mod"), repo_file("toy.dat"),
+                                        {"objective": objective}, archive_dir=archive_dir))
+    index = archive.load_index(archive_dir)
+    assert index["run_id"].tolist() == runs
+
+    sources, flipped = archive.flipped_sources(index, runs[0])
+    assert flipped[0].tolist() == [0] * len(sources)
+    assert sorted(sources[flipped[1] != 0].tolist()) == [2, 3]
+
+    cells, delta = archive.peak_delta(index, runs[0], [1])
+    first = results_io.load_results(str(tmp_path / "a"))
+    second = results_io.load_results(str(tmp_path / "b"))
+    expected = dict(zip(second["cells"].tolist(), (second["x"].max(axis=1) - first["x"].max(axis=1)).tolist()))
+    assert dict(zip(cells.tolist(), delta[0].tolist())) == expected
+
+    table = archive.objective_by_demand(index)
+    assert table["runs"].tolist() == [2] and table["mean"].tolist() == [11.25]
+
+    exported = archive.export_run(runs[1], str(tmp_path / "exported"), archive_dir)
+    assert exported["objective"] == 12.5
+    assert np.array_equal(results_io.load_results(str(tmp_path / "exported"))["x"], second["x"])
+
+
+def archive_toy_runs(archive_dir, directory, count):
+    return [archive.archive_run(directory, repo_file("jesdra.mod"), repo_file("toy.dat"), {"objective": 1.0},
+                                {"worker": k}, archive_dir=archive_dir) for k in range(count)]
+
+
+def test_concurrent_archiving_keeps_every_row(tmp_path):
+    archive_dir = str(tmp_path / "runs")
+    directory = simulated_results(str(tmp_path / "results"))
+
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        runs = [run for batch in executor.map(archive_toy_runs, [archive_dir] * 4, [directory] * 4, [3] * 4)
+                for run in batch]
+
+    index = archive.load_index(archive_dir)
+    assert len(set(runs)) == 12
+    assert sorted(index["run_id"].tolist()) == sorted(runs)
+    assert index["e"].shape == (12, 3)
+    assert not os.path.exists(os.path.join(archive_dir, archive.lock_name))
+
+
+def test_index_lock(tmp_path):
+    archive_dir = str(tmp_path)
+    with archive.index_lock(archive_dir):
+        with pytest.raises(TimeoutError):
+            with archive.index_lock(archive_dir, timeout=0.1):
+                pass
+    # A lock left by a process that died is taken over
+    lock_file = os.path.join(archive_dir, archive.lock_name)
+    with open(lock_file, "w") as f:
+        f.write("1")
+    os.utime(lock_file, (0, 0))
+    with archive.index_lock(archive_dir, timeout=0.1):
+        pass
+    assert not os.path.exists(lock_file)
+
+
+def test_cached_results_are_archived_once(tmp_path, capsys):
+    archive_dir = str(tmp_path / "runs")
+    directory = simulated_results(str(tmp_path / "results"))
+    summary = {"objective": 116.1522, "rows": {"vehicles.csv": 29}}
+    params = {"stop_gap": None, "warm_start": False}
+
+    cached = solve.archive_output(directory, repo_file("jesdra.mod"), repo_file("toy.dat"), {**summary, "cached": True},
+                                  params, "mip", archive_dir)
+    solved = solve.archive_output(directory, repo_file("jesdra.mod"), repo_file("toy.dat"), summary, params, "mip",
+                                  archive_dir)
+    hit = solve.archive_output(directory, repo_file("jesdra.mod"), repo_file("toy.dat"), {**summary, "cached": True},
+                               params, "mip", archive_dir)
+
+    # The first cached result was not archived yet, later ones refer to the latest run
+    assert archive.load_index(archive_dir)["run_id"].tolist() == [cached, solved]
+    assert hit == solved
+    assert "not archived again" in capsys.readouterr().out
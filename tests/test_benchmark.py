@@ -0,0 +1,73 @@
+import json
+import os
+import numpy as np
+import benchmark
+import dat_io
+from conftest import repo_file
+
+options = {"layout": "grid", "cells_per_link": 1, "sources": 2, "sinks": 2, "speeds": [1.0], "seed": 0,
+           "max_vp": 4}
+
+
+def test_data_for_model_removes_undeclared_blocks(tmp_path):
+    with open(repo_file("toy.dat")) as f:
+        text = f.read()
+    dat_file = str(tmp_path / "input" / "toy.dat")
+    os.makedirs(os.path.dirname(dat_file))
+    with open(dat_file, "w") as f:
+        f.write(text + "\nnewBlock = [1, 2];\n")
+
+    path = benchmark.data_for_model(repo_file("jesdra.mod"), dat_file, str(tmp_path))
+
+    with open(path) as f:
+        data = dat_io.parse_dat(f.read())
+    assert "newBlock" not in data
+    assert set(data) == set(dat_io.parse_dat(text))
+
+
+def test_conflicts_on_toy_dat():
+    data = dat_io.load_dat(repo_file("toy.dat"), use_cache=False)
+    keys = np.asarray(data["conflictKeys"])
+
+    row, = benchmark.benchmark_conflicts([repo_file("toy.dat")])
+
+    assert row["keys"] == len(keys)
+    # One constraint per key and t1 with t1 + d in T
+    assert row["constraints_after"] == int((len(data["T"]) - keys[:, 2]).sum())
+    assert row["constraints_after"] < row["constraints_before"]
+
+
+def test_pipeline_without_oplrun():
+    row = benchmark.benchmark_pipeline((3, 3), 12, options)
+
+    assert row["size"] == "3x3"
+    assert row["vp"] == 4
+    assert row["cells"] > 9
+    # oplrun is only timed when it is given
+    assert "opl_generate" not in row and "opl_solve" not in row
+    for stage in ("network", "risk", "tau", "presolve", "dat_write", "parse", "first_frame"):
+        assert row[stage] >= 0
+
+
+def test_regressions():
+    previous = {"results": [{"size": "4x4", "periods": 40, "tau": 0.1, "risk": 0.001, "parse": 0.2},
+                            {"size": "8x8", "periods": 40, "tau": 1.0}]}
+    results = [{"size": "4x4", "periods": 40, "tau": 0.2, "risk": 0.005, "parse": 0.25},
+               {"size": "16x16", "periods": 40, "tau": 9.0}]
+
+    # risk is slower too, but below the minimum time; 16x16 has no previous entry
+    assert benchmark.regressions(previous, results) == ["4x4 tau: 0.1s -> 0.2s"]
+    assert benchmark.regressions(previous, results, tolerance=2.5) == []
+
+
+def test_append_history(tmp_path):
+    history_file = str(tmp_path / "history.json")
+
+    assert benchmark.append_history(history_file, [{"size": "4x4", "tau": 0.1}], options) is None
+    previous = benchmark.append_history(history_file, [{"size": "4x4", "tau": 0.2}], options)
+
+    assert previous["results"] == [{"size": "4x4", "tau": 0.1}]
+    with open(history_file) as f:
+        history = json.load(f)
+    assert [entry["results"][0]["tau"] for entry in history] == [0.1, 0.2]
+    assert history[1]["options"] == options
@@ -0,0 +1,59 @@
+import math
+import numpy as np
+import pytest
+import calculate_risk
+from conftest import repo_file
+
+
+# Risk matrix of the original per-cell loop, which only knew the axis-aligned directions
+def baseline_risk(data):
+    cells, disaster, settings = data['cells'], data['disaster'], data['setting']
+    unit_length = settings['unit_length_in_meters']
+    step = disaster['velocity_in_kmh'] * 1000 / 3600 * settings['time_step_length_in_secs']
+    disaster_x = disaster['x_coord'] * unit_length
+    disaster_y = disaster['y_coord'] * unit_length
+    radius = disaster['radius_in_meters']
+    risk = np.zeros((len(cells), settings['n_time_steps']))
+    for t in range(settings['n_time_steps']):
+        for i, cell in enumerate(cells):
+            if cell['type'] != 'shelter':
+                distance = math.sqrt((cell['x_coord'] * unit_length - disaster_x) ** 2 +
+                                     (cell['y_coord'] * unit_length - disaster_y) ** 2)
+                risk[i][t] = 0 if distance > radius else 1 - (distance / radius) ** 2
+        disaster_x += {'+x': step, '-x': -step}.get(disaster['direction'], 0)
+        disaster_y += {'+y': step, '-y': -step}.get(disaster['direction'], 0)
+    return risk
+
+
+@pytest.mark.parametrize("direction", ['+x', '-x', '+y', '-y'])
+def test_risk_matrix_matches_baseline(direction):
+    data = calculate_risk.load_info(repo_file("toy_info.json"))
+    data['disaster']['direction'] = direction
+    risk = calculate_risk.risk_matrix(data)
+    expected = baseline_risk(data)
+    np.testing.assert_allclose(risk, expected, atol=1e-12)
+    assert risk.any()
+    assert calculate_risk.format_risk_matrix(risk) == \
+        '[' + ',\n'.join('[' + ', '.join(f'{val:.4f}' for val in row) + ']' for row in expected) + ']'
+
+    # The same direction given as a heading
+    data['disaster']['heading_in_degrees'] = calculate_risk.direction_headings[direction]
+    np.testing.assert_allclose(calculate_risk.risk_matrix(data), expected, atol=1e-12)
+
+
+@pytest.mark.parametrize("disaster", [
+    {},
+    {'trajectory': [[2, 1], [-2, 1], [2, -2]]},  # Leaves some cells and comes back
+    {'heading_in_degrees': 200.0, 'radius_in_meters': 90},
+])
+def test_sparse_risk_matrix_matches_dense(disaster):
+    data = calculate_risk.load_info(repo_file("toy_info.json"))
+    data['disaster'].update(disaster)
+    dense = calculate_risk.risk_matrix(data, 25)
+    sparse = calculate_risk.sparse_risk_matrix(data, 25)
+    assert sparse.shape == dense.shape
+    np.testing.assert_allclose(sparse.to_dense(), dense, atol=1e-12)
+    assert calculate_risk.format_sparse_risk_matrix(sparse) == calculate_risk.format_risk_matrix(dense)
+    if not disaster:
+        np.testing.assert_allclose(calculate_risk.sparse_risk_matrix(data).to_dense(), baseline_risk(data),
+                                   atol=1e-12)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import calculate_tau
+import dat_io
+from conftest import repo_file
+
+
+# All-pairs distances of the original triple-loop Floyd-Warshall
+def baseline_floyd_warshall(nodes, edges):
+    n = len(nodes)
+    distance = np.full((n, n), float('inf'))
+    node_to_index = {node: i for i, node in enumerate(nodes)}
+    for i in range(n):
+        distance[i][i] = 0
+    for node1, node2, weight in edges:
+        i, j = node_to_index[node1], node_to_index[node2]
+        distance[i][j] = weight
+        distance[j][i] = weight
+    for k in range(n):
+        for i in range(n):
+            for j in range(n):
+                distance[i][j] = min(distance[i][j], distance[i][k] + distance[k][j])
+    return distance
+
+
+# Resource graph between the nodes of Vp in toy.dat: an edge for each pair, with the travel time
+# of the first resource plus half a unit on some edges, so that some paths are shorter than the edges
+def toy_graph():
+    data = dat_io.load_dat(repo_file("toy.dat"), use_cache=False)
+    vp = [str(node) for node in data["Vp"].tolist()]
+    extra = np.random.default_rng(5).choice([0.0, 0.5, 1.5], size=(len(vp), len(vp)))
+    edges = [(vp[i], vp[j], float(data["tau"][0, i, j] + extra[i, j]))
+             for i in range(len(vp)) for j in range(i + 1, len(vp)) if data["tau"][0, i, j] > 0]
+    # The nodes are listed in another order than Vp
+    return sorted(vp, reverse=True), edges, vp
+
+
+def test_distances_match_baseline():
+    nodes, edges, vp = toy_graph()
+    expected = baseline_floyd_warshall(nodes, edges)
+    np.testing.assert_allclose(calculate_tau.floyd_warshall(nodes, edges), expected)
+    rows = [nodes.index(node) for node in vp]
+    np.testing.assert_allclose(calculate_tau.dijkstra_distances(nodes, edges, vp), expected[rows])
+
+
+@pytest.mark.parametrize("method", ["floyd-warshall", "dijkstra"])
+def test_tau_matches_baseline(method):
+    nodes, edges, vp = toy_graph()
+    index = [nodes.index(node) for node in vp]
+    distance = baseline_floyd_warshall(nodes, edges)[np.ix_(index, index)]
+    # The original script rounded the distances and took the row maxima, at one weight unit per period
+    expected = [[int(round(x)) for x in row] for row in distance]
+
+    tau, tau_max = calculate_tau.calculate_tau(nodes, edges, vp, [1.0, 2.0], method)
+    assert tau.shape == (2, len(vp), len(vp))
+    assert tau[0].tolist() == expected
+    assert tau_max[0].tolist() == [max(row) for row in expected]
+    assert tau[1].tolist() == np.rint(distance / 2).astype(int).tolist()
+
+    from_distances = calculate_tau.tau_from_distances(distance, vp, [1.0, 2.0])
+    assert (from_distances[0] == tau).all() and (from_distances[1] == tau_max).all()
+
+
+def test_unreachable_node():
+    nodes, edges, vp = toy_graph()
+    with pytest.raises(ValueError, match="not reachable"):
+        calculate_tau.calculate_tau(nodes + ["lonely"], edges, vp + ["lonely"], [1.0])
@@ -0,0 +1,73 @@
+import os
+import shutil
+import numpy as np
+import pytest
+import dat_io
+from conftest import repo_file
+
+
+def assert_same_data(first, second):
+    assert list(first) == list(second)
+    assert first.kinds == second.kinds
+    for name, value in first.items():
+        if first.kinds[name] == "nested":
+            assert len(value) == len(second[name])
+            assert all(np.array_equal(a, b) for a, b in zip(value, second[name]))
+        elif first.kinds[name] == "scalar":
+            assert value == second[name]
+        else:
+            assert np.array_equal(value, second[name]), name
+
+
+def test_parse_format_round_trip():
+    with open(repo_file("toy.dat")) as f:
+        data = dat_io.parse_dat(f.read())
+    assert data.kinds["A"] == "tuples" and data["A"].shape[1] == 2
+    assert data.kinds["tau"] == "array" and data["tau"].ndim == 3
+    assert data.kinds["inArcs"] == "nested" and len(data["inArcs"]) == len(data["I"])
+    assert_same_data(data, dat_io.parse_dat(dat_io.format_dat(data)))
+
+
+def test_load_dat_cache(tmp_path):
+    dat_file = str(tmp_path / "toy.dat")
+    shutil.copyfile(repo_file("toy.dat"), dat_file)
+    cache_root = tmp_path / dat_io.cache_dir_name
+
+    first = dat_io.load_dat(dat_file)
+    entries = os.listdir(cache_root)
+    assert len(entries) == 1
+    # A second load is served from the cache, memory-mapped
+    second = dat_io.load_dat(dat_file)
+    assert isinstance(second["tau"], np.memmap)
+    assert_same_data(first, second)
+
+    # A changed file is parsed again and replaces the old cache entry
+    dat_io.write_blocks(dat_file, {"D": "[1, 2, 3]"})
+    changed = dat_io.load_dat(dat_file)
+    assert changed["D"].tolist() == [1, 2, 3]
+    assert len(os.listdir(cache_root)) == 1 and os.listdir(cache_root) != entries
+    assert_same_data(changed, dat_io.load_dat(dat_file, use_cache=False))
+
+
+def test_opl_number_literals():
+    data = dat_io.parse_dat("D = [1., .5, +3, -2.5e-1];\n"
+                            "c = [[+1, 2], [3, -4,]];\n"
+                            "tau = [[[1, 2], [3, 4]], [[5, 6], [7, 8]]];\n"
+                            "delta = +2;\nalpha = .25;\n")
+    assert data["D"].tolist() == [1.0, 0.5, 3.0, -0.25]
+    assert data["c"].dtype == np.int64 and data["c"].tolist() == [[1, 2], [3, -4]]
+    assert data["tau"].shape == (2, 2, 2)
+    assert (data["delta"], data["alpha"]) == (2, 0.25)
+    with pytest.raises(ValueError):
+        dat_io.parse_dat("c = [[1, 2], [3]];")
+    with pytest.raises(ValueError):
+        dat_io.parse_dat("c = [[1, 2], [3, x]];")
+
+
+def test_strings_with_semicolons():
+    text = 'modelFile = "runs/a;b.mod";  // a comment; with a semicolon\nD = [1, 2];\nname = "x";'
+    data = dat_io.parse_dat(text)
+    assert data["modelFile"] == "runs/a;b.mod"
+    assert data["D"].tolist() == [1, 2] and data["name"] == "x"
+    assert dat_io.block_literal(text, "modelFile") == '"runs/a;b.mod"'
+    assert dat_io.replace_block(text, "modelFile", '"c.mod"').startswith('modelFile = "c.mod";  //')
@@ -0,0 +1,75 @@
+import networkx as nx
+import pytest
+import discretize
+
+
+def test_attribute_number():
+    assert discretize.attribute_number(None, 7) == 7
+    assert discretize.attribute_number(3, 7) == 3.0
+    assert discretize.attribute_number("2", 7) == 2.0
+    # OSMnx keeps every value of merged ways in a list
+    assert discretize.attribute_number(["2", "3"], 7) == 2.0
+    assert discretize.attribute_number([], 7) == 7
+    assert discretize.attribute_number("30 mph", 7) == pytest.approx(30 * 1.609344)
+    assert discretize.attribute_number("50;70", 7) == 50.0
+    assert discretize.attribute_number("none", 7) == 7
+
+
+# A source s and a shelter h joined through the intersection a: s-a is 1000 m with two lanes
+# at 36 km/h and a-h is 300 m with one lane. At 36 km/h a vehicle travels 100 m per 10 s period.
+def tiny_graph():
+    graph = nx.Graph()
+    graph.add_node("s", x=0, y=0, type="source", demand=50)
+    graph.add_node("a", x=1000, y=0)
+    graph.add_node("h", x=1000, y=300, type="shelter")
+    graph.add_edge("s", "a", length=1000, lanes=2, speed_kph=36)
+    graph.add_edge("a", "h", length=300, maxspeed="36")
+    return graph
+
+
+def test_cell_chains():
+    network = discretize.discretize(tiny_graph(), time_step=10)
+
+    # Nodes first, then the 10 cells of s -> a and the 3 cells of a -> h. The links into the
+    # source and out of the shelter are left out.
+    assert network["S_o"].tolist() == [1]
+    assert network["S_e"].tolist() == [3]
+    assert network["D"].tolist() == [50]
+    assert network["I"].tolist() == list(range(1, 17))
+    assert network["R"].tolist() == list(range(4, 17))
+    chain = [1, *range(4, 14), 2]
+    assert network["A"].tolist() == [[u, v] for u, v in zip(chain[:-1], chain[1:])] + \
+        [[2, 14], [14, 15], [15, 16], [16, 3]]
+    # The last cell of each chain leads to the node at its end
+    assert network["R_prime"].tolist() == [13, 16]
+    assert network["downstreamNode"].tolist() == [2, 3]
+    # Resources take one period per road cell and one to leave the start node
+    assert network["graph_edges"] == [("1", "2", 11), ("2", "3", 4)]
+    road = [cell for cell in network["cells"] if cell["type"] == "road"]
+    assert road[0]["x_coord"] == 50 and road[9]["x_coord"] == 950
+    assert road[10]["y_coord"] == 50
+
+
+def test_cell_capacities():
+    network = discretize.discretize(tiny_graph(), time_step=10, saturation_flow=1800, jam_density=133,
+                                    wave_speed=20)
+
+    # Q = lanes * 1800 veh/h * 10 s, N = lanes * 133 veh/km * 100 m, s_factor = 20 / 36 km/h
+    assert network["Q"].tolist() == [10.0] * 10 + [5.0] * 3
+    assert network["N"].tolist() == [26.6] * 10 + [13.3] * 3
+    assert network["s_factor"].tolist() == [0.556] * 13
+    assert network["delta"].tolist() == [5.0] * 13
+
+
+def test_vp_and_missing_endpoints():
+    # a only has two links, so it is only in Vp with a lower degree threshold
+    assert discretize.discretize(tiny_graph())["Vp"].tolist() == [3]
+    assert discretize.discretize(tiny_graph(), vp_degree=2)["Vp"].tolist() == [2, 3]
+    assert discretize.discretize(tiny_graph(), vp_degree=2, max_vp=1)["Vp"].tolist() == [3]
+
+    graph = tiny_graph()
+    graph.nodes["h"]["type"] = "node"
+    with pytest.raises(ValueError):
+        discretize.discretize(graph)
+    # Shelters can also be given by node id
+    assert discretize.discretize(graph, sinks=discretize.parse_nodes("h", graph))["S_e"].tolist() == [3]
@@ -0,0 +1,30 @@
+import numpy as np
+import generate_network
+
+
+def test_grid_cells_and_links():
+    network = generate_network.generate_network(rows=3, cols=4, cells_per_link=2, n_sources=2, n_sinks=2)
+    # 17 streets, each a chain of 2 road cells in both directions, and one chain per source and sink
+    assert len(network["R"]) == (17 * 2 + 2 + 2) * 2
+    assert len(network["I"]) == 2 + 12 + 2 + len(network["R"])
+    assert network["S_o"].tolist() == [1, 2]
+    assert network["S_e"].tolist() == [15, 16]
+    # Every chain has 3 arcs, and its last cell leads to the end of the link
+    assert len(network["A"]) == 3 * 38
+    ends = dict(zip(network["A"][:, 0].tolist(), network["A"][:, 1].tolist()))
+    assert [ends[cell] for cell in network["R_prime"].tolist()] == network["downstreamNode"].tolist()
+    # By default every intersection and shelter is in Vp
+    assert network["Vp"].tolist() == list(range(3, 17))
+
+
+def test_max_vp_keeps_the_shelters_and_the_busiest_intersections():
+    network = generate_network.generate_network(rows=4, cols=4, n_sinks=2, max_vp=6)
+    # The four intersections in the middle of a 4x4 grid have four streets
+    assert network["Vp"].tolist() == [9, 10, 13, 14, 20, 21]
+    assert network["S_e"].tolist() == [20, 21]
+    tau, _ = generate_network.network_tau(network, [1.0])
+    assert tau.shape == (1, 6, 6)
+    assert (np.diagonal(tau[0]) == 0).all()
+
+    # Vp never drops the shelters
+    assert generate_network.generate_network(rows=4, cols=4, n_sinks=2, max_vp=1)["Vp"].tolist() == [20, 21]
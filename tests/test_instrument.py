@@ -0,0 +1,82 @@
+import subprocess
+import sys
+import pytest
+import instrument
+
+
+@pytest.fixture
+def trace(tmp_path, monkeypatch):
+    path = str(tmp_path / "trace.jsonl")
+    monkeypatch.setattr(instrument, "trace_path", path)
+    monkeypatch.setattr(instrument, "enabled", True)
+    monkeypatch.setattr(instrument, "trace_file", None)
+    yield path
+    if instrument.trace_file is not None:
+        instrument.trace_file.close()
+
+
+def test_span_as_context_manager_merges_fields(trace):
+    with instrument.span("stage", dat="toy.dat") as fields:
+        fields["rows"] = 3
+    instrument.count("cache.hit", 2, dat="toy.dat")
+
+    span, counter = instrument.read_trace(trace)
+    assert span["type"] == "span" and span["name"] == "stage"
+    assert span["dat"] == "toy.dat" and span["rows"] == 3
+    assert span["duration"] >= 0 and span["start"] > 0
+    assert counter == {"type": "counter", "name": "cache.hit", "time": counter["time"], "value": 2,
+                       "pid": span["pid"], "dat": "toy.dat"}
+
+
+def test_span_is_recorded_when_the_block_raises(trace):
+    with pytest.raises(ValueError):
+        with instrument.span("failing"):
+            raise ValueError("stop")
+    assert [record["name"] for record in instrument.read_trace(trace)] == ["failing"]
+
+
+def test_span_as_decorator_records_each_call(trace):
+    @instrument.span("work", kind="test")
+    def work(value):
+        return value * 2
+
+    assert work(2) == 4
+    assert work(3) == 6
+
+    records = instrument.read_trace(trace)
+    assert [(record["name"], record["kind"]) for record in records] == [("work", "test"), ("work", "test")]
+
+
+def test_span_totals(trace):
+    for duration in (0.5, 1.5):
+        instrument.add_span("solve", 100.0, duration, peak_rss_mb=10.0)
+    instrument.add_span("parse", 100.0, 0.25)
+
+    rows = instrument.span_totals(instrument.read_trace(trace))
+
+    assert [(row["name"], row["count"], row["total"], row["mean"], row["max"]) for row in rows] == [
+        ("solve", 2, 2.0, 1.0, 1.5), ("parse", 1, 0.25, 0.25, 0.25)]
+    events = instrument.chrome_trace(instrument.read_trace(trace))["traceEvents"]
+    assert events[0]["ph"] == "X" and events[0]["dur"] == 0.5e6
+
+
+def test_nothing_is_written_when_disabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrument, "enabled", False)
+    monkeypatch.setattr(instrument, "trace_path", str(tmp_path / "trace.jsonl"))
+    with instrument.span("stage") as fields:
+        fields["rows"] = 1
+    instrument.count("counter")
+    assert not (tmp_path / "trace.jsonl").exists()
+
+
+@pytest.mark.skipif(instrument.resource is None, reason="resource is not available on Windows")
+def test_peak_memory_of_children_is_the_largest_child():
+    # Each child holds about 100 MB
+    allocate = "data = bytearray(100 << 20); data[::4096] = b'x' * len(data[::4096])"
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", allocate], check=True)
+
+    peak = instrument.peak_memory(children=True)
+
+    assert 100 <= peak < 200
+    assert instrument.peak_memory() > 0
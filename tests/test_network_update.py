@@ -0,0 +1,62 @@
+import math
+import numpy as np
+import pytest
+import calculate_tau
+import network_update
+
+# 4 x 4 grid with unit edges and a few diagonals, resources move 1 and 2 units per period
+nodes = [str(k) for k in range(16)]
+edges = ([(str(k), str(k + 1), 1.0) for k in range(16) if k % 4 != 3] +
+         [(str(k), str(k + 4), 1.0) for k in range(12)] +
+         [("0", "5", 1.5), ("6", "11", 1.5), ("9", "14", 1.2)])
+vp = ["0", "3", "5", "10", "15"]
+speeds = [1.0, 2.0]
+
+
+def assert_matches_full(network):
+    full = calculate_tau.dijkstra_distances(network.nodes, network.edges(), network.vp)
+    np.testing.assert_allclose(network.distance, full)
+    tau, tau_max = network.tau(speeds)
+    full_tau, full_tau_max = calculate_tau.calculate_tau(network.nodes, network.edges(), network.vp, speeds)
+    assert (tau == full_tau).all() and (tau_max == full_tau_max).all()
+
+
+def test_closure_and_reopen(tmp_path):
+    network = network_update.NetworkDistances(nodes, edges, vp)
+    before = network.distance.copy()
+
+    updated = network.apply([("0", "5", math.inf), ("1", "5", math.inf)])
+    assert updated
+    assert_matches_full(network)
+    assert network.distance[vp.index("0"), 5] > before[vp.index("0"), 5]
+
+    # The closed edges survive the sidecar and are reopened with their old weight
+    path = tmp_path / "distances.npz"
+    network_update.save_network(path, network, speeds)
+    network, saved_speeds = network_update.load_network(path)
+    assert saved_speeds.tolist() == speeds
+    network.apply([("5", "0", None), ("1", "5", None)])
+    assert_matches_full(network)
+    np.testing.assert_allclose(network.distance, before)
+    with pytest.raises(ValueError):
+        network.apply([("0", "5", None)])
+
+
+def test_random_changes():
+    rng = np.random.default_rng(7)
+    network = network_update.NetworkDistances(nodes, edges, vp)
+    for _ in range(30):
+        node1, node2, _ = edges[rng.integers(len(edges))]
+        key = tuple(sorted((node1, node2)))
+        if key in network.closed:
+            change = None
+        elif rng.random() < 0.3:
+            change = math.inf
+        else:
+            change = float(rng.choice([0.5, 1.0, 2.0, 3.5]))
+        network.apply([(node1, node2, change)])
+        if all(np.isfinite(network.distance[:, network.vp_index]).ravel()):
+            assert_matches_full(network)
+        else:
+            np.testing.assert_allclose(
+                network.distance, calculate_tau.dijkstra_distances(network.nodes, network.edges(), network.vp))
@@ -0,0 +1,44 @@
+import numpy as np
+import playback
+
+
+# Colour rules of the per-tick loop that playback.py replaces
+def get_color(vehicle_count, max_count, evacuated):
+    if not evacuated:
+        return "rgb(0,0,0)"
+    if max_count == 0:
+        return "rgb(0,0,255)"
+    normalized = vehicle_count / max_count
+    r = int(255 * normalized)
+    g = int(255 * (1 - normalized) * normalized * 4)
+    b = int(255 * (1 - normalized))
+    return f"rgb({r},{g},{b})"
+
+
+def test_colors_follow_get_color():
+    counts = np.random.default_rng(3).integers(0, 12, size=(9, 6))
+    counts[:, 2] = 0  # A time step without vehicles
+    evacuated = [True, True, False, True, True, True, False, True, True]
+    frames = playback.Playback(counts.tolist(), evacuated)
+
+    assert (frames.n_cells, frames.n_time_steps) == (9, 6)
+    for n in range(6):
+        max_count = counts[:, n].max()
+        for i in range(9):
+            assert frames.colors[i, n] == get_color(counts[i, n], max_count, evacuated[i])
+    r, g, b = playback.color_components(counts, evacuated)
+    assert frames.colors[0, 0] == f"rgb({r[0, 0]},{g[0, 0]},{b[0, 0]})"
+
+
+def test_changed_cells():
+    counts = [[4, 4, 4],
+              [2, 2, 3],
+              [1, 1, 1],
+              [0, 5, 5]]
+    frames = playback.Playback(counts, [True, True, False, True])
+    assert frames.changed_cells(None, 1).tolist() == [0, 1, 2, 3]
+    assert frames.changed_cells(1, 1).tolist() == []
+    # Cell 0 keeps its count but gets another colour when the max of the time step changes
+    assert frames.changed_cells(0, 1).tolist() == [0, 1, 3]
+    # Cell 2 is black in every frame
+    assert frames.changed_cells(1, 2).tolist() == [1]
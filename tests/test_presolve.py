@@ -0,0 +1,54 @@
+import numpy as np
+import dat_io
+import presolve
+from conftest import repo_file
+
+
+def toy_data():
+    return dat_io.load_dat(repo_file("toy.dat"), use_cache=False)
+
+
+def test_arc_index_matches_toy_dat():
+    data = toy_data()
+    in_arcs, out_arcs = presolve.arc_index(data["I"], data["activeArcs"])
+    assert len(in_arcs) == len(out_arcs) == len(data["I"])
+    for computed, committed in ((in_arcs, data["inArcs"]), (out_arcs, data["outArcs"])):
+        assert all(np.array_equal(a.reshape(-1, 2), b.reshape(-1, 2)) for a, b in zip(computed, committed))
+    # Every arc is in the incoming set of its end cell and the outgoing set of its start cell
+    position = {cell: k for k, cell in enumerate(data["I"].tolist())}
+    for i, j in data["activeArcs"].tolist():
+        assert [i, j] in in_arcs[position[j]].tolist() and [i, j] in out_arcs[position[i]].tolist()
+
+
+def test_reachability_windows_match_toy_dat():
+    data = toy_data()
+    earliest, latest, active_arcs = presolve.reachability_windows(data["I"], data["A"], data["S_o"], data["S_e"],
+                                                                  data["T"])
+    assert earliest.tolist() == data["earliest"].tolist()
+    assert latest.tolist() == data["latest"].tolist()
+    assert active_arcs.tolist() == data["activeArcs"].tolist()
+    # Sources can hold vehicles from the first period, sinks until the last one
+    position = presolve.cell_positions(data["I"])
+    assert (earliest[position[data["S_o"]]] == data["T"][0]).all()
+    assert (latest[position[data["S_e"]]] == data["T"][-1]).all()
+
+
+def test_resource_conflicts_match_toy_dat():
+    data = toy_data()
+    keys, nodes = presolve.resource_conflicts(data["Vp"], data["P"], data["tau"], data["tau_max"], len(data["T"]) - 1)
+    assert keys.tolist() == data["conflictKeys"].tolist()
+    assert [values.tolist() for values in nodes] == [values.tolist() for values in data["conflictNodes"]]
+
+    # Against the definition: n2 is a conflict of <n, p, d> if p cannot go from n to n2 in d periods
+    vp = data["Vp"].tolist()
+    for (n, p, d), conflicts in zip(keys.tolist(), nodes):
+        row = data["tau"][data["P"].tolist().index(p), vp.index(n)]
+        assert conflicts.tolist() == [n2 for k, n2 in enumerate(vp) if row[k] >= d]
+        assert 1 <= d <= data["tau_max"][data["P"].tolist().index(p), vp.index(n)]
+
+    # Building only some rows gives the same keys for those rows
+    rows = [(0, 1), (1, 0)]
+    some_keys, _ = presolve.resource_conflicts(data["Vp"], data["P"], data["tau"], data["tau_max"],
+                                               len(data["T"]) - 1, rows)
+    expected = [key for key in keys.tolist() if (data["P"].tolist().index(key[1]), vp.index(key[0])) in rows]
+    assert sorted(some_keys.tolist()) == sorted(expected)
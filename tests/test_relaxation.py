@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+import dat_io
+import relaxation
+import simulate
+from conftest import repo_file
+
+
+# Expressions 10-12 as jesdra.mod generates them from the conflict keys of the data
+def assert_allocations_feasible(data, rows):
+    rows = [tuple(row) for row in rows.tolist()]
+    assert len({(n, t) for n, p, t in rows}) == len(rows)
+    assert len({(p, t) for n, p, t in rows}) == len(rows)
+    placed = set(rows)
+    for (n, p, d), nodes in zip(np.asarray(data["conflictKeys"]).tolist(), data["conflictNodes"]):
+        for n1, p1, t1 in rows:
+            if (n1, p1) == (n, p):
+                assert not any((int(n2), p, t1 + d) in placed for n2 in nodes)
+
+
+def test_round_allocations_uses_the_direction_of_tau():
+    # Resource 1 needs 1 period from node 5 to node 6, but 3 periods back
+    data = {"Vp": [5, 6], "P": [1], "tau": [[[0, 1], [3, 0]]]}
+
+    forward = relaxation.round_allocations(data, [(5, 1, 1, 0.9), (6, 1, 3, 0.8)])
+    backward = relaxation.round_allocations(data, [(6, 1, 5, 0.9), (5, 1, 7, 0.8)])
+    # The later allocation is placed first when its relaxed value is larger
+    reversed_values = relaxation.round_allocations(data, [(5, 1, 1, 0.8), (6, 1, 3, 0.9)])
+
+    assert forward.tolist() == [[5, 1, 1], [6, 1, 3]]
+    assert backward.tolist() == [[6, 1, 5]]
+    assert reversed_values.tolist() == [[5, 1, 1], [6, 1, 3]]
+
+
+def test_round_allocations_expressions_10_and_11():
+    data = {"Vp": [5, 6], "P": [1, 2], "tau": np.zeros((2, 2, 2), dtype=np.int64)}
+    relaxed = [(5, 1, 1, 0.9), (5, 2, 1, 0.8), (6, 1, 1, 0.7), (6, 2, 2, 0.4)]
+
+    rows = relaxation.round_allocations(data, relaxed)
+
+    # One resource per node and one node per resource at a time; values below 0.5 are dropped
+    assert rows.tolist() == [[5, 1, 1]]
+
+
+def test_round_allocations_on_toy_dat():
+    data = dat_io.load_dat(repo_file("toy.dat"), use_cache=False)
+    rng = np.random.default_rng(0)
+    relaxed = [(int(n), int(p), int(t), float(rng.random())) for n in data["Vp"] for p in data["P"]
+               for t in data["T"]]
+
+    rows = relaxation.round_allocations(data, relaxed)
+
+    assert len(rows) > 0
+    assert_allocations_feasible(data, rows)
+
+
+# Records the single plans that are simulated
+class RecordingModel:
+    def __init__(self, model):
+        self.model = model
+        self.sources = model.sources
+        self.plans = []
+
+    def run(self, e, keep_history=False):
+        if np.ndim(e) == 1:
+            self.plans.append(np.asarray(e).tolist())
+        return self.model.run(e, keep_history=keep_history)
+
+
+@pytest.fixture(scope="module")
+def toy_model():
+    return simulate.CellTransmissionModel(dat_io.load_dat(repo_file("toy.dat"), use_cache=False))
+
+
+def test_round_decisions_repairs_and_flips(toy_model):
+    # On toy.dat, evacuating sources 2 and 3 together strands vehicles, and [1, 1, 0] is the
+    # best plan without stranded vehicles
+    model = RecordingModel(toy_model)
+
+    e, result = relaxation.round_decisions(model, {1: 0.6, 2: 0.7, 3: 0.8})
+
+    # Rounded to [1, 1, 1], then the sources with the smallest relaxed e are sheltered until
+    # nothing is stranded
+    assert model.plans[:3] == [[1, 1, 1], [0, 1, 1], [0, 0, 1]]
+    assert toy_model.run(np.array(model.plans[2]))["stranded"].tolist() == [0]
+    # Single flips then improve the repaired plan
+    assert e.tolist() == [1, 1, 0]
+    assert result["stranded"].tolist() == [0]
+    assert result["objective"][0] == pytest.approx(116.1522)
+
+
+def test_round_decisions_keeps_a_feasible_rounding(toy_model):
+    model = RecordingModel(toy_model)
+
+    e, result = relaxation.round_decisions(model, {1: 0.9, 2: 0.9, 3: 0.1})
+
+    assert model.plans[0] == [1, 1, 0]
+    assert e.tolist() == [1, 1, 0]
+    assert result["stranded"].tolist() == [0]
+
+
+def test_parse_relaxation_and_gap():
+    lines = ["<<< solve", "LP_BOUND: 100.5", "relaxed e:", "1,1", "2,0.25", "relaxed z:", "4,1,3,0.75",
+             "<<< done"]
+
+    relaxation_values = relaxation.parse_relaxation(lines)
+
+    assert relaxation_values == {"bound": 100.5, "e": {1: 1.0, 2: 0.25}, "z": [(4, 1, 3, 0.75)]}
+    assert relaxation.relaxation_gap(116.1522, 100.5) == pytest.approx((116.1522 - 100.5) / 116.1522, abs=1e-6)
+    assert relaxation.relaxation_gap(None, 100.5) is None
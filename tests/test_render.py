@@ -0,0 +1,38 @@
+import matplotlib.pyplot as plt
+import numpy as np
+from PIL import Image
+import render
+from conftest import repo_file
+
+
+def test_limits_hold_the_cells_and_the_disaster():
+    scene = {"coords": np.array([[0.0, 0.0], [100.0, 50.0]]), "radius": 40.0,
+             "disaster": np.array([[-30.0, 25.0], [20.0, 25.0]])}
+
+    (x_min, x_max), (y_min, y_max) = render.axes_limits(scene)
+
+    # The first circle reaches x = -70, the cells reach x = 100 and y = 0..50; the margin is 5
+    assert (x_min, x_max) == (-75.0, 105.0)
+    assert (y_min, y_max) == (-20.0, 70.0)
+
+
+def test_render_one_toy_frame(toy_results, tmp_path, monkeypatch):
+    # init_worker sets the figure state of the worker process
+    monkeypatch.setattr(render, "scene", None)
+    scene = render.build_scene(repo_file("toy_info.json"), toy_results, repo_file("toy.dat"))
+    assert scene["rgb"].shape == (len(scene["coords"]), 10, 3)
+    assert scene["totals"].tolist() == [30] * 10
+
+    render.init_worker(scene, (4, 3), 50)
+    paths = render.render_frames([0], str(tmp_path))
+
+    assert [path.split("/")[-1] for path in paths] == ["frame_0000.png"]
+    with Image.open(paths[0]) as image:
+        assert image.size == (200, 150)
+    # The disaster circle stays inside the axes
+    axes = render.scene["figure"].axes[0]
+    (x_min, x_max), (y_min, y_max) = axes.get_xlim(), axes.get_ylim()
+    center, radius = scene["disaster"][0], scene["radius"]
+    assert x_min <= center[0] - radius and center[0] + radius <= x_max
+    assert y_min <= center[1] - radius and center[1] + radius <= y_max
+    plt.close(render.scene["figure"])
@@ -0,0 +1,103 @@
+import os
+import shutil
+import result_cache
+import solve
+import warm_start
+from conftest import repo_file
+
+
+# Output directory with every file the cache stores, of about size bytes in total
+def fake_output(directory, content="x", size=100):
+    os.makedirs(directory, exist_ok=True)
+    for name in result_cache.result_files:
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(content * (size // len(result_cache.result_files)))
+    return str(directory)
+
+
+def test_cache_key(tmp_path):
+    dat_file = str(tmp_path / "toy.dat")
+    shutil.copyfile(repo_file("toy.dat"), dat_file)
+    mod_file = repo_file("jesdra.mod")
+    key = result_cache.cache_key(mod_file, dat_file, {"stop_gap": 0.01, "extra_args": []})
+    # The order of the settings does not matter, their values do
+    assert result_cache.cache_key(mod_file, dat_file, {"extra_args": [], "stop_gap": 0.01}) == key
+    assert result_cache.cache_key(mod_file, dat_file, {"extra_args": [], "stop_gap": 0.02}) != key
+    # The same inputs at another path give the same key
+    assert result_cache.cache_key(mod_file, repo_file("toy.dat"), {"stop_gap": 0.01, "extra_args": []}) == key
+
+    extra = str(tmp_path / "start.dat")
+    with open(extra, "w") as f:
+        f.write("fixE = 0;\n")
+    with_extra = result_cache.cache_key(mod_file, dat_file, {}, [extra])
+    assert with_extra != result_cache.cache_key(mod_file, dat_file, {})
+    with open(extra, "w") as f:
+        f.write("fixE = 1;\n")
+    assert result_cache.cache_key(mod_file, dat_file, {}, [extra]) != with_extra
+
+    with open(dat_file, "a") as f:
+        f.write("\n")
+    assert result_cache.cache_key(mod_file, dat_file, {"stop_gap": 0.01, "extra_args": []}) != key
+
+
+def test_get_and_put(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path / "cache"))
+    output_dir = str(tmp_path / "output")
+    assert cache.get("a", output_dir) is None
+    cache.put("a", fake_output(tmp_path / "run", "a"), {"objective": 1.5})
+    os.makedirs(output_dir)
+    assert cache.get("a", output_dir) == {"objective": 1.5}
+    with open(os.path.join(output_dir, "vehicles.csv")) as f:
+        assert f.read().startswith("a")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path / "cache"), max_entries=2)
+    for number, key in enumerate("ab"):
+        cache.put(key, fake_output(tmp_path / key), {})
+        # Entries were used at 1000 and 2000 seconds after the epoch
+        os.utime(os.path.join(cache.entry_path(key), result_cache.metrics_name), (1000 * (number + 1),) * 2)
+    # Reading a marks it as recently used, so b is the least recently used entry
+    assert cache.get("a", str(tmp_path / "a")) is not None
+    cache.put("c", fake_output(tmp_path / "c"), {})
+    assert sorted(os.listdir(cache.cache_dir)) == ["a", "c"]
+
+
+def test_size_limit(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path / "cache"), max_size_mb=2500 / 1024 / 1024)
+    for number, key in enumerate("abc"):
+        cache.put(key, fake_output(tmp_path / key, size=1000), {})
+        os.utime(os.path.join(cache.entry_path(key), result_cache.metrics_name), (1000 * (number + 1),) * 2)
+    cache.evict()
+    # Only the two most recently used entries fit into 2500 bytes
+    assert sorted(os.listdir(cache.cache_dir)) == ["b", "c"]
+    assert all(result_cache.directory_size(cache.entry_path(key)) <= 1100 for key in "bc")
+
+
+def test_warm_start_inputs_are_part_of_the_key(tmp_path, monkeypatch):
+    start_model = str(tmp_path / "jesdra_start.mod")
+    shutil.copyfile(warm_start.start_model, start_model)
+    monkeypatch.setattr(warm_start, "start_model", start_model)
+    runs = []
+
+    def run_opl(opl_executable, mod_file, dat_file, output_dir, *args):
+        runs.append(args[-1])
+        fake_output(output_dir)
+        return {"return_code": 0, "stopped_early": False, "rows": {"vehicles.csv": 1}}
+    monkeypatch.setattr(solve, "run_opl_and_generate_csv", run_opl)
+
+    cache = result_cache.ResultCache(str(tmp_path / "cache"))
+    output_dir = str(tmp_path / "output")
+    os.makedirs(output_dir)
+    for _ in range(2):
+        solve.run_with_cache(cache, "oplrun", repo_file("jesdra.mod"), repo_file("toy.dat"), output_dir,
+                             warm_start=True)
+    # The second solve is served from the cache, the start built for the first one is passed on
+    assert len(runs) == 1
+    assert runs[0][0] == [start_model, os.path.join(output_dir, "start.dat")]
+
+    with open(start_model, "a") as f:
+        f.write("\n// changed\n")
+    solve.run_with_cache(cache, "oplrun", repo_file("jesdra.mod"), repo_file("toy.dat"), output_dir,
+                         warm_start=True)
+    assert len(runs) == 2
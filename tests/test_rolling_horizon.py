@@ -0,0 +1,103 @@
+import json
+import numpy as np
+import pytest
+import dat_io
+import rolling_horizon
+import simulate
+from conftest import repo_file
+
+
+@pytest.fixture(scope="module")
+def toy():
+    data = dat_io.load_dat(repo_file("toy.dat"), use_cache=False)
+    model = simulate.CellTransmissionModel(data)
+    e = np.array([1, 1, 0])
+    return data, model.results_arrays(e, model.run(e, keep_history=True))
+
+
+def test_window_ranges():
+    assert rolling_horizon.window_ranges(range(1, 11), 4, 2) == [(0, 4), (2, 6), (4, 8), (6, 10)]
+    # The final window is cut at the end of the horizon
+    assert rolling_horizon.window_ranges(range(1, 11), 6, 4) == [(0, 6), (4, 10)]
+    assert rolling_horizon.window_ranges(range(1, 11), 12, 4) == [(0, 10)]
+    for window, step in ((4, 0), (4, 4), (4, 5)):
+        with pytest.raises(ValueError):
+            rolling_horizon.window_ranges(range(1, 11), window, step)
+
+
+def test_committed_periods(toy):
+    data, _ = toy
+    assert rolling_horizon.committed_periods(data, 0, 4, 2) == 2
+    assert rolling_horizon.committed_periods(data, 4, 8, 2) == 2
+    # The final window keeps all of its periods
+    assert rolling_horizon.committed_periods(data, 6, 10, 2) == 4
+
+
+def test_stitch_joins_the_kept_periods(toy):
+    data, arrays = toy
+    periods = np.asarray(data["T"])
+    allocations = np.array([[2, 1, 3], [4, 1, 8]])
+    parts = []
+    for start, stop in rolling_horizon.window_ranges(periods, 4, 2):
+        window_periods = periods[start:stop]
+        # Each window holds its own plan, which differs from the kept plan after the kept periods
+        x = arrays["x"][:, start:stop].copy()
+        kept = rolling_horizon.committed_periods(data, start, stop, 2)
+        x[:, kept:] += 100
+        results = {
+            "x": x,
+            "e": arrays["e"] if start == 0 else 1 - arrays["e"],
+            "y": arrays["y"][np.isin(arrays["y"][:, 2], window_periods)],
+            "z": allocations[np.isin(allocations[:, 2], window_periods)],
+        }
+        parts.append((start, kept, results))
+
+    stitched = rolling_horizon.stitch(data, parts)
+
+    assert np.array_equal(stitched["x"], arrays["x"])
+    # Flows and allocations of the overlapping periods are only taken from the window that keeps them
+    assert sorted(stitched["y"].tolist()) == sorted(arrays["y"].tolist())
+    assert stitched["z"].tolist() == allocations.tolist()
+    # The decisions are the ones of the first window
+    assert stitched["e"].tolist() == [1, 1, 0]
+    assert stitched["periods"].tolist() == periods.tolist()
+
+
+def test_plan_objective(toy):
+    data, arrays = toy
+    risk = np.asarray(data["c"])
+    source_rows = [list(data["I"]).index(source) for source in data["S_o"]]
+    # Without vehicles on the roads, only the demand left at the sources is charged
+    empty = np.zeros_like(arrays["x"])
+    assert rolling_horizon.plan_objective(data, empty, [1, 1, 1]) == 0
+    expected = (np.asarray(data["D"]) * risk[source_rows].sum(axis=1)).sum()
+    assert rolling_horizon.plan_objective(data, empty, [0, 0, 0]) == pytest.approx(expected)
+    # Vehicles are charged the risk of their cell at each period
+    x = empty.copy()
+    x[5, 3] = 4
+    assert rolling_horizon.plan_objective(data, x, [1, 1, 1]) == pytest.approx(4 * risk[5, 3])
+
+
+def test_window_and_state_blocks(toy, tmp_path):
+    data, arrays = toy
+    first = rolling_horizon.window_blocks(data, 0, 4)
+    assert first["T"] == dat_io.format_set([1, 2, 3, 4])
+    assert first["earliest"] == dat_io.format_array(np.asarray(data["earliest"]))
+
+    # A later window only reaches cells from the occupied ones
+    x0 = arrays["x"][:, 2]
+    later = rolling_horizon.window_blocks(data, 2, 6, x0)
+    earliest = dat_io.parse_dat(f"earliest = {later['earliest']};")["earliest"]
+    assert (earliest[x0 > 0] == 3).all()
+    assert (earliest >= 3).all()
+
+    window_dat = str(tmp_path / "window.dat")
+    state = rolling_horizon.state_blocks(data, window_dat, 2, 6, x0, arrays["e"])
+    with open(rolling_horizon.window_model) as f:
+        assert set(state) == dat_io.declared_data(f.read())
+    assert json.loads(state["modelFile"]) == repo_file("jesdra.mod")
+    assert json.loads(state["dataFile"]) == window_dat
+    assert (state["firstWindow"], state["finalWindow"]) == ("0", "0")
+    assert state["x0"] == dat_io.format_array(x0)
+    final = rolling_horizon.state_blocks(data, window_dat, 6, 10, x0, arrays["e"])
+    assert final["finalWindow"] == "1"
@@ -0,0 +1,92 @@
+import json
+import re
+import pytest
+import dat_io
+import scenario_queue
+import sweep
+from conftest import repo_file
+
+
+def toy_text():
+    with open(repo_file("toy.dat")) as f:
+        return f.read()
+
+
+def test_deltas_are_relative_to_the_previous_scenario():
+    # toy.dat: D = [10, 20, 10] for S_o = {1 2 3}, and Q[10] = 2 for the first road cell
+    capacity = dat_io.parse_dat(toy_text())["Q"].copy()
+    capacity[0] = 5
+    variants = [
+        ("run_000", {}, {"D": "[20, 20, 10]"}),
+        ("run_001", {}, {"Q": dat_io.format_array(capacity)}),
+        ("run_002", {}, {"Q": dat_io.format_array(capacity), "D": "[20, 20, 10]"}),
+    ]
+
+    rows = scenario_queue.scenario_deltas(toy_text(), variants)
+
+    assert rows == [
+        (1, "D", 1, 0, 20.0),
+        # The second scenario reverts D to the base data
+        (2, "D", 1, 0, 10.0),
+        (2, "Q", 10, 0, 5.0),
+        # Q is unchanged from the second scenario
+        (3, "D", 1, 0, 20.0),
+    ]
+
+
+def test_deltas_of_c_are_indexed_by_cell_and_period():
+    base = dat_io.parse_dat(toy_text())
+    risk = base["c"].copy()
+    risk[4, 7] += 1.5
+    variants = [("run_000", {}, {"c": dat_io.format_array(risk)})]
+
+    rows = scenario_queue.scenario_deltas(toy_text(), variants)
+
+    assert rows == [(1, "c", int(base["I"][4]), int(base["Tp"][7]), pytest.approx(risk[4, 7]))]
+
+
+def test_deltas_from_a_sweep_grid():
+    variants = sweep.expand_grid({"D": [[10, 20, 10], [10, 20, 30]]}, toy_text())
+
+    rows = scenario_queue.scenario_deltas(toy_text(), variants)
+
+    assert rows == [(2, "D", 3, 0, 30.0)]
+
+
+def test_deltas_reject_other_blocks_and_shapes():
+    with pytest.raises(ValueError, match="cannot be changed"):
+        scenario_queue.scenario_deltas(toy_text(), [("run_000", {}, {"tau_max": "[[1]]"})])
+    with pytest.raises(ValueError, match="shape"):
+        scenario_queue.scenario_deltas(toy_text(), [("run_000", {}, {"D": "[10, 20]"})])
+
+
+def test_write_queue(tmp_path):
+    # toy.dat: downstreamNode[13] = 2 for the first cell of R_prime
+    downstream = dat_io.parse_dat(toy_text())["downstreamNode"].copy()
+    downstream[0] = 3
+    variants = [("run_000", {}, {"D": "[20, 20, 10]"}),
+                ("run_001", {}, {"downstreamNode": dat_io.format_array(downstream)})]
+    queue_file = str(tmp_path / "queue.dat")
+
+    rows = scenario_queue.write_queue(repo_file("jesdra.mod"), repo_file("toy.dat"), variants, queue_file)
+
+    with open(queue_file) as f:
+        text = f.read()
+    with open(scenario_queue.resolve_model) as f:
+        resolve_text = f.read()
+    # The queue holds exactly the data of jesdra_resolve.mod
+    names = set(re.findall(r"^(\w+) = ", text, re.MULTILINE))
+    assert names == dat_io.declared_data(resolve_text)
+    assert json.loads(dat_io.block_literal(text, "modelFile")) == repo_file("jesdra.mod")
+    assert json.loads(dat_io.block_literal(text, "dataFile")) == repo_file("toy.dat")
+    assert dat_io.block_literal(text, "scenarios") == dat_io.format_set([1, 2])
+    assert dat_io.block_literal(text, "deltas") == scenario_queue.format_deltas(rows)
+    assert rows == [(1, "D", 1, 0, 20.0), (2, "D", 1, 0, 10.0), (2, "downstreamNode", 13, 0, 3.0)]
+    assert '<2, "downstreamNode", 13, 0, 3.0>' in text
+
+
+def test_resolve_model_handles_every_parameter():
+    with open(scenario_queue.resolve_model) as f:
+        resolve_text = f.read()
+    for name in scenario_queue.parameter_indices:
+        assert f'd.param == "{name}"' in resolve_text
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+import dat_io
+import rolling_horizon
+import simulate
+from conftest import repo_file
+
+
+@pytest.fixture(scope="module")
+def toy():
+    data = dat_io.load_dat(repo_file("toy.dat"), use_cache=False)
+    return data, simulate.CellTransmissionModel(data)
+
+
+def test_objective_on_toy_dat(toy):
+    data, model = toy
+    e = np.array([1, 1, 0])
+    result = model.run(e, keep_history=True)
+    assert result["stranded"].tolist() == [0]
+    assert result["objective"][0] == pytest.approx(116.1522)
+
+    # Same objective as jesdra.mod computes for the plan
+    arrays = model.results_arrays(e, result)
+    assert rolling_horizon.plan_objective(data, arrays["x"], arrays["e"]) == pytest.approx(result["objective"][0])
+    # Vehicles are only moved, never created or lost
+    assert arrays["x"].sum(axis=0).tolist() == [30] * arrays["x"].shape[1]
+
+
+def test_plans_are_simulated_together(toy):
+    _, model = toy
+    plans = next(simulate.all_subsets(len(model.sources)))
+    together = model.run(plans)
+    one_by_one = [model.run(e)["objective"][0] for e in plans]
+    assert together["objective"] == pytest.approx(one_by_one)
+    # Sheltering everyone in place strands nobody
+    assert together["stranded"][plans.sum(axis=1) == 0].tolist() == [0]
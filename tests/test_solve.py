@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+import pytest
+import results_io
+import solve
+from conftest import repo_file
+
+stub_oplrun = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_oplrun.py")
+
+# Output of an oplrun run of jesdra.mod on a network of three cells, shortened
+recorded_output = """\
+<<< setup
+<<< generate
+<<< solve
+Found incumbent of value 125.000000 after 0.02 sec. (1.23 ticks)
+        Nodes                                         Cuts/
+   Node  Left     Objective  IInf  Best Integer    Best Bound    ItCnt     Gap
+
+*     0+    0                          125.0000        0.0000           100.00%
+      0     0      110.5000    12      125.0000      110.5000       45   11.60%
+Elapsed time = 1.20 sec. (100.00 ticks, tree = 0.01 MB, solutions = 2)
+*    10+    4                          118.0000      112.0000             5.08%
+     20     2        cutoff            118.0000      116.0000      130    1.69%
+OBJECTIVE: 118
+<<< post process
+evac.csv:
+1,1
+2,0
+vehicles.csv:
+4,2,0,0
+0,2,3,1
+0,0,1,3
+cells:
+1,5,9
+periods:
+1,2,3,4
+flows.coo:
+1,5,1,2
+5,9,2,1
+allocations.coo:
+7,2,1
+<<< done
+"""
+
+
+def test_parser_writes_csv_and_progress(tmp_path):
+    records = []
+    metrics_file = str(tmp_path / "metrics.jsonl")
+    parser = solve.OplOutputParser(str(tmp_path), records.append, metrics_file)
+    for line in recorded_output.splitlines(keepends=True):
+        assert not parser.feed(line)
+    parser.close()
+
+    with open(tmp_path / "evac.csv") as f:
+        assert f.read() == "1,1\n2,0\n"
+    with open(tmp_path / "vehicles.csv") as f:
+        assert f.read() == "4,2,0,0\n0,2,3,1\n0,0,1,3\n"
+    results = results_io.load_results(str(tmp_path))
+    assert results["x"].tolist() == [[4, 2, 0, 0], [0, 2, 3, 1], [0, 0, 1, 3]]
+    assert results["cells"].tolist() == [1, 5, 9] and results["periods"].tolist() == [1, 2, 3, 4]
+    assert results["y"].tolist() == [[1, 5, 1, 2], [5, 9, 2, 1]]
+    assert results["z"].tolist() == [[7, 2, 1]]
+    assert results["sources"].tolist() == [1, 2] and results["e"].tolist() == [1, 0]
+
+    events = [record["event"] for record in records]
+    assert events == ["phase", "phase", "phase", "incumbent", "progress", "progress", "progress", "progress",
+                      "objective", "phase", "phase", "summary"]
+    progress = [record for record in records if record["event"] == "progress"]
+    assert [(r["node"], r["nodes_left"], r["incumbent"], r["best_bound"]) for r in progress] == \
+        [(0, 0, 125.0, 0.0), (0, 0, 125.0, 110.5), (10, 4, 118.0, 112.0), (20, 2, 118.0, 116.0)]
+    assert progress[1]["gap"] == pytest.approx(0.116)
+    # The solver time is the last "Elapsed time" before the line
+    assert [r["solver_time"] for r in progress] == [None, None, 1.2, 1.2]
+
+    summary = parser.summary
+    assert list(summary["phases"]) == ["setup", "generate", "solve", "post process", "done"]
+    assert summary["objective"] == 118.0
+    assert summary["first_incumbent_solver_time"] == 0.02
+    assert (summary["incumbent"], summary["best_bound"], summary["nodes"]) == (118.0, 116.0, 20)
+    assert summary["gap"] == pytest.approx(0.0169)
+    assert summary["rows"] == {"evac.csv": 2, "vehicles.csv": 3}
+    with open(metrics_file) as f:
+        assert [json.loads(line)["event"] for line in f] == events
+
+
+def test_callback_stops_the_parser(tmp_path):
+    parser = solve.OplOutputParser(str(tmp_path), lambda record: record.get("gap", 1) < 0.1)
+    stops = [parser.feed(line) for line in recorded_output.splitlines()]
+    parser.close()
+    # The first progress line with a gap below 10% asks to stop
+    assert stops.index(True) == recorded_output.splitlines().index(
+        "*    10+    4                          118.0000      112.0000             5.08%")
+
+
+def test_run_opl_with_stub(tmp_path):
+    summary = solve.run_opl_and_generate_csv(sys.executable, repo_file("jesdra.mod"), repo_file("toy.dat"),
+                                             str(tmp_path), extra_args=[stub_oplrun])
+    assert summary["return_code"] == 0 and summary["objective"] == 40.0
+    assert summary["rows"] == {"evac.csv": 3, "vehicles.csv": 29}
+    # A missing oplrun is a failed solve, not a crash
+    assert solve.run_opl_and_generate_csv(str(tmp_path / "missing"), repo_file("jesdra.mod"),
+                                          repo_file("toy.dat"), str(tmp_path)) is None
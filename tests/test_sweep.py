@@ -0,0 +1,37 @@
+import csv
+import os
+import shutil
+import results_io
+import sweep
+from conftest import repo_file
+
+stub_oplrun = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_oplrun.py")
+
+
+def test_run_sweep_with_stub_oplrun(tmp_path):
+    base_dat = str(tmp_path / "toy.dat")
+    shutil.copyfile(repo_file("toy.dat"), base_dat)
+    grid = {"D": [[10, 10, 20], [20, 20, 40]], "s_factor": [[1] * 20, [0.5] * 20]}
+    output_dir = str(tmp_path / "sweep")
+
+    rows = sweep.run_sweep(stub_oplrun, repo_file("jesdra.mod"), base_dat, grid, output_dir, workers=2,
+                           use_cache=False)
+
+    assert [row["run_id"] for row in rows] == ["run_000", "run_001", "run_002", "run_003"]
+    with open(os.path.join(output_dir, "summary.csv"), newline="") as f:
+        summary = list(csv.DictReader(f))
+    assert [row["run_id"] for row in summary] == ["run_000", "run_001", "run_002", "run_003"]
+    assert [(row["D"], row["s_factor"]) for row in summary] == [("0", "0"), ("0", "1"), ("1", "0"), ("1", "1")]
+    assert all(row["status"] == "solved" and row["evacuated"] == "3" for row in summary)
+    # More demand gives a higher objective
+    objectives = [float(row["objective"]) for row in summary]
+    assert objectives[2] > objectives[0]
+
+    for row in summary:
+        run_dir = os.path.join(output_dir, row["run_id"])
+        assert os.path.getsize(os.path.join(run_dir, "evac.csv")) > 0
+        assert os.path.getsize(os.path.join(run_dir, "vehicles.csv")) > 0
+        assert results_io.load_results(run_dir)["x"].shape == (29, 10)
+        with open(os.path.join(run_dir, "variant.dat")) as f:
+            text = f.read()
+        assert "D = " in text
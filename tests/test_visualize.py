@@ -0,0 +1,71 @@
+import importlib
+import sys
+import pytest
+from conftest import repo_file
+
+pytest.importorskip("dash")
+pytest.importorskip("dash_leaflet")
+
+
+# visualize.py parses its arguments and builds the dataset when it is imported
+def load_visualize(monkeypatch, *arguments):
+    monkeypatch.setattr(sys, "argv", ["visualize.py", repo_file("toy_info.json"), *arguments])
+    sys.modules.pop("visualize", None)
+    return importlib.import_module("visualize")
+
+
+def test_dataset_and_update_map(monkeypatch, toy_results):
+    visualize = load_visualize(monkeypatch, "--results-dir", toy_results)
+    dataset = visualize.Dataset(repo_file("toy_info.json"), toy_results)
+    assert dataset.frames.counts.shape[0] == len(dataset.geo_cells)
+    assert len(dataset.disaster_centers) == dataset.frames.n_time_steps
+    visualize.serve_layout()
+
+    elements, disaster, rendered = visualize.update_map(1, 0, visualize.dataset.version)
+    assert rendered == 1
+    # The frame that is already shown is not sent again
+    assert visualize.update_map(1, 1, visualize.dataset.version)[2] is visualize.no_update
+
+
+def test_geojson_mode(monkeypatch, toy_results):
+    visualize = load_visualize(monkeypatch, "--results-dir", toy_results, "--geojson", "--dat", repo_file("toy.dat"))
+    layers = visualize.dataset.cell_layers()
+    features = visualize.dataset.feature_collection()["features"]
+    assert len([f for f in features if f["properties"]["kind"] == "cell"]) == len(visualize.dataset.geo_cells)
+    assert len([f for f in features if f["properties"]["kind"] == "arc"]) == len(visualize.dataset.arcs)
+    assert layers
+    hideout, _, rendered = visualize.update_geojson(2, 1, visualize.dataset.version)
+    assert rendered == 2
+
+
+def test_load_route(monkeypatch, tmp_path, toy_results):
+    from conftest import simulated_results
+    visualize = load_visualize(monkeypatch, "--results-dir", toy_results)
+    client = visualize.app.server.test_client()
+    assert client.get("/_dash-layout").status_code == 200
+
+    other = simulated_results(str(tmp_path / "other"), e=(1, 0, 1))
+    version = visualize.dataset.version
+    response = client.post("/load", json={"results_dir": other})
+    assert response.status_code == 200
+    assert visualize.dataset.version > version
+    # Ticks of a page that still shows the old dataset are ignored
+    assert visualize.update_map(1, 0, version)[2] is visualize.no_update
+    assert visualize.update_map(1, 0, visualize.dataset.version)[2] == 1
+
+    assert client.post("/load", json={"results_dir": str(tmp_path / "missing")}).status_code == 400
+
+
+def test_archived_run(monkeypatch, tmp_path, toy_results):
+    import archive
+    archive_dir = str(tmp_path / "runs")
+    run_id = archive.archive_run(toy_results, repo_file("jesdra.mod"), repo_file("toy.dat"), {"objective": 1.0},
+                                 archive_dir=archive_dir)
+    visualize = load_visualize(monkeypatch, "--run-id", run_id, "--archive-dir", archive_dir)
+    direct = visualize.Dataset(repo_file("toy_info.json"), toy_results)
+    assert (visualize.dataset.frames.counts == direct.frames.counts).all()
+    assert visualize.update_map(1, 0, visualize.dataset.version)[2] == 1
+
+    client = visualize.app.server.test_client()
+    assert client.post("/load", json={"run_id": run_id}).status_code == 200
+    assert client.post("/load", json={"run_id": "unknown"}).status_code == 400
@@ -0,0 +1,62 @@
+import itertools
+import os
+import numpy as np
+import pytest
+import dat_io
+import simulate
+import warm_start
+from conftest import repo_file
+
+
+@pytest.fixture(scope="module")
+def toy():
+    data = dat_io.load_dat(repo_file("toy.dat"), use_cache=False)
+    return data, simulate.CellTransmissionModel(data)
+
+
+def test_greedy_decisions(toy):
+    _, model = toy
+    e, objective = warm_start.greedy_decisions(model)
+    result = model.run(e)
+    assert objective == pytest.approx(result["objective"][0])
+    assert result["stranded"].tolist() == [0]
+    # Evacuating one more source does not help any more
+    for k in np.flatnonzero(e == 0).tolist():
+        more = e.copy()
+        more[k] = 1
+        result = model.run(more)
+        assert result["stranded"][0] > 0 or result["objective"][0] >= objective
+    # On toy.dat the greedy plan is the best of all plans that strand nobody
+    plans = np.array(list(itertools.product([0, 1], repeat=len(model.sources))))
+    results = model.run(plans)
+    assert objective == pytest.approx(results["objective"][results["stranded"] == 0].min())
+
+
+def test_start_file(toy, tmp_path):
+    data, model = toy
+    start_file = str(tmp_path / "start.dat")
+    objective = warm_start.write_start(repo_file("jesdra.mod"), repo_file("toy.dat"), start_file)
+    with open(start_file) as f:
+        start = dat_io.parse_dat(f.read())
+    with open(warm_start.start_model) as f:
+        assert set(start) == dat_io.declared_data(f.read())
+
+    assert start["modelFile"] == os.path.abspath(repo_file("jesdra.mod"))
+    assert start["dataFile"] == os.path.abspath(repo_file("toy.dat"))
+    for name in ("I", "S_o", "T", "activeArcs"):
+        assert start[name].tolist() == data[name].tolist()
+    assert (start["fixE"], start["timeLimit"]) == (0, 0)
+
+    e, greedy_objective = warm_start.greedy_decisions(model)
+    assert objective == pytest.approx(greedy_objective)
+    assert start["eStart"].tolist() == e.tolist()
+    x, y = start["xStart"], start["yStart"]
+    assert x.shape == (len(data["I"]), len(data["T"])) and y.shape == (len(data["activeArcs"]), len(data["T"]))
+    assert x.dtype == np.int64 and y.dtype == np.int64 and (y >= 0).all()
+    # Expression 2: the vehicles in a cell change by the flows of the period before
+    position = {cell: k for k, cell in enumerate(data["I"].tolist())}
+    change = np.zeros_like(x)
+    for (i, j), flow in zip(data["activeArcs"].tolist(), y):
+        change[position[i], 1:] -= flow[:-1]
+        change[position[j], 1:] += flow[:-1]
+    assert (x[:, 1:] == x[:, :-1] + change[:, 1:]).all()
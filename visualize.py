@@ -1,35 +1,35 @@
 import argparse
 import json
 import math
-import csv
-from dash import Dash, html, dcc
+from itertools import count
+from dash import Dash, html, dcc, Patch, no_update
 import dash_leaflet as dl
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 from threading import Timer
 from flask import request
+import archive
+import calculate_risk
+import dat_io
+import instrument
+import playback
 
 
 # Argument parsing
 parser = argparse.ArgumentParser(description="Run visualization with specified JSON file.")
 parser.add_argument("json_file", help="Path to the JSON file containing coordinates and settings.")
+parser.add_argument("--results-dir", default=".",
+                    help="Directory with the solver output (results.json, or evac.csv and vehicles.csv).")
+parser.add_argument("--run-id", help="Show this run of the run archive instead of --results-dir.")
+parser.add_argument("--archive-dir", default=archive.default_archive_dir)
+parser.add_argument("--geojson", action="store_true",
+                    help="Draw all cells as a single GeoJSON layer styled in the browser (for large networks).")
+parser.add_argument("--dat", help="With --geojson, also draw the arcs in A of this .dat file.")
+parser.add_argument("--port", type=int, default=8050)
 args = parser.parse_args()
 
-# Load data
-with open(args.json_file, 'r') as f:
-    data = json.load(f)
 
-cells = data['cells']
-disaster = data['disaster']
-settings = data['setting']
-
-unit_length = settings['unit_length_in_meters']
-time_step_length = settings['time_step_length_in_secs']
-
-# Geographic center for cell 5
-center_lat = settings['geo_center']['lat']
-center_lon = settings['geo_center']['lon']
-
-def convert_to_geographic(cartesian_coords, unit_length):
+def convert_to_geographic(cartesian_coords, unit_length, center):
+    center_lat, center_lon = center
     x_meters = cartesian_coords[0] * unit_length
     y_meters = cartesian_coords[1] * unit_length
     earth_radius = 6378137.0
@@ -42,54 +42,138 @@ def convert_to_geographic(cartesian_coords, unit_length):
     return latitude, longitude
 
 
-geo_cells = [{
-    'cell_number': cell['cell_number'],
-    'geo_coords': convert_to_geographic((cell['x_coord'], cell['y_coord']), unit_length),
-    'type': cell['type']  # Use the new 'type' field
-} for cell in cells]
-
-disaster_geo_coords = convert_to_geographic((disaster['x_coord'], disaster['y_coord']), unit_length)
-
-# Read vehicle counts
-vehicle_counts = []
-with open('vehicles.csv', 'r') as vehicles_file:
-    reader = csv.reader(vehicles_file)
-    for row in reader:
-        vehicle_counts.append([int(value) for value in row])
-
-evacuation_orders = {}
-with open('evac.csv', 'r') as evac_file:
-    reader = csv.reader(evac_file)
-    for row in reader:
-        cell_number = int(row[0])
-        evacuation_orders[cell_number] = int(row[1])  # 1: evacuation order, 0: no order
-
-
-# Helper: Determine color based on vehicle count
-# Adjust get_color to consider evacuation status
-def get_color(vehicle_count, max_count, evacuated):
-    if not evacuated:
-        return "rgb(0,0,0)"  # Black for no evacuation order
-    if max_count == 0:
-        return "rgb(0,0,255)"  # Default to blue if max count is zero
-    normalized = vehicle_count / max_count
-    r = int(255 * normalized)  # Red increases with count
-    g = int(255 * (1 - normalized) * normalized * 4)  # Creates purple-orange transition
-    b = int(255 * (1 - normalized))  # Blue decreases with count
-    return f"rgb({r},{g},{b})"
+dataset_versions = count(1)
 
-# Dash app
-app = Dash(__name__)
 
-app.layout = html.Div([
-    dcc.Interval(id="interval", interval=time_step_length * 1000, n_intervals=0),
-    dl.Map([
-    dl.TileLayer(),
-    dl.LayerGroup(id="circles"),  # Placeholder for circles
-    dl.LayerGroup(id="disaster")  # Placeholder for disaster
-], center=[center_lat, center_lon], zoom=17, style={'height': '100vh'}),
+# One result set on the map: the cells and disaster of a JSON file and the solver output
+# of a results directory or an archived run. The server shows one dataset at a time and /load replaces it.
+class Dataset:
+    @instrument.span("visualize.dataset")
+    def __init__(self, json_file, results_dir=".", dat_file=None, run_id=None,
+                 archive_dir=archive.default_archive_dir):
+        with open(json_file, 'r') as f:
+            data = json.load(f)
+        self.disaster = data['disaster']
+        settings = data['setting']
+        unit_length = settings['unit_length_in_meters']
+        self.time_step_length = settings['time_step_length_in_secs']
+        self.center = (settings['geo_center']['lat'], settings['geo_center']['lon'])
+        self.version = next(dataset_versions)
+
+        self.geo_cells = [{
+            'cell_number': cell['cell_number'],
+            'geo_coords': convert_to_geographic((cell['x_coord'], cell['y_coord']), unit_length, self.center),
+            'type': cell['type']  # Use the new 'type' field
+        } for cell in data['cells']]
 
-html.Div(
+        # Colours and counts of every cell at every time step, computed once.
+        # Only an explicit "no evacuation order" is drawn black, cells without an entry get the heatmap.
+        cell_numbers = [cell["cell_number"] for cell in self.geo_cells]
+        if run_id:
+            vehicle_counts, evacuation_orders = playback.result_counts(archive.load_run(run_id, archive_dir), cell_numbers)
+        else:
+            vehicle_counts, evacuation_orders = playback.read_results(results_dir, cell_numbers)
+        self.evacuated = [evacuation_orders.get(cell["cell_number"], None) != 0 for cell in self.geo_cells]
+        self.frames = playback.Playback(vehicle_counts, self.evacuated)
+
+        # Disaster position at each time step, following its direction, heading or trajectory
+        positions = calculate_risk.disaster_positions(self.disaster, settings, self.frames.n_time_steps) / unit_length
+        self.disaster_centers = [convert_to_geographic(position, unit_length, self.center)
+                                 for position in positions.tolist()]
+        self.arcs = dat_io.load_dat(dat_file)["A"] if dat_file else None
+
+    def tooltip_text(self, i, n):
+        cell = self.geo_cells[i]
+        label = "Road" if cell["type"] == "road" else cell["type"].capitalize()
+        return f"{label} Cell {cell['cell_number']} Vehicles: {self.frames.counts[i, n]}"
+
+    # Cell shapes for time step n. The ids do not depend on n, so the shapes are only sent once
+    # and the playback patches their colour and tooltip.
+    def cell_elements(self, n):
+        cell_size = 0.0002  # Smaller size for rectangles
+        elements = []
+        for i, cell in enumerate(self.geo_cells):
+            if cell["type"] == "road":
+                elements.append(
+                    dl.Rectangle(
+                        id=f"road-{cell['cell_number']}",
+                        bounds=[
+                            [cell['geo_coords'][0] - cell_size, cell['geo_coords'][1] - cell_size],
+                            [cell['geo_coords'][0] + cell_size, cell['geo_coords'][1] + cell_size]
+                        ],
+                        color=self.frames.colors[i, n],
+                        fill=True,
+                        fillOpacity=0.7,
+                        children=dl.Tooltip(self.tooltip_text(i, n))
+                    )
+                )
+            else:
+                elements.append(
+                    dl.CircleMarker(
+                        id=f"circle-{cell['cell_number']}",
+                        center=cell['geo_coords'],
+                        radius=cell_size * 1 * 10**5,
+                        color=self.frames.colors[i, n],
+                        fill=True,
+                        fillOpacity=0.7,
+                        children=dl.Tooltip(self.tooltip_text(i, n))
+                    )
+                )
+        return elements
+
+    def disaster_elements(self, n):
+        return [dl.Circle(
+            center=self.disaster_centers[n],
+            radius=self.disaster['radius_in_meters'],  # Radius in meters
+            color='red', fill=False, weight=2
+        )]
+
+    # All cells (and the arcs, if given) as one GeoJSON FeatureCollection. Road cells are squares,
+    # the other cells are points drawn as circle markers by the browser. The browser colours the
+    # cells from the counts in the layer's hideout (see assets/geojson_playback.js).
+    def feature_collection(self):
+        cell_size = 0.0002
+        features = []
+        for i, cell in enumerate(self.geo_cells):
+            lat, lon = cell['geo_coords']
+            if cell["type"] == "road":
+                geometry = {"type": "Polygon", "coordinates": [[
+                    [lon - cell_size, lat - cell_size], [lon + cell_size, lat - cell_size],
+                    [lon + cell_size, lat + cell_size], [lon - cell_size, lat + cell_size],
+                    [lon - cell_size, lat - cell_size]]]}
+            else:
+                geometry = {"type": "Point", "coordinates": [lon, lat]}
+            label = "Road" if cell["type"] == "road" else cell["type"].capitalize()
+            features.append({"type": "Feature", "geometry": geometry, "properties": {
+                "kind": "cell", "index": i, "evacuated": bool(self.evacuated[i]),
+                "label": f"{label} Cell {cell['cell_number']}", "radius": cell_size * 1 * 10**5}})
+
+        if self.arcs is not None:
+            position = {cell["cell_number"]: cell["geo_coords"] for cell in self.geo_cells}
+            for start, end in self.arcs.tolist():
+                if start in position and end in position:
+                    features.append({"type": "Feature", "properties": {"kind": "arc"}, "geometry": {
+                        "type": "LineString",
+                        "coordinates": [position[start][::-1], position[end][::-1]]}})
+        return {"type": "FeatureCollection", "features": features}
+
+    # The only data sent to the browser for each time step in GeoJSON mode
+    def frame_hideout(self, n):
+        return {"counts": self.frames.counts[:, n].tolist(), "max": int(self.frames.max_counts[n])}
+
+    def cell_layers(self):
+        if args.geojson:
+            return [dl.GeoJSON(
+                id="cells", data=self.feature_collection(), hideout=self.frame_hideout(0),
+                style={"variable": "jesdraPlayback.style"},
+                pointToLayer={"variable": "jesdraPlayback.pointToLayer"},
+                onEachFeature={"variable": "jesdraPlayback.onEachFeature"})]
+        return self.cell_elements(0)
+
+
+dataset = Dataset(args.json_file, args.results_dir, args.dat, args.run_id, args.archive_dir)
+
+legend = html.Div(
     id="legend",
     style={
         "position": "absolute",
@@ -169,7 +253,29 @@ html.Div(
     ]
 )
 
-])
+
+# The layout is built on every page load, so a reload shows the dataset loaded last
+def serve_layout():
+    return html.Div([
+        # Stops after the last time step, so the final frame stays on the map
+        dcc.Interval(id="interval", interval=dataset.time_step_length * 1000, n_intervals=0,
+                     max_intervals=dataset.frames.n_time_steps - 1),
+        dcc.Store(id="rendered-frame", data=0),  # Time step currently shown in the browser
+        dcc.Store(id="dataset-version", data=dataset.version),
+        dl.Map([
+        dl.TileLayer(),
+        dl.LayerGroup(id="circles", children=dataset.cell_layers()),
+        dl.LayerGroup(id="disaster", children=dataset.disaster_elements(0))
+    ], center=list(dataset.center), zoom=17, style={'height': '100vh'}),
+
+    legend
+
+    ])
+
+
+# Dash app
+app = Dash(__name__)
+app.layout = serve_layout
 
 @app.server.route('/shutdown', methods=['POST'])
 def shutdown():
@@ -179,84 +285,64 @@ def shutdown():
         shutdown_func()
     return 'Server shutting down...', 200
 
-@app.callback(
-    [Output("circles", "children"), Output("disaster", "children")],
-    [Input("interval", "n_intervals")]
-)
-def update_map(n):
+@app.server.route('/load', methods=['POST'])
+def load():
+    """Switch to another result set, given as JSON with json_file, results_dir (or run_id) and optionally dat_file."""
+    global dataset
+    options = request.get_json(force=True)
     try:
-        if n >= len(vehicle_counts[0]):
-            print("No updates: All time steps processed.")
-            return [], []  # No updates after max time steps
-        
-        # Debug: Check callback trigger
-        print(f"Callback triggered for time step {n}")
-
-        # Calculate max vehicle count for this time step
-        max_count = max(vehicle_counts[i][n] for i in range(len(vehicle_counts)))
-        
-        # Debug: Print max count and vehicle counts
-        print(f"Time Step {n}: Max Vehicle Count = {max_count}")
-        print(f"Vehicle Counts: {[vehicle_counts[i][n] for i in range(len(vehicle_counts))]}")
-
-        # Create Circles and Rectangles for cells
-        cell_size = 0.0002  # Smaller size for rectangles
-        elements = []
-        for i, cell in enumerate(geo_cells):
-            # Check evacuation status; default is not restricted
-            evacuation_status = evacuation_orders.get(cell["cell_number"], None)
-            if evacuation_status == 0:  # Explicit evacuation restriction
-                color = "rgb(0,0,0)"  # Black for restricted cells
-            else:
-                color = get_color(vehicle_counts[i][n], max_count, True)  # Heatmap for all other cases
-            
-            if cell["type"] == "road":
-                elements.append(
-                    dl.Rectangle(
-                        id=f"road-{cell['cell_number']}-{n}",  # Unique ID for road rectangles
-                        bounds=[
-                            [cell['geo_coords'][0] - cell_size, cell['geo_coords'][1] - cell_size],
-                            [cell['geo_coords'][0] + cell_size, cell['geo_coords'][1] + cell_size]
-                        ],
-                        color=color,
-                        fill=True,
-                        fillOpacity=0.7,
-                        children=dl.Tooltip(f"Road Cell {cell['cell_number']} Vehicles: {vehicle_counts[i][n]}")
-                    )
-                )
-            else:
-                elements.append(
-                    dl.CircleMarker(
-                        id=f"circle-{cell['cell_number']}-{n}",  # Unique ID for non-road cells
-                        center=cell['geo_coords'],
-                        radius=cell_size * 1 * 10**5,
-                        color=color,
-                        fill=True,
-                        fillOpacity=0.7,
-                        children=dl.Tooltip(f"{cell['type'].capitalize()} Cell {cell['cell_number']} Vehicles: {vehicle_counts[i][n]}")
-                    )
-                )
-        
-        # Disaster position (eastward movement along +x direction)
-        distance_traveled = disaster['velocity_in_kmh'] * 1000 / 3600 * n * time_step_length
-        disaster_lon = disaster_geo_coords[1] + (distance_traveled / (6378137.0 * math.cos(math.radians(disaster_geo_coords[0])))) * (180 / math.pi)
-        print(f"Disaster Longitude: {disaster_lon}, Radius in Meters: {disaster['radius_in_meters']}")  # Debug
-        
-        disaster_circle = dl.Circle(
-            center=(disaster_geo_coords[0], disaster_lon),
-            radius=disaster['radius_in_meters'],  # Radius in meters
-            color='red', fill=False, weight=2
-        )
-        
-        return elements, [disaster_circle]
-
+        dataset = Dataset(options.get("json_file", args.json_file), options.get("results_dir", "."),
+                          options.get("dat_file"), options.get("run_id"), args.archive_dir)
     except Exception as e:
-        print("Error in callback:", e)
-        return [], []
+        return f'Could not load the results: {e}', 400
+    return f'Loaded dataset {dataset.version}', 200
+
+def disaster_patch(n):
+    disaster_circle = Patch()
+    disaster_circle[0]["props"]["center"] = dataset.disaster_centers[n]
+    return disaster_circle
+
+
+# Each tick only sends the colour and tooltip of the cells that changed since the
+# rendered frame, and the new disaster center. Pages that still show a replaced
+# dataset are not updated until they are reloaded.
+def update_map(n, rendered, version):
+    frames = dataset.frames
+    n = min(n, frames.n_time_steps - 1)
+    if n == rendered or version != dataset.version:
+        return no_update, no_update, no_update
+
+    elements = Patch()
+    for i in frames.changed_cells(rendered, n).tolist():
+        elements[i]["props"]["color"] = frames.colors[i, n]
+        elements[i]["props"]["children"]["props"]["children"] = dataset.tooltip_text(i, n)
+    return elements, disaster_patch(n), n
 
-if __name__ == "__main__":
-    
-    app.run_server(debug=False)
 
+# In GeoJSON mode each tick only sends the vehicle counts of the time step
+def update_geojson(n, rendered, version):
+    n = min(n, dataset.frames.n_time_steps - 1)
+    if n == rendered or version != dataset.version:
+        return no_update, no_update, no_update
+    return dataset.frame_hideout(n), disaster_patch(n), n
 
 
+# Latency of each playback tick on the server, in the trace
+def traced_frame(update):
+    def callback(n, rendered, version):
+        with instrument.span("visualize.frame", frame=n, mode=update.__name__):
+            return update(n, rendered, version)
+    return callback
+
+
+app.callback(
+    [Output("cells", "hideout") if args.geojson else Output("circles", "children"),
+     Output("disaster", "children"), Output("rendered-frame", "data")],
+    [Input("interval", "n_intervals")],
+    [State("rendered-frame", "data"), State("dataset-version", "data")],
+    prevent_initial_call=True
+)(traced_frame(update_geojson if args.geojson else update_map))
+
+if __name__ == "__main__":
+    
+    app.run_server(debug=False, port=args.port)
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import numpy as np
+import dat_io
+import simulate
+
+# MIP start for jesdra.mod. The sources to evacuate are chosen greedily with the simulator:
+# starting from sheltering everyone in place, the source whose evacuation lowers the
+# simulated objective the most is added until no addition helps. Only plans that bring every
+# vehicle to a sink by the last period are kept, so the simulated x and y satisfy
+# Expressions 2-7 and 13-16 and lie within the validity windows of presolve.py.
+#
+# The start is written as a .dat file for jesdra_start.mod, which generates the model from
+# modelFile and dataFile, passes eStart, xStart and yStart to CPLEX and solves it:
+#   oplrun jesdra_start.mod start.dat
+
+start_model = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jesdra_start.mod")
+
+
+def greedy_decisions(model):
+    e = np.zeros(len(model.sources), dtype=np.int64)
+    best = model.run(e)["objective"][0]
+    while not e.all():
+        remaining = np.flatnonzero(e == 0)
+        candidates = np.repeat(e[None, :], len(remaining), axis=0)
+        candidates[np.arange(len(remaining)), remaining] = 1
+        result = model.run(candidates)
+        objective = np.where(result["stranded"] == 0, result["objective"], np.inf)
+        k = int(np.argmin(objective))
+        if objective[k] >= best:
+            break
+        e, best = candidates[k], objective[k]
+    return e, float(best)
+
+
+# Simulated start values for e, x[I][T] and y[activeArcs][T]
+def start_values(data, policy="priority"):
+    model = simulate.CellTransmissionModel(data, policy)
+    e, objective = greedy_decisions(model)
+    return plan_values(data, model, e, objective)
+
+
+# Start values of the simulated plan for the decisions e
+def plan_values(data, model, e, objective):
+    result = model.run(e, keep_history=True)
+    flows = result["y"][0]
+
+    active_arcs = np.asarray(data["activeArcs"]).reshape(-1, 2)
+    row = {(i, j): k for k, (i, j) in enumerate(active_arcs.tolist())}
+    y = np.zeros((len(active_arcs), len(model.periods)), dtype=np.int64)
+    for k, (i, j) in enumerate(model.arcs.tolist()):
+        if (i, j) in row:
+            y[row[(i, j)], :flows.shape[1]] = flows[k]
+        elif flows[k].any():
+            raise ValueError(f"The simulated plan uses arc <{i},{j}>, which is not in activeArcs")
+    return {"e": e, "x": result["x"][0], "y": y, "objective": objective}
+
+
+# With fix_e, jesdra_start.mod keeps e at its start value. time_limit is in seconds.
+def start_blocks(data, values, mod_file, dat_file, fix_e=False, time_limit=None):
+    return {
+        # json.dumps gives an OPL string literal with escaped backslashes
+        "modelFile": json.dumps(os.path.abspath(mod_file)),
+        "dataFile": json.dumps(os.path.abspath(dat_file)),
+        "I": dat_io.format_set(data["I"]),
+        "S_o": dat_io.format_set(data["S_o"]),
+        "T": dat_io.format_set(data["T"]),
+        "activeArcs": dat_io.format_set(data["activeArcs"]),
+        "eStart": dat_io.format_array(values["e"]),
+        "xStart": dat_io.format_array(values["x"]),
+        "yStart": dat_io.format_array(values["y"]),
+        "fixE": "1" if fix_e else "0",
+        "timeLimit": str(time_limit or 0),
+    }
+
+
+# Write the start .dat for jesdra_start.mod and return the simulated objective of the start
+def write_start(mod_file, dat_file, start_file, policy="priority"):
+    data = dat_io.load_dat(dat_file)
+    values = start_values(data, policy)
+    blocks = start_blocks(data, values, mod_file, dat_file)
+    with open(start_file, "w") as f:
+        f.write("\n".join(f"{name} = {literal};\n" for name, literal in blocks.items()))
+    return values["objective"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a MIP start for jesdra.mod built with the simulator.")
+    parser.add_argument("mod_file")
+    parser.add_argument("dat_file")
+    parser.add_argument("--output", default="start.dat", help="Start .dat file for jesdra_start.mod.")
+    parser.add_argument("--policy", choices=["priority", "greedy"], default="priority")
+    args = parser.parse_args()
+
+    objective = write_start(args.mod_file, args.dat_file, args.output, args.policy)
+    print(f"Start with simulated objective {objective:.4f} written to {args.output}")
+    print(f"Solve it with: oplrun {os.path.relpath(start_model)} {args.output}")